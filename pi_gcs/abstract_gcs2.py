@@ -18,7 +18,22 @@ class AbstractGeneralCommandSet(with_metaclass(abc.ABCMeta, object)):
 
 
     @abc.abstractmethod
-    def gcsCommand(self, commandAsString):
+    def prefetchStaticProperties(self):
+        assert False
+
+
+    @abc.abstractmethod
+    def gcsCommand(self, commandAsString, timeoutInSec=None):
+        assert False
+
+
+    @abc.abstractmethod
+    def commandBatch(self):
+        assert False
+
+
+    @abc.abstractmethod
+    def executeCommandBatch(self, batch):
         assert False
 
 
@@ -163,7 +178,31 @@ class AbstractGeneralCommandSet(with_metaclass(abc.ABCMeta, object)):
 
 
     @abc.abstractmethod
-    def getRecordedDataValues(self, howManyPoints, startFromPoint=1):
+    def getNumberOfRecordedPoints(self, tableIds=None):
+        assert False
+
+
+    @abc.abstractmethod
+    def getRecordedDataValues(self, howManyPoints, startFromPoint=1,
+                              out=None, tableIds=None):
+        assert False
+
+
+    @abc.abstractmethod
+    def getRecordedDataValuesByTable(self, howManyPoints, tableIds=None,
+                                     startFromPoint=1):
+        assert False
+
+
+    @abc.abstractmethod
+    def getRecordedDataValuesInChunks(self, howManyPoints, chunkSizeInPoints,
+                                      startFromPoint=1, tableIds=None):
+        assert False
+
+
+    @abc.abstractmethod
+    def getRecordedDataValuesAsync(self, howManyPoints, startFromPoint=1,
+                                   tableIds=None, out=None):
         assert False
 
 
@@ -187,6 +226,11 @@ class AbstractGeneralCommandSet(with_metaclass(abc.ABCMeta, object)):
         assert False
 
 
+    @abc.abstractmethod
+    def getMaximumNumberOfWavePoints(self, waveTableIdsArray):
+        assert False
+
+
     @abc.abstractmethod
     def clearWaveTableData(self, waveTableIdsArray):
         assert False
@@ -226,6 +270,15 @@ class AbstractGeneralCommandSet(with_metaclass(abc.ABCMeta, object)):
         assert False
 
 
+    @abc.abstractmethod
+    def uploadUserDefinedWaveform(self,
+                                  waveTableId,
+                                  wavePointsArray,
+                                  chunkSizeInPoints=None,
+                                  diff=False):
+        assert False
+
+
     @abc.abstractmethod
     def setRecordTableRate(self, recordTableRateInServoLoopCycles=1):
         assert False
@@ -244,7 +297,8 @@ class AbstractGeneralCommandSet(with_metaclass(abc.ABCMeta, object)):
 
     @abc.abstractmethod
     def setWaveGeneratorTableRate(self,
-                                  waveGeneratorTableRateInServoLoopCycles):
+                                  waveGeneratorTableRateInServoLoopCycles,
+                                  interpolationType=None):
         assert False
 
 
@@ -254,7 +308,12 @@ class AbstractGeneralCommandSet(with_metaclass(abc.ABCMeta, object)):
 
 
     @abc.abstractmethod
-    def getOverflowState(self):
+    def getWaveGeneratorInterpolation(self):
+        assert False
+
+
+    @abc.abstractmethod
+    def getOverflowState(self, axesString):
         assert False
 
 
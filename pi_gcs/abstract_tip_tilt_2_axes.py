@@ -52,7 +52,7 @@ class AbstractTipTilt2Axis(with_metaclass(abc.ABCMeta, object)):
         assert False
 
     @abc.abstractmethod
-    def getRecordedData(self, howManyPoints, dataRecorderCfg=None):
+    def getRecordedData(self, howManyPoints, dataRecorderCfg=None, out=None):
         assert False
 
     @abc.abstractmethod
@@ -63,6 +63,10 @@ class AbstractTipTilt2Axis(with_metaclass(abc.ABCMeta, object)):
     def status(self):
         assert False
 
+    @abc.abstractmethod
+    def statusSnapshot(self, fields=None):
+        assert False
+
     @abc.abstractmethod
     def startFreeformModulation(self, axisATrajectory, axisBTrajectory):
         assert False
@@ -0,0 +1,109 @@
+import threading
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+class CallbackSink(object):
+    '''
+    Forward every block to callback(firstSampleIndex, block)
+    '''
+
+    def __init__(self, callback):
+        self._callback= callback
+
+
+    def write(self, firstSampleIndex, block):
+        self._callback(firstSampleIndex, block)
+
+
+    def close(self):
+        pass
+
+
+class FileSink(object):
+    '''
+    Append blocks to a raw float64 file, one record of nTables values
+    per sample, so that it can be reopened with
+    np.memmap(filename, dtype=np.float64).reshape(-1, nTables)
+    '''
+
+    def __init__(self, fileNameOrObject):
+        if hasattr(fileNameOrObject, 'write'):
+            self._file= fileNameOrObject
+            self._ownFile= False
+        else:
+            self._file= open(fileNameOrObject, 'ab')
+            self._ownFile= True
+        self._samplesWritten= 0
+
+
+    def write(self, firstSampleIndex, block):
+        assert firstSampleIndex == self._samplesWritten, \
+            "stream is not contiguous: expected sample %d, got %d" % (
+                self._samplesWritten, firstSampleIndex)
+        self._file.write(np.ascontiguousarray(block.T,
+                                              dtype=np.float64).tobytes())
+        self._samplesWritten+= block.shape[1]
+
+
+    def samplesWritten(self):
+        return self._samplesWritten
+
+
+    def close(self):
+        self._file.flush()
+        if self._ownFile:
+            self._file.close()
+
+
+class RingBufferSink(object):
+    '''
+    Keep the last capacity samples of nTables channels in memory
+
+    Every sample is stored twice, capacity apart, so that any window
+    of the most recent samples is a contiguous view of the buffer.
+    '''
+
+    def __init__(self, nTables, capacity):
+        self._capacity= capacity
+        self._buf= np.full((nTables, 2 * capacity), np.nan)
+        self._writeIndex= 0
+        self._samplesWritten= 0
+        self._lock= threading.Lock()
+
+
+    def write(self, firstSampleIndex, block):
+        nTotal= block.shape[1]
+        block= block[:, -self._capacity:]
+        n= block.shape[1]
+        with self._lock:
+            idx= (self._writeIndex + np.arange(n)) % self._capacity
+            self._buf[:, idx]= block
+            self._buf[:, idx + self._capacity]= block
+            self._writeIndex= (self._writeIndex + n) % self._capacity
+            self._samplesWritten= firstSampleIndex + nTotal
+
+
+    def samplesWritten(self):
+        return self._samplesWritten
+
+
+    def latest(self, nSamples=None):
+        '''
+        View of the most recent nSamples, oldest first
+
+        The view is overwritten by later writes: copy it to keep it
+        '''
+        with self._lock:
+            available= min(self._samplesWritten, self._capacity)
+            if nSamples is None:
+                nSamples= available
+            nSamples= min(nSamples, available)
+            end= self._writeIndex + self._capacity
+            return self._buf[:, end - nSamples: end]
+
+
+    def close(self):
+        pass
@@ -0,0 +1,336 @@
+from collections import namedtuple
+import numpy as np
+from pi_gcs.gcs_answer_parser import splitAnswers, parseValues,\
+    parseKeyValueAnswer, parseText
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration
+
+
+__version__= "$Id: $"
+
+
+BatchItem= namedtuple('BatchItem', ['methodName', 'args', 'command', 'parser'])
+
+
+class CommandBatch(object):
+    '''
+    Collect GCS commands and queries to be sent in a single round trip
+
+    Methods mirror the ones of the controller (setTargetPosition,
+    getPosition, ...). Setters are queued, queries are queued and return
+    the index of their result in the list returned by execute().
+    The controller sends the whole batch as one newline-joined GCS
+    string followed by a single ERR? check.
+    '''
+
+    def __init__(self, controller=None):
+        self._ctrl= controller
+        self._items= []
+        self._nQueries= 0
+
+
+    def _axes(self, axesString):
+        return axesString.split()
+
+
+    def _formatPairs(self, keys, values, fmt):
+        values= np.atleast_1d(values)
+        assert len(keys) == len(values), \
+            "%d %d" % (len(keys), len(values))
+        return ' '.join('%s %s' % (k, fmt % v) for k, v in zip(keys,
+                                                                 values))
+
+
+    def _addCommand(self, methodName, args, command):
+        self._items.append(BatchItem(methodName, args, command, None))
+
+
+    def _addQuery(self, methodName, args, command, parser):
+        self._items.append(BatchItem(methodName, args, command, parser))
+        self._nQueries+= 1
+        return self._nQueries - 1
+
+
+    def addItem(self, item):
+        '''
+        Queue a BatchItem, e.g. one of the items() of another batch.
+        Returns the index of its result if it is a query
+        '''
+        self._items.append(item)
+        if item.parser is None:
+            return None
+        self._nQueries+= 1
+        return self._nQueries - 1
+
+
+    def items(self):
+        return list(self._items)
+
+
+    def numberOfQueries(self):
+        return self._nQueries
+
+
+    def commandString(self):
+        return '\n'.join(item.command for item in self._items)
+
+
+    def execute(self):
+        assert self._ctrl is not None, "batch not bound to a controller"
+        return self._ctrl.executeCommandBatch(self)
+
+
+    def parseAnswer(self, answer):
+        answers= splitAnswers(answer)
+        assert len(answers) == self._nQueries, \
+            "expected %d answers, got %d" % (self._nQueries, len(answers))
+        parsers= [item.parser for item in self._items
+                  if item.parser is not None]
+        return [parser(ans) for parser, ans in zip(parsers, answers)]
+
+
+    @staticmethod
+    def _parseFloats(answer):
+        return parseValues(answer, float)
+
+
+    @staticmethod
+    def _parseInts(answer):
+        return parseValues(answer, int)
+
+
+    @staticmethod
+    def _parseBools(answer):
+        return parseValues(answer, int).astype(bool)
+
+
+    @staticmethod
+    def _parseInt(answer):
+        return int(answer.strip())
+
+
+    @staticmethod
+    def _parseLines(answer):
+        return [line.strip() for line in answer.splitlines() if line.strip()]
+
+
+    @staticmethod
+    def _parseTableRates(answer):
+        # WTR? answers 'id=rate interpolation'
+        _, values= parseKeyValueAnswer(answer, str)
+        return np.array([int(v.split()[0]) for v in values])
+
+
+    @staticmethod
+    def _parseInterpolations(answer):
+        _, values= parseKeyValueAnswer(answer, str)
+        return np.array([int(v.split()[1]) for v in values])
+
+
+    @staticmethod
+    def _parseDataRecorderConfiguration(answer):
+        # DRC? answers 'tableId=source option'
+        tableIds, values= parseKeyValueAnswer(answer, str)
+        tables= []
+        for tableId, value in zip(tableIds, values):
+            source, option= value.split()
+            tables.append((int(tableId), source, int(option)))
+        return DataRecorderConfiguration(tables)
+
+
+    def _floatSetterAxes(self, methodName, gcsCmd, axesString, value):
+        self._addCommand(
+            methodName, (axesString, value),
+            '%s %s' % (gcsCmd, self._formatPairs(
+                self._axes(axesString), value, '%.9f')))
+
+
+    def _floatSetterChannels(self, methodName, gcsCmd, channels, value):
+        channels= np.atleast_1d(channels)
+        self._addCommand(
+            methodName, (channels, value),
+            '%s %s' % (gcsCmd, self._formatPairs(channels, value, '%.9f')))
+
+
+    def _intSetter(self, methodName, gcsCmd, keys, value, args):
+        self._addCommand(
+            methodName, args,
+            '%s %s' % (gcsCmd, self._formatPairs(
+                keys, np.atleast_1d(value).astype(int), '%d')))
+
+
+    def _queryAxes(self, methodName, gcsCmd, axesString, parser):
+        return self._addQuery(methodName, (axesString,),
+                              '%s %s' % (gcsCmd, axesString), parser)
+
+
+    def _queryChannels(self, methodName, gcsCmd, channels, parser):
+        channels= np.atleast_1d(channels)
+        return self._addQuery(
+            methodName, (channels,),
+            '%s %s' % (gcsCmd, ' '.join('%d' % c for c in channels)),
+            parser)
+
+
+    def getVersion(self):
+        return self._addQuery('getVersion', (), 'VER?', parseText)
+
+
+    def getAxesIdentifiers(self):
+        return self._addQuery('getAxesIdentifiers', (), 'SAI?',
+                              self._parseLines)
+
+
+    def getNumberOfInputSignalChannels(self):
+        return self._addQuery('getNumberOfInputSignalChannels', (),
+                              'TSC?', self._parseInt)
+
+
+    def getNumberOfOutputSignalChannels(self):
+        return self._addQuery('getNumberOfOutputSignalChannels', (),
+                              'TPC?', self._parseInt)
+
+
+    def getVolatileMemoryParameters(self, itemId, parameterId):
+        return self._addQuery('getVolatileMemoryParameters',
+                              (itemId, parameterId),
+                              'SPA? %s 0x%X' % (itemId, parameterId),
+                              self._parseFloats)
+
+
+    def getServoControlMode(self, axesString):
+        return self._queryAxes('getServoControlMode', 'SVO?', axesString,
+                               self._parseBools)
+
+
+    def setServoControlMode(self, axesString, controlMode):
+        self._intSetter('setServoControlMode', 'SVO',
+                        self._axes(axesString), controlMode,
+                        (axesString, controlMode))
+
+
+    def getControlMode(self, channels):
+        return self._queryChannels('getControlMode', 'ONL?', channels,
+                                   self._parseInts)
+
+
+    def setControlMode(self, channels, controlMode):
+        channels= np.atleast_1d(channels)
+        self._intSetter('setControlMode', 'ONL', channels, controlMode,
+                        (channels, controlMode))
+
+
+    def enableControlMode(self, channels):
+        channels= np.atleast_1d(channels)
+        self._intSetter('enableControlMode', 'ONL', channels,
+                        np.ones(len(channels)), (channels,))
+
+
+    def disableControlMode(self, channels):
+        channels= np.atleast_1d(channels)
+        self._intSetter('disableControlMode', 'ONL', channels,
+                        np.zeros(len(channels)), (channels,))
+
+
+    def getLowerVoltageLimit(self, channels):
+        return self._queryChannels('getLowerVoltageLimit', 'VMI?',
+                                   channels, self._parseFloats)
+
+
+    def setLowerVoltageLimit(self, channels, lowerVoltage):
+        self._floatSetterChannels('setLowerVoltageLimit', 'VMI',
+                                  channels, lowerVoltage)
+
+
+    def getUpperVoltageLimit(self, channels):
+        return self._queryChannels('getUpperVoltageLimit', 'VMA?',
+                                   channels, self._parseFloats)
+
+
+    def setUpperVoltageLimit(self, channels, upperVoltage):
+        self._floatSetterChannels('setUpperVoltageLimit', 'VMA',
+                                  channels, upperVoltage)
+
+
+    def getPosition(self, axesString):
+        return self._queryAxes('getPosition', 'POS?', axesString,
+                               self._parseFloats)
+
+
+    def getVoltages(self, channels):
+        return self._queryChannels('getVoltages', 'VOL?', channels,
+                                   self._parseFloats)
+
+
+    def getOpenLoopAxisValue(self, axesString):
+        return self._queryAxes('getOpenLoopAxisValue', 'SVA?', axesString,
+                               self._parseFloats)
+
+
+    def setOpenLoopAxisValue(self, axesString, amplitudeInVolt):
+        self._floatSetterAxes('setOpenLoopAxisValue', 'SVA',
+                              axesString, amplitudeInVolt)
+
+
+    def getTargetPosition(self, axesString):
+        return self._queryAxes('getTargetPosition', 'MOV?', axesString,
+                               self._parseFloats)
+
+
+    def setTargetPosition(self, axesString, position):
+        self._floatSetterAxes('setTargetPosition', 'MOV',
+                              axesString, position)
+
+
+    def setTargetRelativeToCurrentPosition(self, axesString, offset):
+        self._floatSetterAxes('setTargetRelativeToCurrentPosition', 'MVR',
+                              axesString, offset)
+
+
+    def getOverflowState(self, axesString):
+        return self._queryAxes('getOverflowState', 'OVF?', axesString,
+                               self._parseBools)
+
+
+    def setWaveGeneratorStartStopMode(self, startModeArray):
+        wgIds= np.arange(1, len(startModeArray) + 1)
+        self._intSetter('setWaveGeneratorStartStopMode', 'WGO', wgIds,
+                        startModeArray, (startModeArray,))
+
+
+    def setConnectionOfWaveTableToWaveGenerator(self,
+                                                waveGeneratorsArray,
+                                                waveTableIdsArray):
+        self._intSetter('setConnectionOfWaveTableToWaveGenerator', 'WSL',
+                        waveGeneratorsArray, waveTableIdsArray,
+                        (waveGeneratorsArray, waveTableIdsArray))
+
+
+    def getWaveGeneratorStartStopMode(self):
+        return self._addQuery('getWaveGeneratorStartStopMode', (), 'WGO?',
+                              self._parseInts)
+
+
+    def getConnectionOfWaveTableToWaveGenerator(self, waveGeneratorsArray):
+        return self._queryChannels('getConnectionOfWaveTableToWaveGenerator',
+                                   'WSL?', waveGeneratorsArray,
+                                   self._parseInts)
+
+
+    def getWaveGeneratorTableRate(self):
+        return self._addQuery('getWaveGeneratorTableRate', (), 'WTR?',
+                              self._parseTableRates)
+
+
+    def getWaveGeneratorInterpolation(self):
+        return self._addQuery('getWaveGeneratorInterpolation', (), 'WTR?',
+                              self._parseInterpolations)
+
+
+    def getRecordTableRate(self):
+        return self._addQuery('getRecordTableRate', (), 'RTR?',
+                              self._parseInt)
+
+
+    def getDataRecorderConfiguration(self):
+        return self._addQuery('getDataRecorderConfiguration', (), 'DRC?',
+                              self._parseDataRecorderConfiguration)
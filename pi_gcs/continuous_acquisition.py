@@ -0,0 +1,175 @@
+from collections import namedtuple
+import threading
+import time
+import numpy as np
+from pi_gcs.acquisition_sink import CallbackSink
+from pi_gcs.recorder_cursor import RecorderCursor
+
+
+__version__= "$Id: $"
+
+
+Gap= namedtuple('Gap', ['firstSampleIndex', 'missingSamples'])
+
+
+class ContinuousAcquisition(object):
+    '''
+    Gap-aware acquisition longer than the recorder buffer
+
+    The recorder is read while it is filling (see RecorderCursor) and it
+    is re-armed every time it holds recorderLengthInPoints points. The
+    segments are stitched in a single stream of samples, sample k being
+    recorded at k * timeStepInSec from the start of the acquisition.
+    The samples lost while re-arming are estimated from the host clock,
+    reported in gaps() and, if fillValue is not None, written to the
+    sink as fillValue so that the stream stays time aligned.
+
+    sink is an object with write(firstSampleIndex, block) and close()
+    methods (see acquisition_sink) or a callable with the same
+    signature as write. block is a (nTables, nSamples) array.
+
+    tableIds is a list of record table ids or a
+    DataRecorderConfiguration; ValueError is raised if it is None, as
+    returned by getDataRecorderConfiguration before any DRC.
+    '''
+
+    def __init__(self,
+                 controller,
+                 tableIds,
+                 sink,
+                 recorderLengthInPoints,
+                 timeStepInSec,
+                 pollPeriodInSec=0.01,
+                 fillValue=np.nan,
+                 rearm=None,
+                 timeModule=time):
+        if tableIds is None:
+            raise ValueError(
+                "no record tables: configure the data recorder (DRC) "
+                "before the acquisition")
+        if not hasattr(sink, 'write'):
+            sink= CallbackSink(sink)
+        self._ctrl= controller
+        self._cursor= RecorderCursor(controller, tableIds)
+        self._sink= sink
+        self._recorderLength= recorderLengthInPoints
+        self._timeStep= timeStepInSec
+        self._pollPeriod= pollPeriodInSec
+        self._fillValue= fillValue
+        if rearm is None:
+            rearm= controller.startRecordingInSyncWithWaveGenerator
+        self._rearm= rearm
+        self._time= timeModule
+
+        self._segmentStartTime= None
+        self._nextSampleIndex= 0
+        self._gaps= []
+        self._segments= 0
+        self._thread= None
+        self._stopRequested= threading.Event()
+        self._exception= None
+
+
+    def tableIds(self):
+        return self._cursor.tableIds()
+
+
+    def samplesAcquired(self):
+        return self._nextSampleIndex
+
+
+    def numberOfSegments(self):
+        return self._segments
+
+
+    def gaps(self):
+        return list(self._gaps)
+
+
+    def exception(self):
+        return self._exception
+
+
+    def _arm(self):
+        now= self._time.time()
+        if self._segmentStartTime is not None:
+            elapsed= int(round((now - self._segmentStartTime) /
+                               self._timeStep))
+            missing= elapsed - self._recorderLength
+            if missing > 0:
+                self._gaps.append(Gap(self._nextSampleIndex, missing))
+                if self._fillValue is not None:
+                    self._emit(np.full((len(self.tableIds()), missing),
+                                       self._fillValue))
+                else:
+                    self._nextSampleIndex+= missing
+        self._rearm()
+        self._cursor.reset(1)
+        self._segmentStartTime= now
+        self._segments+= 1
+
+
+    def _emit(self, block):
+        self._sink.write(self._nextSampleIndex, block)
+        self._nextSampleIndex+= block.shape[1]
+
+
+    def step(self):
+        '''
+        Read the new points, re-arming the recorder when it is full
+
+        Returns the number of samples read from the controller
+        '''
+        if self._segmentStartTime is None:
+            self._arm()
+        remaining= self._recorderLength - \
+            self._cursor.nextPoint(self.tableIds()[0]) + 1
+        firstPoint, values= self._cursor.readAligned(maxPoints=remaining)
+        if values.shape[1] > 0:
+            self._emit(values)
+        if firstPoint + values.shape[1] > self._recorderLength:
+            self._arm()
+        return values.shape[1]
+
+
+    def _run(self, durationInSec):
+        deadline= None
+        if durationInSec is not None:
+            deadline= self._time.time() + durationInSec
+        try:
+            while not self._stopRequested.is_set():
+                if deadline is not None and self._time.time() >= deadline:
+                    break
+                if self.step() == 0:
+                    self._time.sleep(self._pollPeriod)
+        except Exception as e:
+            self._exception= e
+        finally:
+            self._sink.close()
+
+
+    def run(self, durationInSec=None):
+        self._stopRequested.clear()
+        self._run(durationInSec)
+        if self._exception is not None:
+            raise self._exception
+
+
+    def start(self, durationInSec=None):
+        assert self._thread is None, "acquisition already started"
+        self._stopRequested.clear()
+        self._thread= threading.Thread(target=self._run,
+                                       args=(durationInSec,))
+        self._thread.daemon= True
+        self._thread.start()
+
+
+    def stop(self, timeoutInSec=None):
+        self._stopRequested.set()
+        self.join(timeoutInSec)
+
+
+    def join(self, timeoutInSec=None):
+        if self._thread is not None:
+            self._thread.join(timeoutInSec)
+            self._thread= None
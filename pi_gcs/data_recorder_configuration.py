@@ -1,5 +1,8 @@
 
 
+import warnings
+
+
 __version__= "$Id: $"
 
 
@@ -33,19 +36,77 @@ class RecordOption(object):
 
 
 class DataRecorderConfiguration(object):
+    '''
+    Immutable set of (recordTable, source, recordOption) entries
+
+    Instances are hashable and compare equal when they have the same
+    tables in the same order. withTable() and updatedWith() return new
+    instances, diff() the tables that must be sent to a controller
+    configured as previous.
+    '''
+
+    def __init__(self, tables=()):
+        entries= []
+        for recordTable, source, recordOption in tables:
+            assert recordOption in RecordOption.ALL_OPTIONS,\
+                'unknown record option %s. Valid values %s' % (
+                    recordOption, str(RecordOption.ALL_OPTIONS))
+            entries.append((recordTable, source, recordOption))
+        self._table= dict((t, (s, o)) for t, s, o in entries)
+        self._tables= tuple((t, ) + self._table[t] for t in
+                            self._uniqueInOrder(t for t, _, _ in entries))
+
+
+    @staticmethod
+    def _uniqueInOrder(items):
+        seen= set()
+        ret= []
+        for item in items:
+            if item not in seen:
+                seen.add(item)
+                ret.append(item)
+        return ret
+
+
+    def withTable(self, recordTable, source, recordOption):
+        return DataRecorderConfiguration(
+            self._tables + ((recordTable, source, recordOption),))
 
 
+    def setTable(self, recordTable, source, recordOption):
+        '''
+        Deprecated, use withTable(): changes the configuration in place,
+        so it must not be used on an instance kept in a set or as a dict
+        key
+        '''
+        warnings.warn(
+            "DataRecorderConfiguration.setTable is deprecated, "
+            "use withTable", DeprecationWarning, stacklevel=2)
+        updated= self.withTable(recordTable, source, recordOption)
+        self._table= updated._table
+        self._tables= updated._tables
 
-    def __init__(self):
-        self._table= {}
 
+    def updatedWith(self, other):
+        '''
+        Configuration of a controller configured as self, then as other
+        '''
+        return DataRecorderConfiguration(self._tables + other.tables())
 
-    def setTable(self, recordTable, source, recordOption):
-        assert recordOption in RecordOption.ALL_OPTIONS,\
-            'unknown record option %d. Valid values %s' % (
-                recordOption, str(RecordOption.ALL_OPTIONS))
 
-        self._table[recordTable]= (source, recordOption)
+    def diff(self, previous):
+        '''
+        Tables of self that are missing or different in previous
+        '''
+        if previous is None:
+            return DataRecorderConfiguration(self._tables)
+        return DataRecorderConfiguration(
+            (t, s, o) for t, s, o in self._tables
+            if previous._table.get(t) != (s, o))
+
+
+    def tables(self):
+        return self._tables
 
 
     def getRecordSource(self, recordTable):
@@ -57,4 +118,25 @@ class DataRecorderConfiguration(object):
 
 
     def getTableIds(self):
-        return list(self._table.keys())
+        return [t for t, _, _ in self._tables]
+
+
+    def __len__(self):
+        return len(self._tables)
+
+
+    def __eq__(self, other):
+        return isinstance(other, DataRecorderConfiguration) and \
+            self._tables == other._tables
+
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+    def __hash__(self):
+        return hash(self._tables)
+
+
+    def __repr__(self):
+        return 'DataRecorderConfiguration(%r)' % (self._tables,)
@@ -115,11 +115,14 @@ def logTime(f):
     return wrappedMethod
 
 
+_CACHED_RESULT_SUFFIX= "_cached_result"
+
+
 def cacheResult(f):
 
     @wraps(f)
     def wrapper(self, *args):
-        cacheName= f.__name__ + "_cached_result"
+        cacheName= f.__name__ + _CACHED_RESULT_SUFFIX
         if cacheName not in self.__dict__:
             self.__dict__[cacheName]= {}
 
@@ -132,6 +135,17 @@ def cacheResult(f):
     return wrapper
 
 
+def setCachedResult(obj, methodName, args, result):
+    cacheName= methodName + _CACHED_RESULT_SUFFIX
+    obj.__dict__.setdefault(cacheName, {})[tuple(args)]= result
+
+
+def clearCachedResults(obj):
+    for cacheName in [k for k in obj.__dict__
+                      if k.endswith(_CACHED_RESULT_SUFFIX)]:
+        del obj.__dict__[cacheName]
+
+
 def override(f):
     return f
 
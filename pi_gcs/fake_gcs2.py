@@ -1,6 +1,9 @@
+from collections import OrderedDict
 import numpy as np
 from pi_gcs.abstract_gcs2 import AbstractGeneralCommandSet
-from pi_gcs.gcs2 import WaveformGenerator, PIException
+from pi_gcs.gcs2 import WaveformGenerator, PIException, uploadWaveformPoints
+from pi_gcs.command_batch import CommandBatch
+from pi_gcs.recorded_data_future import RecordedDataFuture
 from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
     RecordOption
 
@@ -21,10 +24,15 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
         self._targetPosition= {}
         self._position= {}
         self._waveGeneratorStartStopMode= {}
+        self._waveTableOfWaveGenerator= {}
         self._rtr= 1
         self._wtr= np.ones(3)
+        self._wtrInterpolation= np.zeros(3, dtype=int)
         self.triggerStartRecordingInSyncWithWaveGenerator= 0
+        self.recordTablesRead= 0
+        self.recordedPoints= 0
         self._waveform= {}
+        self.maximumNumberOfWavePoints= 8192
         self._dataRecorderConfig= self._defaultDataRecorderConfiguration()
 
 
@@ -56,12 +64,29 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
         pass
 
 
+    def prefetchStaticProperties(self):
+        pass
+
+
 
-    def gcsCommand(self, commandAsString):
+    def gcsCommand(self, commandAsString, timeoutInSec=None):
         pass
 
 
 
+    def commandBatch(self):
+        return CommandBatch(self)
+
+
+    def executeCommandBatch(self, batch):
+        results= []
+        for item in batch.items():
+            res= getattr(self, item.methodName)(*item.args)
+            if item.parser is not None:
+                results.append(res)
+        return results
+
+
     def getVersion(self):
         pass
 
@@ -135,7 +160,7 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
 
 
     def getVoltages(self, channels):
-        pass
+        return np.zeros(len(channels))
 
 
     def getOpenLoopAxisValue(self, axesString):
@@ -190,28 +215,84 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
 
 
     def _defaultDataRecorderConfiguration(self):
-        dataRecorderCfg= DataRecorderConfiguration()
-        dataRecorderCfg.setTable(1, "A", RecordOption.REAL_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(2, "B", RecordOption.REAL_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(3, "A", RecordOption.POSITION_ERROR_OF_AXIS)
-        dataRecorderCfg.setTable(4, "B", RecordOption.POSITION_ERROR_OF_AXIS)
-        dataRecorderCfg.setTable(5, "A", RecordOption.TARGET_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(6, "B", RecordOption.TARGET_POSITION_OF_AXIS)
-        return dataRecorderCfg
-
-
-    def _repeatVectorTo(self, vector, nPoints):
-        return np.tile(vector, nPoints // len(vector) + 1)[0: nPoints]
-
-
-    def getRecordedDataValues(self, howManyPoints, startFromPoint=1):
-        nRecorders= self.getNumberOfRecorderTables()
-        retArray=np.zeros((nRecorders, howManyPoints))
-        retArray[0]= self._repeatVectorTo(self._waveform[1], howManyPoints)
-        retArray[1]= self._repeatVectorTo(self._waveform[2], howManyPoints)
-        retArray[4]= self._repeatVectorTo(self._waveform[1], howManyPoints)
-        retArray[5]= self._repeatVectorTo(self._waveform[2], howManyPoints)
-        return retArray
+        return DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS),
+            (3, "A", RecordOption.POSITION_ERROR_OF_AXIS),
+            (4, "B", RecordOption.POSITION_ERROR_OF_AXIS),
+            (5, "A", RecordOption.TARGET_POSITION_OF_AXIS),
+            (6, "B", RecordOption.TARGET_POSITION_OF_AXIS)])
+
+
+    def _repeatVectorTo(self, vector, nPoints, startFromPoint=1):
+        return np.take(vector,
+                       np.arange(startFromPoint - 1,
+                                 startFromPoint - 1 + nPoints),
+                       mode='wrap')
+
+
+    def _recordTable(self, tableId, howManyPoints, startFromPoint):
+        waveGeneratorOfTable= {1: 1, 2: 2, 5: 1, 6: 2}
+        if tableId not in waveGeneratorOfTable:
+            return np.zeros(howManyPoints)
+        waveGenerator= waveGeneratorOfTable[tableId]
+        waveTableId= self._waveTableOfWaveGenerator.get(waveGenerator,
+                                                        waveGenerator)
+        return self._repeatVectorTo(
+            self._waveform[waveTableId], howManyPoints, startFromPoint)
+
+
+    def _recordTableIds(self, tableIds):
+        if tableIds is None:
+            return np.arange(1, self.getNumberOfRecorderTables() + 1)
+        if isinstance(tableIds, DataRecorderConfiguration):
+            return np.array(tableIds.getTableIds(), dtype=int)
+        return np.atleast_1d(tableIds).astype(int)
+
+
+    def getNumberOfRecordedPoints(self, tableIds=None):
+        tableIds= self._recordTableIds(tableIds)
+        return np.ones(len(tableIds), dtype=int) * self.recordedPoints
+
+
+    def getRecordedDataValues(self, howManyPoints, startFromPoint=1,
+                              out=None, tableIds=None):
+        tableIds= self._recordTableIds(tableIds)
+        self.recordTablesRead+= len(tableIds)
+        if out is None:
+            out= np.zeros((len(tableIds), howManyPoints))
+        for i, tableId in enumerate(tableIds):
+            out[i]= self._recordTable(tableId, howManyPoints, startFromPoint)
+        return out
+
+
+    def getRecordedDataValuesByTable(self, howManyPoints, tableIds=None,
+                                     startFromPoint=1):
+        tableIds= self._recordTableIds(tableIds)
+        values= self.getRecordedDataValues(
+            howManyPoints, startFromPoint, tableIds=tableIds)
+        return OrderedDict(zip(tableIds, values))
+
+
+    def getRecordedDataValuesInChunks(self, howManyPoints, chunkSizeInPoints,
+                                      startFromPoint=1, tableIds=None):
+        for tableId in self._recordTableIds(tableIds):
+            for offset in range(0, howManyPoints, chunkSizeInPoints):
+                n= min(chunkSizeInPoints, howManyPoints - offset)
+                yield tableId, startFromPoint + offset, self._recordTable(
+                    tableId, n, startFromPoint + offset)
+
+
+    def getRecordedDataValuesAsync(self, howManyPoints, startFromPoint=1,
+                                   tableIds=None, out=None):
+        future= RecordedDataFuture(self._recordTableIds(tableIds),
+                                   howManyPoints, out)
+        for i, tableId in enumerate(future.tableIds()):
+            future._buffer()[i]= self._recordTable(
+                tableId, howManyPoints, startFromPoint)
+        future._setPointsAvailable(howManyPoints)
+        future._setDone()
+        return future
 
 
     def startRecordingInSyncWithWaveGenerator(self):
@@ -219,7 +300,7 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
 
 
     def getNumberOfWaveGenerators(self):
-        pass
+        return 3
 
 
     def getWaveGeneratorStartStopMode(self):
@@ -233,18 +314,25 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
                           startModeArray)
 
 
+    def getMaximumNumberOfWavePoints(self, waveTableIdsArray):
+        return np.full(len(waveTableIdsArray),
+                       self.maximumNumberOfWavePoints, dtype=int)
+
+
     def clearWaveTableData(self, waveTableIdsArray):
         pass
 
 
     def getConnectionOfWaveTableToWaveGenerator(self, waveGeneratorsArray):
-        pass
+        return self._dictToArray(self._waveTableOfWaveGenerator,
+                                 waveGeneratorsArray)
 
 
     def setConnectionOfWaveTableToWaveGenerator(self,
                                                 waveGeneratorsArray,
                                                 waveTableIdsArray):
-        pass
+        self._arrayToDict(self._waveTableOfWaveGenerator,
+                          waveGeneratorsArray, waveTableIdsArray)
 
 
     def setSinusoidalWaveform(self,
@@ -292,8 +380,31 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
                                numberOfWavePoints,
                                appendMode,
                                wavePointsArray):
-        assert appendMode == WaveformGenerator.CLEAR, 'only CLEAR implemented'
-        self._waveform[waveTableId]= wavePointsArray
+        assert appendMode in WaveformGenerator.ALL
+        points= np.array(wavePointsArray, dtype=float)[:numberOfWavePoints]
+        first= offsetOfFirstPointInWaveTable - 1
+        last= first + len(points)
+        if appendMode == WaveformGenerator.CLEAR:
+            table= np.zeros(last)
+        else:
+            table= np.array(self._waveform.get(waveTableId, []), dtype=float)
+            if len(table) < last:
+                table= np.concatenate((table, np.zeros(last - len(table))))
+        if appendMode == WaveformGenerator.ADD:
+            table[first: last]+= points
+        else:
+            table[first: last]= points
+        self._waveform[waveTableId]= table
+
+
+    def uploadUserDefinedWaveform(self,
+                                  waveTableId,
+                                  wavePointsArray,
+                                  chunkSizeInPoints=None,
+                                  diff=False):
+        previous= self._waveform.get(waveTableId) if diff else None
+        return uploadWaveformPoints(self, waveTableId, wavePointsArray,
+                                    previous, chunkSizeInPoints)
 
 
     def getWaveform(self, waveTableId):
@@ -313,16 +424,24 @@ class FakeGeneralCommandSet(AbstractGeneralCommandSet):
 
 
     def setWaveGeneratorTableRate(self,
-                                  waveGeneratorTableRateInServoLoopCycles):
+                                  waveGeneratorTableRateInServoLoopCycles,
+                                  interpolationType=None):
+        if interpolationType is None:
+            interpolationType= WaveformGenerator.NO_INTERPOLATION
         self._wtr= np.ones(3) * waveGeneratorTableRateInServoLoopCycles
+        self._wtrInterpolation= np.ones(3, dtype=int) * interpolationType
 
 
     def getWaveGeneratorTableRate(self):
         return self._wtr
 
 
-    def getOverflowState(self):
-        pass
+    def getWaveGeneratorInterpolation(self):
+        return self._wtrInterpolation
+
+
+    def getOverflowState(self, axesString):
+        return np.zeros(len(self._axesString2Array(axesString)), dtype=bool)
 
 
     def setDataRecoderTriggerSource(self, source, value):
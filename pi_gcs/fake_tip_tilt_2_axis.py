@@ -1,7 +1,9 @@
+import time
 import numpy as np
 from pi_gcs.abstract_tip_tilt_2_axes import AbstractTipTilt2Axis
 from pi_gcs.gcs2 import PIException
 from pi_gcs.decorator import override
+from pi_gcs.tip_tilt_status import TipTiltStatus
 
 
 class FakeTipTilt2Axis(AbstractTipTilt2Axis):
@@ -93,7 +95,7 @@ class FakeTipTilt2Axis(AbstractTipTilt2Axis):
 
 
     def _getRecordedDataValues(self, howManyPoints, startFromPoint=1):
-        nRecorders= 8
+        nRecorders= 6
         retArray=np.zeros((nRecorders, howManyPoints))
         retArray[0]= self._repeatVectorTo(self._axisATrajectory, howManyPoints)
         retArray[1]= self._repeatVectorTo(self._axisBTrajectory, howManyPoints)
@@ -104,10 +106,14 @@ class FakeTipTilt2Axis(AbstractTipTilt2Axis):
 
 
     @override
-    def getRecordedData(self, howManyPoints, dataRecorderCfg=None):
+    def getRecordedData(self, howManyPoints, dataRecorderCfg=None, out=None):
         timeValues= np.arange(howManyPoints) * self.getRecordedDataTimeStep()
         recDataMilliRad= self._getRecordedDataValues(howManyPoints, 1)
-        return np.vstack((timeValues, recDataMilliRad))
+        if out is None:
+            return np.vstack((timeValues, recDataMilliRad))
+        out[0]= timeValues
+        out[1:]= recDataMilliRad
+        return out
 
 
     @override
@@ -117,12 +123,24 @@ class FakeTipTilt2Axis(AbstractTipTilt2Axis):
 
     @override
     def status(self):
-        status={}
-        status['POSITION']= self.getPosition()
-        status['TARGET']= self.getTargetPosition()
-        status['OUTPUT_VOLTAGE']= self.getVoltages()
-        status['CONTROL_LOOP_CLOSED']= self.isControlLoopEnabled()
-        status['OVERFLOW']= np.array([False, False])
+        return self.statusSnapshot().asDict()
+
+
+    @override
+    def statusSnapshot(self, fields=None):
+        if fields is None:
+            fields= TipTiltStatus.ALL_FIELDS
+        status= TipTiltStatus(time.time(), fields)
+        if TipTiltStatus.POSITION in fields:
+            status.position= self.getPosition()
+        if TipTiltStatus.TARGET in fields:
+            status.target= self.getTargetPosition()
+        if TipTiltStatus.OUTPUT_VOLTAGE in fields:
+            status.outputVoltage= self.getVoltages()
+        if TipTiltStatus.CONTROL_LOOP_CLOSED in fields:
+            status.controlLoopClosed= self.isControlLoopEnabled()
+        if TipTiltStatus.OVERFLOW in fields:
+            status.overflow= np.array([False, False])
         return status
 
 
@@ -1,9 +1,17 @@
+import time
+import threading
 from ctypes.util import find_library
 import ctypes
 from ctypes import c_int, c_bool, c_char, c_char_p, c_double, c_uint
+from collections import OrderedDict
 import numpy as np
 from pi_gcs.data_recorder_configuration import DataRecorderConfiguration
 from pi_gcs.abstract_gcs2 import AbstractGeneralCommandSet
+from pi_gcs.command_batch import CommandBatch
+from pi_gcs.gcs_answer_parser import parseDataArrayHeader, parseText
+from pi_gcs.recorded_data_future import RecordedDataFuture
+from pi_gcs.decorator import cacheResult, setCachedResult, \
+    clearCachedResults, synchronized
 
 
 __version__= "$Id: $"
@@ -20,27 +28,42 @@ class PIConnectionError(PIException):
     pass
 
 
+class PITimeoutError(PIException):
+    pass
+
+
 class CTypeArray():
+    '''
+    ctypes argument wrapping a contiguous numpy buffer
+
+    The numpy array is handed to the PI library as a pointer to its
+    data, so there is no per-element conversion in either direction.
+    If array is already a contiguous ndarray of the matching dtype it is
+    used as it is: the library writes straight into the caller's memory.
+    '''
 
     def __init__(self, ctype, array):
         assert isinstance(array, (np.ndarray, list, tuple))
         self._ctype= ctype
-        self._ret= (self._ctype * len(array))()
-        for i in range(len(array)):
-            self._ret[i]= array[i]
+        self._array= np.ascontiguousarray(array, dtype=np.dtype(ctype))
+
+
+    @classmethod
+    def zeros(cls, length):
+        return cls(np.zeros(length))
 
 
     def from_param(self):
-        return self._ret
+        return self._array.ctypes.data_as(ctypes.POINTER(self._ctype))
 
 
     def toNumpyArray(self):
-        return np.array([x for x in self._ret])
+        return self._array
 
 
 class CIntArray(CTypeArray):
     def __init__(self, array):
-        CTypeArray.__init__(self, c_int, np.array(array, dtype=np.int))
+        CTypeArray.__init__(self, c_int, array)
 
 
 class CUnsignedIntArray(CTypeArray):
@@ -70,6 +93,74 @@ class Channels(CIntArray):
 
 
 
+BOOL= c_int
+P_INT= ctypes.POINTER(c_int)
+PP_DOUBLE= ctypes.POINTER(ctypes.POINTER(c_double))
+
+# restype and argtypes of every PI_* function used by GeneralCommandSet2.
+# They are applied once when the library is loaded.
+PI_FUNCTION_PROTOTYPES= {
+    'PI_ConnectTCPIP': (c_int, [c_char_p, c_int]),
+    'PI_CloseConnection': (None, [c_int]),
+    'PI_IsConnected': (BOOL, [c_int]),
+    'PI_GetError': (c_int, [c_int]),
+    'PI_TranslateError': (BOOL, [c_int, c_char_p, c_int]),
+    'PI_GcsCommandset': (BOOL, [c_int, c_char_p]),
+    'PI_GcsGetAnswer': (BOOL, [c_int, c_char_p, c_int]),
+    'PI_GcsGetAnswerSize': (BOOL, [c_int, P_INT]),
+    'PI_qVER': (BOOL, [c_int, c_char_p, c_int]),
+    'PI_qSAI': (BOOL, [c_int, c_char_p, c_int]),
+    'PI_qTSC': (BOOL, [c_int, P_INT]),
+    'PI_qTPC': (BOOL, [c_int, P_INT]),
+    'PI_qECO': (BOOL, [c_int, c_char_p, c_char_p]),
+    'PI_qSVO': (BOOL, [c_int, c_char_p, CIntArray]),
+    'PI_SVO': (BOOL, [c_int, c_char_p, CIntArray]),
+    'PI_qONL': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_ONL': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_qVMI': (BOOL, [c_int, CIntArray, CDoubleArray, c_int]),
+    'PI_VMI': (BOOL, [c_int, CIntArray, CDoubleArray, c_int]),
+    'PI_qVMA': (BOOL, [c_int, CIntArray, CDoubleArray, c_int]),
+    'PI_VMA': (BOOL, [c_int, CIntArray, CDoubleArray, c_int]),
+    'PI_qVOL': (BOOL, [c_int, CIntArray, CDoubleArray, c_int]),
+    'PI_qPOS': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_qMOV': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_MOV': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_MVR': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_qSVA': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_SVA': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_SVR': (BOOL, [c_int, c_char_p, CDoubleArray]),
+    'PI_qOVF': (BOOL, [c_int, c_char_p, CIntArray]),
+    'PI_qSPA': (BOOL, [c_int, c_char_p, CUnsignedIntArray, CDoubleArray,
+                       c_char_p, c_int]),
+    'PI_qHDR': (BOOL, [c_int, c_char_p, c_int]),
+    'PI_DRC': (BOOL, [c_int, CIntArray, c_char_p, CIntArray]),
+    'PI_qDRC': (BOOL, [c_int, CIntArray, c_char_p, CIntArray, c_int, c_int]),
+    'PI_qDRR_SYNC': (BOOL, [c_int, c_int, c_int, c_int, CDoubleArray]),
+    'PI_qDRR': (BOOL, [c_int, CIntArray, c_int, c_int, c_int, PP_DOUBLE,
+                       c_char_p, c_int]),
+    'PI_qDRL': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_GetAsyncBufferIndex': (c_int, [c_int]),
+    'PI_GetAsyncBuffer': (BOOL, [c_int, PP_DOUBLE]),
+    'PI_RTR': (BOOL, [c_int, c_int]),
+    'PI_qRTR': (BOOL, [c_int, P_INT]),
+    'PI_WGR': (BOOL, [c_int]),
+    'PI_WGO': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_qWGO': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_WCL': (BOOL, [c_int, CIntArray, c_int]),
+    'PI_qWMS': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_WSL': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_qWSL': (BOOL, [c_int, CIntArray, CIntArray, c_int]),
+    'PI_WAV_SIN_P': (BOOL, [c_int, c_int, c_int, c_int, c_int,
+                            c_int, c_double, c_double, c_int]),
+    'PI_WAV_PNT': (BOOL, [c_int, c_int, c_int, c_int, c_int, CDoubleArray]),
+    'PI_WTR': (BOOL, [c_int, CIntArray, CIntArray, CIntArray, c_int]),
+    'PI_qWTR': (BOOL, [c_int, CIntArray, CIntArray, CIntArray, c_int]),
+    'PI_STE': (BOOL, [c_int, c_char_p, c_double]),
+    'PI_IMP': (BOOL, [c_int, c_char_p, c_double]),
+}
+
+
+
 class WaveformGenerator(object):
     CLEAR= 0
     APPEND= 1
@@ -77,21 +168,178 @@ class WaveformGenerator(object):
 
     ALL= [CLEAR, APPEND, ADD]
 
+    NO_INTERPOLATION= 0
+    LINEAR_INTERPOLATION= 1
+
+
+def changedSegments(previousPoints, points, mergeGapInPoints=0):
+    '''
+    (first, last + 1) of the runs of points that differ from
+    previousPoints, two runs closer than mergeGapInPoints being merged.
+    The arrays must have the same length
+    '''
+    changed= np.flatnonzero(np.asarray(previousPoints) != np.asarray(points))
+    if len(changed) == 0:
+        return []
+    breaks= np.flatnonzero(np.diff(changed) > mergeGapInPoints + 1)
+    firsts= np.concatenate(([changed[0]], changed[breaks + 1]))
+    lasts= np.concatenate((changed[breaks], [changed[-1]])) + 1
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+def uploadWaveformPoints(controller,
+                         waveTableId,
+                         points,
+                         previousPoints=None,
+                         chunkSizeInPoints=None,
+                         mergeGapInPoints=16):
+    '''
+    Write points in waveTableId with setUserDefinedWaveform
+
+    If previousPoints, the content of the table, is given and has the
+    same length only the changed segments are written, at their offset
+    in the table and in APPEND mode; the table is rewritten from
+    scratch if more than half of the points changed. Each write is
+    split in chunks of at most chunkSizeInPoints points.
+
+    Returns the number of points sent
+    '''
+    points= np.ascontiguousarray(points, dtype=float)
+    segments= None
+    if previousPoints is not None and len(previousPoints) == len(points):
+        segments= changedSegments(previousPoints, points, mergeGapInPoints)
+        if sum(last - first for first, last in segments) > len(points) / 2:
+            segments= None
+    if segments is None:
+        _writeWaveformSegment(controller, waveTableId, points, 0,
+                              len(points), chunkSizeInPoints, clear=True)
+        return len(points)
+    for first, last in segments:
+        _writeWaveformSegment(controller, waveTableId, points, first,
+                              last, chunkSizeInPoints, clear=False)
+    return sum(last - first for first, last in segments)
+
+
+def _writeWaveformSegment(controller, waveTableId, points, first, last,
+                          chunkSizeInPoints, clear):
+    if chunkSizeInPoints is None:
+        chunkSizeInPoints= max(last - first, 1)
+    for start in range(first, max(last, first + 1), chunkSizeInPoints):
+        stop= min(start + chunkSizeInPoints, last)
+        if clear and start == first:
+            mode= WaveformGenerator.CLEAR
+        else:
+            mode= WaveformGenerator.APPEND
+        # offsets in the wave table start from 1
+        controller.setUserDefinedWaveform(waveTableId, start + 1,
+                                          stop - start, mode,
+                                          points[start: stop])
+
+
+class _SynchronizedLibrary(object):
+    '''
+    PI library whose functions are called holding lock
+
+    A connection must not be used by two threads at once: e.g. a PI_MOV
+    between the PI_GcsCommandset and the PI_GcsGetAnswer of another
+    thread could read or lose its answers. For the same reason the
+    error codes of a failed call are read with PI_GetError before the
+    lock is released, and are returned by takeErrorIds() to the thread
+    that made the call.
+    '''
+
+    UNCHECKED_FUNCTIONS= ('PI_GetError', 'PI_TranslateError',
+                          'PI_IsConnected', 'PI_CloseConnection')
+    INT_RESULT_FUNCTIONS= ('PI_ConnectTCPIP', 'PI_GetAsyncBufferIndex')
+
+    def __init__(self, library, lock):
+        self._library= library
+        self._lock= lock
+        self._functions= {}
+        self._errors= threading.local()
+
+
+    def _failed(self, name, result):
+        if name in self.UNCHECKED_FUNCTIONS:
+            return False
+        if name in self.INT_RESULT_FUNCTIONS:
+            return result < 0
+        return result == GeneralCommandSet2.GCS_FALSE
+
+
+    def _readErrorIds(self, ide):
+        errorIds= []
+        errorId= self._library.PI_GetError(ide)
+        while errorId != 0:
+            errorIds.append(errorId)
+            errorId= self._library.PI_GetError(ide)
+        return errorIds
+
+
+    def takeErrorIds(self):
+        '''
+        Error codes of the last call of this thread, if it failed
+        '''
+        errorIds= getattr(self._errors, 'ids', [])
+        self._errors.ids= []
+        return errorIds
+
+
+    def __getattr__(self, name):
+        if name not in self._functions:
+            gcsFunction= getattr(self._library, name)
+            lock= self._lock
+            errors= self._errors
+
+            def synchronizedFunction(*args):
+                with lock:
+                    result= gcsFunction(*args)
+                    errors.ids= []
+                    if self._failed(name, result):
+                        # the errors of a failed connection are under id -1
+                        ide= result if name == 'PI_ConnectTCPIP' else args[0]
+                        errors.ids= self._readErrorIds(ide)
+                    return result
+
+            self._functions[name]= synchronizedFunction
+        return self._functions[name]
+
 
 class GeneralCommandSet2(AbstractGeneralCommandSet):
 
     GCS_TRUE= 1
     GCS_FALSE= 0
 
-    def __init__(self):
+    GCS_COMMAND_TIMEOUT_SEC= 2.0
+    ASYNC_READOUT_POLL_PERIOD_SEC= 0.01
+    ASYNC_READOUT_STALL_TIMEOUT_SEC= 5.0
+    MIN_ANSWER_POLL_PERIOD_SEC= 50e-6
+    MAX_ANSWER_POLL_PERIOD_SEC= 5e-3
+    END_OF_ANSWER_MARKER= 'pi_gcs_end_of_answer'
+
+    NUMBER_OF_RECORDER_TABLES_PARAMETER= 0x16000300
+    SERVO_UPDATE_TIME_PARAMETER= 0x0E000200
+
+    def __init__(self, gcsCommandTimeoutInSec=GCS_COMMAND_TIMEOUT_SEC,
+                 library=None):
+        '''
+        library is the PI GCS2 library to use instead of loading it,
+        e.g. a fake in tests
+        '''
+        self._gcsCommandTimeoutInSec= gcsCommandTimeoutInSec
         self._hostname= None
         self._port= None
         self._lib= None
         self._id= None
+        self._appliedDataRecorderCfg= None
+        self._uploadedWaveforms= {}
+        self._gcsCommandLock= threading.RLock()
         self._axes= ctypes.c_char_p(b"A B C")
         self._channels= (ctypes.c_int * 3)(1, 2, 3)
 
-        self._importLibrary()
+        if library is None:
+            library= self._importLibrary()
+        self._lib= _SynchronizedLibrary(library, self._gcsCommandLock)
 
 
     def _importLibrary(self):
@@ -99,7 +347,22 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         pilib= find_library(piLibName)
         if pilib is None:
             raise PIException("Library %s not found" % piLibName)
-        self._lib= ctypes.CDLL(pilib)
+        library= ctypes.CDLL(pilib)
+        self._setFunctionPrototypes(library)
+        return library
+
+
+    @staticmethod
+    def _setFunctionPrototypes(library):
+        # CDLL caches the function objects it hands out, so from now on
+        # attribute lookups on the library return the configured objects
+        for name, (restype, argtypes) in PI_FUNCTION_PROTOTYPES.items():
+            try:
+                gcsFunction= getattr(library, name)
+            except AttributeError:
+                continue
+            gcsFunction.restype= restype
+            gcsFunction.argtypes= argtypes
 
 
     def _errAsString(self, errorCode):
@@ -113,19 +376,16 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         return "%s (%d)" % (s.value.decode(), errorCode)
 
 
-    def _convertErrorToException(self, returnValue, expectedReturn=GCS_TRUE):
-        if returnValue != expectedReturn:
-            errorId= self._lib.PI_GetError(self._id)
-            if errorId != 0:
-                errMsg= ""
-                while errorId != 0:
-                    errMsg+= self._errAsString(errorId)+ " "
-                    errorId= self._lib.PI_GetError(self._id)
-                raise PIException("%s" % errMsg)
+    def _errorIdsAsString(self, errorIds):
+        return "".join(self._errAsString(errorId) + " "
+                       for errorId in errorIds)
 
 
-    def _convertCArrayToNumpyArray(self, cArray):
-        return np.array([x for x in cArray.array()])
+    def _convertErrorToException(self, returnValue, expectedReturn=GCS_TRUE):
+        if returnValue != expectedReturn:
+            errorIds= self._lib.takeErrorIds()
+            if errorIds:
+                raise PIException("%s" % self._errorIdsAsString(errorIds))
 
 
     def _toBool(self, value):
@@ -135,8 +395,7 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
     def _getterChannels(self, channels, gcsFunction, valueArrayClass):
         chArray= np.atleast_1d(channels)
-        value= valueArrayClass([0] * len(chArray))
-        gcsFunction.argtypes= [c_int, CIntArray, valueArrayClass, c_int]
+        value= valueArrayClass.zeros(len(chArray))
         self._convertErrorToException(
             gcsFunction(self._id,
                         CIntArray(chArray),
@@ -148,7 +407,6 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
     def _setterChannels(self, channels, value, gcsFunction, valueArrayClass):
         valueArray= np.atleast_1d(value)
         assert len(channels) == len(valueArray)
-        gcsFunction.argtypes= [c_int, CIntArray, valueArrayClass, c_int]
         self._convertErrorToException(
             gcsFunction(self._id,
                         CIntArray(channels),
@@ -158,8 +416,7 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
     def _getterAxes(self, axesString, gcsFunction, valueArrayClass):
         nCh= len(axesString.split())
-        value= valueArrayClass([0]* nCh)
-        gcsFunction.argtypes= [c_int, c_char_p, valueArrayClass]
+        value= valueArrayClass.zeros(nCh)
         self._convertErrorToException(
             gcsFunction(self._id, axesString.encode(), value))
         return value.toNumpyArray()
@@ -169,7 +426,6 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         nCh= len(axesString.split())
         valueArray= np.atleast_1d(value)
         assert nCh == len(valueArray)
-        gcsFunction.argtypes= [c_int, c_char_p, valueArrayClass]
         self._convertErrorToException(
             gcsFunction(self._id, axesString.encode(),
                         valueArrayClass(valueArray)))
@@ -189,55 +445,149 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
     def connectTCPIP(self, hostname, port=50000):
         ide= self._lib.PI_ConnectTCPIP(hostname.encode(), port)
         if ide == -1:
-            errorId= self._lib.PI_GetError(ide)
-            raise PIConnectionError("%s" % self._errAsString(errorId))
+            raise PIConnectionError(
+                "%s" % self._errorIdsAsString(self._lib.takeErrorIds()))
+        clearCachedResults(self)
+        self._appliedDataRecorderCfg= None
+        self._uploadedWaveforms= {}
         self._id= ide
         self._hostname= hostname
         self._port= port
 
 
     def closeConnection(self):
+        clearCachedResults(self)
+        self._appliedDataRecorderCfg= None
+        self._uploadedWaveforms= {}
         try:
             self._lib.PI_CloseConnection(self._id)
         except Exception:
             pass
 
 
-    def _trickToCheckForSyntaxError(self):
-        import time
-        time.sleep(0.1)
-        self._convertErrorToException(0, 1)
-
+    def prefetchStaticProperties(self):
+        '''
+        Fill the cache of the properties that don't change during a
+        connection with a single round trip
+        '''
+        batch= self.commandBatch()
+        version= batch.getVersion()
+        axes= batch.getAxesIdentifiers()
+        nInputs= batch.getNumberOfInputSignalChannels()
+        nOutputs= batch.getNumberOfOutputSignalChannels()
+        nTables= batch.getVolatileMemoryParameters(
+            1, self.NUMBER_OF_RECORDER_TABLES_PARAMETER)
+        servoTime= batch.getVolatileMemoryParameters(
+            1, self.SERVO_UPDATE_TIME_PARAMETER)
+        res= batch.execute()
+        setCachedResult(self, 'getVersion', (), res[version])
+        setCachedResult(self, 'getAxesIdentifiers', (), res[axes])
+        setCachedResult(self, 'getNumberOfInputSignalChannels', (),
+                        res[nInputs])
+        setCachedResult(self, 'getNumberOfOutputSignalChannels', (),
+                        res[nOutputs])
+        setCachedResult(self, 'getNumberOfRecorderTables', (),
+                        int(res[nTables]))
+        setCachedResult(self, 'getServoUpdateTimeInSeconds', (),
+                        float(res[servoTime]))
+
+
+    def _endsWithMarker(self, answer):
+        markerLine= self.END_OF_ANSWER_MARKER + '\n'
+        return answer == markerLine or answer.endswith('\n' + markerLine)
+
+
+    def _readGcsAnswers(self, timeoutInSec):
+        '''
+        Read the answers of a command ending with ERR? and
+        ECO? END_OF_ANSWER_MARKER, without the marker line
 
-    def gcsCommand(self, commandAsString):
-        self._lib.PI_GcsCommandset.argtypes= [c_int, c_char_p]
-        self._lib.PI_GcsGetAnswer.argtypes= [c_int, c_char_p, c_int]
-        self._convertErrorToException(
-            self._lib.PI_GcsCommandset(self._id, commandAsString.encode()))
-        self._trickToCheckForSyntaxError()
+        A query that fails has no answer, so the number of answers does
+        not tell when the command is complete: the echoed marker does,
+        and the line before it is the answer of ERR?
+        '''
+        deadline= time.time() + timeoutInSec
+        pollPeriod= 0
         retSize= c_int()
         res= ''
-        self._convertErrorToException(
-            self._lib.PI_GcsGetAnswerSize(self._id, ctypes.byref(retSize)))
-        while retSize.value != 0:
-            buf= ctypes.create_string_buffer(b'\000', retSize.value)
-            self._convertErrorToException(
-                self._lib.PI_GcsGetAnswer(self._id, buf, retSize.value))
-            res+= buf.value.decode()
+        while not self._endsWithMarker(res):
             self._convertErrorToException(
                 self._lib.PI_GcsGetAnswerSize(self._id, ctypes.byref(retSize)))
+            if retSize.value != 0:
+                bufSize= retSize.value + 1
+                buf= ctypes.create_string_buffer(b'\000', bufSize)
+                self._convertErrorToException(
+                    self._lib.PI_GcsGetAnswer(self._id, buf, bufSize))
+                res+= buf.value.decode()
+                pollPeriod= 0
+                continue
+            if time.time() > deadline:
+                raise PITimeoutError(
+                    "No complete answer after %g s (got %r)" % (
+                        timeoutInSec, res))
+            time.sleep(pollPeriod)
+            pollPeriod= min(max(2 * pollPeriod,
+                                self.MIN_ANSWER_POLL_PERIOD_SEC),
+                            self.MAX_ANSWER_POLL_PERIOD_SEC)
+        return res[:-len(self.END_OF_ANSWER_MARKER) - 1]
+
+
+    def _splitErrorAnswer(self, answer):
+        head, _, errorLine= answer[:-1].rpartition('\n')
+        answer= head + '\n' if head else ''
+        return answer, int(errorLine)
+
+
+    @synchronized("_gcsCommandLock")
+    def gcsCommand(self, commandAsString, timeoutInSec=None):
+        '''
+        Send a raw GCS command string and return the controller answer
+
+        ERR? and an ECO? of END_OF_ANSWER_MARKER are appended to the
+        string, so the command is complete as soon as the marker is
+        echoed, even if some query failed without answering, and the
+        controller errors are raised as PIException. Raises
+        PITimeoutError if the answer is not complete within
+        timeoutInSec. Commands sent from different threads, e.g. by a
+        PositionPoller, are serialized with each other and with every
+        other library call, so that each thread reads its own answers
+        '''
+        if timeoutInSec is None:
+            timeoutInSec= self._gcsCommandTimeoutInSec
+        command= '%s\nERR?\nECO? %s' % (commandAsString.rstrip('\n'),
+                                        self.END_OF_ANSWER_MARKER)
+        self._convertErrorToException(
+            self._lib.PI_GcsCommandset(self._id, command.encode()))
+        answer= self._readGcsAnswers(timeoutInSec)
+        res, errorCode= self._splitErrorAnswer(answer)
+        if errorCode != 0:
+            raise PIException(self._errAsString(errorCode))
         return res
 
 
+    def commandBatch(self):
+        return CommandBatch(self)
+
+
+    def executeCommandBatch(self, batch):
+        if not batch.items():
+            return []
+        return batch.parseAnswer(self.gcsCommand(batch.commandString()))
+
+
+    @cacheResult
     def getVersion(self):
         bufSize= 256
-        return self._getterReturnString(self._lib.PI_qVER, bufSize)
+        return parseText(
+            self._getterReturnString(self._lib.PI_qVER, bufSize))
 
 
+    @cacheResult
     def getAxesIdentifiers(self):
         return self._getterReturnString(self._lib.PI_qSAI, 256).split()
 
 
+    @cacheResult
     def getNumberOfInputSignalChannels(self):
         nChannels= c_int()
         self._convertErrorToException(
@@ -245,6 +595,7 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         return nChannels.value
 
 
+    @cacheResult
     def getNumberOfOutputSignalChannels(self):
         nChannels= c_int()
         self._convertErrorToException(
@@ -349,12 +700,6 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
 
     def getVolatileMemoryParameters(self, itemId, parameterId):
-        self._lib.PI_qSPA.argtypes= [c_int,
-                                     c_char_p,
-                                     CUnsignedIntArray,
-                                     CDoubleArray,
-                                     c_char_p,
-                                     c_int]
         retValue= CDoubleArray([0.])
         bufSize= 256
         retString= ctypes.create_string_buffer(b'\000', bufSize)
@@ -375,67 +720,215 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         return self._getterReturnString(self._lib.PI_qHDR, bufSize).split('\n')
 
 
+    @cacheResult
     def getNumberOfRecorderTables(self):
-        return int(self.getVolatileMemoryParameters(1, 0x16000300))
+        return int(self.getVolatileMemoryParameters(
+            1, self.NUMBER_OF_RECORDER_TABLES_PARAMETER))
 
 
     def setDataRecorderConfiguration(self, dataRecorderConfiguration):
+        '''
+        Send the tables that differ from the configuration applied
+        before on this connection, all of them in a single PI_DRC call
+        '''
         assert isinstance(dataRecorderConfiguration,
                           DataRecorderConfiguration), \
             "argument must be of type DataRecorderConfiguration"
 
-        self._lib.PI_DRC.argtypes= [c_int, CIntArray, c_char_p, CIntArray]
-
-        for tableId in dataRecorderConfiguration.getTableIds():
-            source= dataRecorderConfiguration.getRecordSource(tableId)
-            option= dataRecorderConfiguration.getRecordOption(tableId)
+        changed= dataRecorderConfiguration.diff(self._appliedDataRecorderCfg)
+        if len(changed) == 0:
+            return
+        tableIds, sources, options= zip(*changed.tables())
+        try:
             self._convertErrorToException(
                 self._lib.PI_DRC(self._id,
-                                 CIntArray([tableId]),
-                                 source.encode(),
-                                 CIntArray([option])))
+                                 CIntArray(tableIds),
+                                 ' '.join(str(s) for s in sources).encode(),
+                                 CIntArray(options)))
+        except Exception:
+            # some tables may have been configured
+            self._appliedDataRecorderCfg= None
+            raise
+        if self._appliedDataRecorderCfg is None:
+            self._appliedDataRecorderCfg= changed
+        else:
+            self._appliedDataRecorderCfg= \
+                self._appliedDataRecorderCfg.updatedWith(changed)
 
 
     def getDataRecorderConfiguration(self):
         nRecorders= self.getNumberOfRecorderTables()
         sourceBufSize= 256
         source= ctypes.create_string_buffer(b'\000', sourceBufSize)
-        option= CIntArray(np.zeros(nRecorders, dtype=np.int32))
+        option= CIntArray.zeros(nRecorders)
         table=CIntArray(np.arange(1, nRecorders + 1))
 
-        self._lib.PI_qDRC.argtypes= [c_int, CIntArray, c_char_p,
-                                     CIntArray, c_int, c_int]
 
         self._convertErrorToException(
             self._lib.PI_qDRC(self._id, table, source,
                               option, sourceBufSize, nRecorders))
 
         sources= [x.strip() for x in source.value.decode().split('\n')]
-        cfg= DataRecorderConfiguration()
-        for i in range(nRecorders):
-            cfg.setTable(table.toNumpyArray()[i],
-                         sources[i],
-                         option.toNumpyArray()[i])
-        return cfg
+        tableIds= table.toNumpyArray()
+        options= option.toNumpyArray()
+        return DataRecorderConfiguration(
+            (int(tableIds[i]), sources[i], int(options[i]))
+            for i in range(nRecorders))
 
 
-    def getRecordedDataValues(self, howManyPoints, startFromPoint=1):
-        nRecorders= self.getNumberOfRecorderTables()
-        value= CDoubleArray(np.zeros(howManyPoints))
-        retBuf= np.zeros((nRecorders, howManyPoints))
-        self._lib.PI_qDRR_SYNC.argtypes=[c_int, c_int, c_int,
-                                         c_int, CDoubleArray]
+    def _readRecordTable(self, tableId, startFromPoint, buf):
+        values= CDoubleArray(buf)
+        self._convertErrorToException(
+            self._lib.PI_qDRR_SYNC(
+                self._id, int(tableId), int(startFromPoint),
+                len(buf), values))
+        if not np.may_share_memory(values.toNumpyArray(), buf):
+            buf[:]= values.toNumpyArray()
+
+
+    def _recordedDataBuffer(self, out, shape):
+        if out is None:
+            return np.empty(shape)
+        assert out.shape == shape, \
+            "out must have shape %s, got %s" % (shape, out.shape)
+        return out
+
+
+    def _recordTableIds(self, tableIds):
+        if tableIds is None:
+            return np.arange(1, self.getNumberOfRecorderTables() + 1)
+        if isinstance(tableIds, DataRecorderConfiguration):
+            return np.array(tableIds.getTableIds(), dtype=int)
+        return np.atleast_1d(tableIds).astype(int)
+
+
+    def getNumberOfRecordedPoints(self, tableIds=None):
+        tableIds= self._recordTableIds(tableIds)
+        nValues= CIntArray.zeros(len(tableIds))
+        self._convertErrorToException(
+            self._lib.PI_qDRL(self._id, CIntArray(tableIds), nValues,
+                              len(tableIds)))
+        return nValues.toNumpyArray()
 
-        for i in range(nRecorders):
-            self._convertErrorToException(
-                self._lib.PI_qDRR_SYNC(
-                    self._id, i + 1, startFromPoint,
-                    len(value.toNumpyArray()), value))
-            retBuf[i, :]= value.toNumpyArray()
 
+    def getRecordedDataValues(self, howManyPoints, startFromPoint=1,
+                              out=None, tableIds=None):
+        '''
+        Read howManyPoints values of the record tables
+
+        tableIds is a list of record table ids or a
+        DataRecorderConfiguration: only those tables are read, in that
+        order. If None every table of the controller is read.
+        Returns a (nTables, howManyPoints) array. If out is given the
+        values are written directly into it (e.g. a memmap or a shared
+        memory buffer) and out is returned
+        '''
+        tableIds= self._recordTableIds(tableIds)
+        retBuf= self._recordedDataBuffer(out, (len(tableIds), howManyPoints))
+        for i, tableId in enumerate(tableIds):
+            self._readRecordTable(tableId, startFromPoint, retBuf[i])
         return retBuf
 
 
+    def getRecordedDataValuesByTable(self, howManyPoints, tableIds=None,
+                                     startFromPoint=1):
+        tableIds= self._recordTableIds(tableIds)
+        values= self.getRecordedDataValues(
+            howManyPoints, startFromPoint, tableIds=tableIds)
+        return OrderedDict(zip(tableIds, values))
+
+
+    def getRecordedDataValuesInChunks(self, howManyPoints, chunkSizeInPoints,
+                                      startFromPoint=1, tableIds=None):
+        '''
+        Generator reading the record tables chunkSizeInPoints at a time
+
+        Yields (tableId, firstPoint, values) for each chunk, table by
+        table. values is a view on a buffer reused for every chunk: copy
+        it if it must outlive the next iteration
+        '''
+        chunk= np.empty(chunkSizeInPoints)
+        for tableId in self._recordTableIds(tableIds):
+            for offset in range(0, howManyPoints, chunkSizeInPoints):
+                n= min(chunkSizeInPoints, howManyPoints - offset)
+                firstPoint= startFromPoint + offset
+                self._readRecordTable(tableId, firstPoint, chunk[:n])
+                yield tableId, firstPoint, chunk[:n]
+
+
+    def getRecordedDataValuesAsync(self, howManyPoints, startFromPoint=1,
+                                   tableIds=None, out=None):
+        '''
+        Start a background readout of the record tables
+
+        Returns a RecordedDataFuture immediately: a thread polls
+        PI_GetAsyncBufferIndex and copies the points that have arrived
+        into the future's (nTables, howManyPoints) buffer, so that the
+        prefix already transferred can be processed while the rest is
+        on the wire. Avoid other recorder commands until it is done
+        '''
+        tableIds= self._recordTableIds(tableIds)
+        headerBufSize= 4096
+        header= ctypes.create_string_buffer(b'\000', headerBufSize)
+        valuesPtr= ctypes.POINTER(c_double)()
+        self._convertErrorToException(
+            self._lib.PI_qDRR(self._id, CIntArray(tableIds), len(tableIds),
+                              int(startFromPoint), int(howManyPoints),
+                              ctypes.byref(valuesPtr),
+                              header, headerBufSize))
+        future= RecordedDataFuture(
+            tableIds, howManyPoints, out,
+            parseDataArrayHeader(header.value.decode()))
+        thread= threading.Thread(target=self._fillRecordedDataFuture,
+                                 args=(future,))
+        thread.daemon= True
+        thread.start()
+        return future
+
+
+    def _fillRecordedDataFuture(self, future):
+        try:
+            self._copyAsyncBufferToFuture(future)
+        except Exception as e:
+            future._setException(e)
+        else:
+            future._setDone()
+
+
+    def _copyAsyncBufferToFuture(self, future):
+        nTables= len(future.tableIds())
+        nPoints= future.numberOfPoints()
+        buf= future._buffer()
+        copied= 0
+        lastProgressTime= time.time()
+        valuesPtr= ctypes.POINTER(c_double)()
+        while copied < nPoints and not future.cancelled():
+            index= self._lib.PI_GetAsyncBufferIndex(self._id)
+            if index < 0:
+                self._convertErrorToException(0)
+                raise PIException("Async readout failed (%d)" % index)
+            available= min(index // nTables, nPoints)
+            if available > copied:
+                self._convertErrorToException(
+                    self._lib.PI_GetAsyncBuffer(self._id,
+                                                ctypes.byref(valuesPtr)))
+                # the DLL buffer interleaves the tables point by point
+                values= np.ctypeslib.as_array(
+                    valuesPtr, shape=(available * nTables,)).reshape(
+                        available, nTables)
+                buf[:, copied:available]= values[copied:available].T
+                copied= available
+                future._setPointsAvailable(copied)
+                lastProgressTime= time.time()
+            elif time.time() - lastProgressTime > \
+                    self.ASYNC_READOUT_STALL_TIMEOUT_SEC:
+                raise PITimeoutError(
+                    "Async readout stalled at %d of %d points" % (
+                        copied, nPoints))
+            else:
+                time.sleep(self.ASYNC_READOUT_POLL_PERIOD_SEC)
+
+
     def startRecordingInSyncWithWaveGenerator(self):
         self._convertErrorToException(
             self._lib.PI_WGR(self._id))
@@ -447,9 +940,8 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
     def getWaveGeneratorStartStopMode(self):
         nWaveGenerators= self.getNumberOfWaveGenerators()
-        self._lib.PI_qWGO.argtypes= [c_int, CIntArray, CIntArray, c_int]
         wgIds= CIntArray(np.arange(1, nWaveGenerators+ 1))
-        values= CIntArray(np.zeros(nWaveGenerators))
+        values= CIntArray.zeros(nWaveGenerators)
         self._convertErrorToException(
             self._lib.PI_qWGO(self._id, wgIds, values, nWaveGenerators))
         return values.toNumpyArray()
@@ -457,25 +949,32 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
     def setWaveGeneratorStartStopMode(self, startModeArray):
         nWaveGenerators= self.getNumberOfWaveGenerators()
-        self._lib.PI_WGO.argtypes= [c_int, CIntArray, CIntArray, c_int]
         wgIds= CIntArray(np.arange(1, nWaveGenerators+ 1))
         values= CIntArray(startModeArray)
         self._convertErrorToException(
             self._lib.PI_WGO(self._id, wgIds, values, nWaveGenerators))
 
 
+    def getMaximumNumberOfWavePoints(self, waveTableIdsArray):
+        '''
+        Points each wave table can hold (WMS?)
+        '''
+        return self._getterChannels(
+            waveTableIdsArray, self._lib.PI_qWMS, CIntArray)
+
+
     def clearWaveTableData(self, waveTableIdsArray):
-        self._lib.PI_WCL.argtypes= [c_int, CIntArray, c_int]
+        for waveTableId in waveTableIdsArray:
+            self._uploadedWaveforms.pop(int(waveTableId), None)
         table= CIntArray(waveTableIdsArray)
         self._convertErrorToException(
             self._lib.PI_WCL(self._id, table, len(waveTableIdsArray)))
 
 
     def getConnectionOfWaveTableToWaveGenerator(self, waveGeneratorsArray):
-        self._lib.PI_qWSL.argtypes= [c_int, CIntArray, CIntArray, c_int]
         nItems= len(waveGeneratorsArray)
         waveGenerators= CIntArray(waveGeneratorsArray)
-        waveTable= CIntArray(np.zeros(nItems))
+        waveTable= CIntArray.zeros(nItems)
         self._convertErrorToException(
             self._lib.PI_qWSL(self._id,
                               waveGenerators,
@@ -488,7 +987,6 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
                                                 waveGeneratorsArray,
                                                 waveTableIdsArray):
         assert len(waveGeneratorsArray) == len(waveTableIdsArray)
-        self._lib.PI_WSL.argtypes= [c_int, CIntArray, CIntArray, c_int]
         waveGenerators= CIntArray(waveGeneratorsArray)
         waveTable= CIntArray(waveTableIdsArray)
         self._convertErrorToException(
@@ -513,9 +1011,8 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         See description of PI_WAV_SIN_P in PI GCS 2.0 DLL doc
         '''
         assert append in WaveformGenerator.ALL
+        self._uploadedWaveforms.pop(int(waveTableId), None)
 
-        self._lib.PI_WAV_SIN_P.argtypes= [c_int, c_int, c_int, c_int, c_int,
-                                          c_int, c_double, c_double, c_int]
         self._convertErrorToException(
             self._lib.PI_WAV_SIN_P(self._id,
                                    waveTableId,
@@ -538,8 +1035,7 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         See description of PI_WAV_PNT in PI GCS 2.0 DLL doc
         '''
         assert appendMode in WaveformGenerator.ALL
-        self._lib.PI_WAV_PNT.argtypes= [c_int, c_int, c_int, c_int, c_int,
-                                        CDoubleArray]
+        self._uploadedWaveforms.pop(int(waveTableId), None)
         self._convertErrorToException(
             self._lib.PI_WAV_PNT(self._id,
                                  int(waveTableId),
@@ -549,8 +1045,32 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
                                  CDoubleArray(wavePointsArray)))
 
 
+    def uploadUserDefinedWaveform(self,
+                                  waveTableId,
+                                  wavePointsArray,
+                                  chunkSizeInPoints=None,
+                                  diff=False):
+        '''
+        Write wavePointsArray in waveTableId, in chunks of at most
+        chunkSizeInPoints points
+
+        If diff, only the segments that changed since the last upload to
+        the same table are sent (see uploadWaveformPoints). Diff mode
+        relies on WAV_PNT in APPEND mode at a start offset inside the
+        table overwriting the points in place, which is not verified on
+        the controllers: it is off by default. Returns the number of
+        points sent
+        '''
+        waveTableId= int(waveTableId)
+        previous= self._uploadedWaveforms.get(waveTableId) if diff else None
+        sent= uploadWaveformPoints(self, waveTableId, wavePointsArray,
+                                   previous, chunkSizeInPoints)
+        self._uploadedWaveforms[waveTableId]= np.array(wavePointsArray,
+                                                       dtype=float)
+        return sent
+
+
     def setRecordTableRate(self, recordTableRateInServoLoopCycles=1):
-        self._lib.PI_RTR.argtypes= [c_int, c_int]
         self._convertErrorToException(
             self._lib.PI_RTR(self._id, int(recordTableRateInServoLoopCycles)))
 
@@ -562,18 +1082,30 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
         return rtr.value
 
 
+    @cacheResult
     def getServoUpdateTimeInSeconds(self):
-        return float(self.getVolatileMemoryParameters(1, 0x0E000200))
+        return float(self.getVolatileMemoryParameters(
+            1, self.SERVO_UPDATE_TIME_PARAMETER))
 
 
     def setWaveGeneratorTableRate(self,
-                                  waveGeneratorTableRateInServoLoopCycles):
-        self._lib.PI_WTR.argtypes= [c_int, CIntArray, CIntArray,
-                                    CIntArray, c_int]
+                                  waveGeneratorTableRateInServoLoopCycles,
+                                  interpolationType=None):
+        '''
+        Table rate and interpolationType, one of
+        WaveformGenerator.NO_INTERPOLATION (the default) and
+        LINEAR_INTERPOLATION, are given for every wave generator or one
+        per wave generator
+        '''
         nWaveGenerators= self.getNumberOfWaveGenerators()
         wgIds= CIntArray(np.arange(1, nWaveGenerators+ 1))
-        tableRate= CIntArray(waveGeneratorTableRateInServoLoopCycles)
-        interpolation= CIntArray(np.zeros(nWaveGenerators))
+        if interpolationType is None:
+            interpolationType= WaveformGenerator.NO_INTERPOLATION
+        tableRate= CIntArray(np.broadcast_to(
+            np.atleast_1d(waveGeneratorTableRateInServoLoopCycles),
+            (nWaveGenerators,)))
+        interpolation= CIntArray(np.broadcast_to(
+            np.atleast_1d(interpolationType), (nWaveGenerators,)))
 
         self._convertErrorToException(
             self._lib.PI_WTR(self._id,
@@ -583,21 +1115,26 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
                              nWaveGenerators))
 
 
-    def getWaveGeneratorTableRate(self):
-        self._lib.PI_qWTR.argtypes= [c_int, CIntArray, CIntArray,
-                                     CIntArray, c_int]
-
+    def _getWaveGeneratorTableRateAndInterpolation(self):
         nWaveGenerators= self.getNumberOfWaveGenerators()
         wgIds= CIntArray(np.arange(1, nWaveGenerators+ 1))
-        tableRate= CIntArray(np.zeros(nWaveGenerators))
-        interpolation= CIntArray(np.zeros(nWaveGenerators))
+        tableRate= CIntArray.zeros(nWaveGenerators)
+        interpolation= CIntArray.zeros(nWaveGenerators)
         self._convertErrorToException(
             self._lib.PI_qWTR(self._id,
                               wgIds,
                               tableRate,
                               interpolation,
                               nWaveGenerators))
-        return tableRate.toNumpyArray()
+        return tableRate.toNumpyArray(), interpolation.toNumpyArray()
+
+
+    def getWaveGeneratorTableRate(self):
+        return self._getWaveGeneratorTableRateAndInterpolation()[0]
+
+
+    def getWaveGeneratorInterpolation(self):
+        return self._getWaveGeneratorTableRateAndInterpolation()[1]
 
 
     def getOverflowState(self, axesString):
@@ -615,7 +1152,6 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
 
     def startStepAndResponseMeasurement(self, axisString, amplitude):
-        self._lib.PI_STE.argtypes= [c_int, c_char_p, c_double]
 
         self._convertErrorToException(
             self._lib.PI_STE(self._id,
@@ -624,7 +1160,6 @@ class GeneralCommandSet2(AbstractGeneralCommandSet):
 
 
     def startImpulseAndResponseMeasurement(self, axisString, amplitude):
-        self._lib.PI_IMP.argtypes= [c_int, c_char_p, c_double]
 
         self._convertErrorToException(
             self._lib.PI_IMP(self._id,
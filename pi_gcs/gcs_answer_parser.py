@@ -0,0 +1,83 @@
+import re
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+_KEY_VALUE_RE= re.compile(r'^[ \t]*(.*?)[ \t]*=[ \t]*(.*?)[ \t]*$', re.M)
+_HEADER_RE= re.compile(r'^#[ \t]*(\w+)[ \t]*=[ \t]*(.*?)[ \t]*$', re.M)
+_ANSWER_END_RE= re.compile(r'(?<! )\n')
+
+END_HEADER= '# END_HEADER'
+
+
+def splitAnswers(answer):
+    '''
+    Split the concatenated answers of several queries
+
+    Every line of a multi-line answer but the last one ends with ' \\n'
+    '''
+    answers= _ANSWER_END_RE.split(answer)
+    return [a + '\n' for a in answers[:-1]]
+
+
+def parseText(answer):
+    '''
+    Text of a possibly multi-line answer, without the line trailers
+    '''
+    return answer.replace(' \n', '\n').strip()
+
+
+def parseKeyValueAnswer(answer, dtype=float):
+    '''
+    Parse 'key=value' lines, like '1=0.5 \\n2=0.7\\n'
+
+    Returns the list of keys and the numpy array of values
+    '''
+    pairs= _KEY_VALUE_RE.findall(answer)
+    if not pairs:
+        return [], np.array([], dtype=dtype)
+    keys, values= zip(*pairs)
+    return list(keys), np.array(values).astype(dtype)
+
+
+def parseValues(answer, dtype=float):
+    return parseKeyValueAnswer(answer, dtype)[1]
+
+
+def _convertHeaderValue(value):
+    for conversion in (int, float):
+        try:
+            return conversion(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parseDataArrayHeader(headerText):
+    return dict((k, _convertHeaderValue(v))
+                for k, v in _HEADER_RE.findall(headerText))
+
+
+def parseDataArray(text):
+    '''
+    Parse the GCS data-array format (e.g. the answer to DRR?)
+
+    The text is a header of '# KEY = value' lines terminated by
+    '# END_HEADER', followed by whitespace separated columns.
+    Returns the header as a dict and the data as a
+    (nColumns, nPoints) array, one row per column of the text
+    '''
+    headerText, sep, body= text.partition(END_HEADER)
+    if not sep:
+        headerText, body= '', text
+    header= parseDataArrayHeader(headerText)
+    data= np.fromstring(body, sep=' ')
+    nColumns= header.get('DIM')
+    if nColumns is None:
+        firstLine= body.strip().split('\n', 1)[0]
+        nColumns= max(len(firstLine.split()), 1)
+    assert data.size % nColumns == 0, \
+        "%d values cannot be split in %d columns" % (data.size, nColumns)
+    return header, data.reshape(-1, nColumns).T
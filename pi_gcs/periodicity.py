@@ -0,0 +1,82 @@
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+RELATIVE_TOLERANCE= 1e-9
+
+
+def divisors(n):
+    '''
+    Divisors of n in increasing order
+    '''
+    small= [d for d in range(1, int(np.sqrt(n)) + 1) if n % d == 0]
+    large= [n // d for d in reversed(small) if d * d != n]
+    return small + large
+
+
+def _gcd(a, b):
+    while b:
+        a, b= b, a % b
+    return a
+
+
+def _lcm(a, b):
+    return a * b // _gcd(a, b)
+
+
+def _absoluteTolerance(trajectory, tolerance):
+    if tolerance is not None:
+        return tolerance
+    if len(trajectory) == 0:
+        return 0.
+    return RELATIVE_TOLERANCE * max(1., np.max(np.abs(trajectory)))
+
+
+def isPeriodic(trajectory, period, tolerance=None):
+    '''
+    True if trajectory is a whole number of repetitions of its first
+    period points, each one equal to the first within tolerance (by
+    default RELATIVE_TOLERANCE times the largest value)
+
+    Every repetition is compared with the first one, so a trajectory
+    drifting by less than tolerance per period is not periodic
+    '''
+    trajectory= np.asarray(trajectory, dtype=float)
+    if period <= 0 or len(trajectory) % period != 0:
+        return False
+    tolerance= _absoluteTolerance(trajectory, tolerance)
+    repetitions= trajectory.reshape(-1, period)
+    return bool(np.all(np.abs(repetitions - trajectory[:period])
+                       <= tolerance))
+
+
+def shortestPeriod(trajectory, tolerance=None):
+    '''
+    Shortest period of trajectory among the divisors of its length, so
+    that the trajectory is a whole number of repetitions of its first
+    period. Returns the length if the trajectory is not periodic
+    '''
+    trajectory= np.asarray(trajectory, dtype=float)
+    n= len(trajectory)
+    if n == 0:
+        return 0
+    tolerance= _absoluteTolerance(trajectory, tolerance)
+    for period in divisors(n):
+        if period == n or isPeriodic(trajectory, period, tolerance):
+            return period
+
+
+def commonPeriod(trajectories, tolerance=None):
+    '''
+    Shortest length repeating every one of the trajectories, that must
+    have the same length: the least common multiple of their periods
+    '''
+    lengths= set(len(t) for t in trajectories)
+    assert len(lengths) == 1, \
+        "trajectories must have the same length, got %s" % sorted(lengths)
+    period= 1
+    for trajectory in trajectories:
+        period= _lcm(period, max(shortestPeriod(trajectory, tolerance), 1))
+    return min(period, lengths.pop())
@@ -0,0 +1,173 @@
+import threading
+import time
+import numpy as np
+from pi_gcs.tip_tilt_status import TipTiltStatus
+
+
+__version__= "$Id: $"
+
+
+class PositionPoller(object):
+    '''
+    Sample the position of a tip-tilt on a dedicated thread
+
+    Every periodInSec the poller reads the requested fields (POSITION,
+    OUTPUT_VOLTAGE, OVERFLOW) with one TipTilt2Axis.statusSnapshot()
+    and stores them, with the snapshot timestamp, in a preallocated
+    ring buffer of capacity samples.
+
+    Every sample is written twice, at i and i + capacity, so that the
+    last n samples are always a contiguous slice of the buffer: history()
+    returns views, not copies. A view is valid until the poller wraps
+    around, i.e. for capacity - n more samples: copy it to keep it
+    longer.
+    '''
+
+    WIDTH= {TipTiltStatus.POSITION: 2,
+            TipTiltStatus.OUTPUT_VOLTAGE: 3,
+            TipTiltStatus.OVERFLOW: 2}
+
+    def __init__(self,
+                 tipTilt,
+                 periodInSec=0.01,
+                 capacity=1000,
+                 fields=(TipTiltStatus.POSITION,),
+                 timeModule=time):
+        for field in fields:
+            assert field in self.WIDTH, "cannot poll %s" % field
+        self._tipTilt= tipTilt
+        self._period= periodInSec
+        self._capacity= capacity
+        self._fields= tuple(fields)
+        self._time= timeModule
+        self._timestamps= np.zeros(2 * capacity)
+        self._values= dict(
+            (field, np.zeros((2 * capacity, self.WIDTH[field])))
+            for field in self._fields)
+        self._count= 0
+        self._thread= None
+        self._stopRequested= threading.Event()
+        self._exception= None
+
+
+    def periodInSec(self):
+        return self._period
+
+
+    def capacity(self):
+        return self._capacity
+
+
+    def fields(self):
+        return self._fields
+
+
+    def numberOfSamples(self):
+        '''
+        Samples taken since the poller was created, including the ones
+        already overwritten
+        '''
+        return self._count
+
+
+    def exception(self):
+        return self._exception
+
+
+    def step(self):
+        '''
+        Take one sample
+        '''
+        status= self._tipTilt.statusSnapshot(self._fields)
+        i= self._count % self._capacity
+        for row in (i, i + self._capacity):
+            self._timestamps[row]= status.timestamp
+            for field in self._fields:
+                self._values[field][row]= getattr(
+                    status, self._attributeName(field))
+        # publish the sample only once both copies are written
+        self._count+= 1
+
+
+    @staticmethod
+    def _attributeName(field):
+        return {TipTiltStatus.POSITION: 'position',
+                TipTiltStatus.OUTPUT_VOLTAGE: 'outputVoltage',
+                TipTiltStatus.OVERFLOW: 'overflow'}[field]
+
+
+    def history(self, howManySamples=None, field=TipTiltStatus.POSITION):
+        '''
+        (timestamps, values) views of the last howManySamples samples
+        (all the available ones by default), oldest first. values has
+        shape (howManySamples, width of field)
+        '''
+        count= self._count
+        available= min(count, self._capacity)
+        if howManySamples is None or howManySamples > available:
+            howManySamples= available
+        first= (count - howManySamples) % self._capacity
+        last= first + howManySamples
+        return (self._timestamps[first: last],
+                self._values[field][first: last])
+
+
+    def latest(self, maxAgeInSec=None, field=TipTiltStatus.POSITION):
+        '''
+        (timestamp, values) of the newest sample, or None if there is
+        no sample younger than maxAgeInSec
+        '''
+        timestamps, values= self.history(1, field)
+        if len(timestamps) == 0:
+            return None
+        if maxAgeInSec is not None and \
+                self._time.time() - timestamps[0] > maxAgeInSec:
+            return None
+        return timestamps[0], values[0].copy()
+
+
+    def _run(self, durationInSec):
+        startTime= self._time.time()
+        deadline= None
+        if durationInSec is not None:
+            deadline= startTime + durationInSec
+        nextSampleTime= startTime
+        try:
+            while not self._stopRequested.is_set():
+                now= self._time.time()
+                if deadline is not None and now >= deadline:
+                    break
+                if now < nextSampleTime:
+                    self._stopRequested.wait(nextSampleTime - now)
+                    continue
+                self.step()
+                nextSampleTime+= self._period
+                if nextSampleTime < now:
+                    # we are late: skip the missed samples
+                    nextSampleTime= now + self._period
+        except Exception as e:
+            self._exception= e
+
+
+    def start(self, durationInSec=None):
+        assert self._thread is None, "poller already started"
+        self._stopRequested.clear()
+        self._thread= threading.Thread(target=self._run,
+                                       args=(durationInSec,))
+        self._thread.daemon= True
+        self._thread.start()
+
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def stop(self, timeoutInSec=None):
+        self._stopRequested.set()
+        self.join(timeoutInSec)
+
+
+    def join(self, timeoutInSec=None):
+        if self._thread is not None:
+            self._thread.join(timeoutInSec)
+            self._thread= None
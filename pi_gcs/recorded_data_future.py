@@ -0,0 +1,113 @@
+import threading
+import time
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+class RecordedDataFuture(object):
+    '''
+    Result of a background data recorder readout
+
+    The (nTables, howManyPoints) buffer is filled by a producer thread.
+    pointsAvailable() tells how many points per table have landed so
+    far, available() returns a view on that prefix. result() waits for
+    the whole transfer and re-raises the producer's exception, if any.
+    '''
+
+    def __init__(self, tableIds, howManyPoints, out=None, header=None):
+        self._tableIds= list(tableIds)
+        shape= (len(self._tableIds), howManyPoints)
+        if out is None:
+            out= np.zeros(shape)
+        assert out.shape == shape, \
+            "out must have shape %s, got %s" % (shape, out.shape)
+        self._data= out
+        self._header= header or {}
+        self._pointsAvailable= 0
+        self._exception= None
+        self._cancelled= False
+        self._done= threading.Event()
+        self._progress= threading.Condition()
+
+
+    def tableIds(self):
+        return self._tableIds
+
+
+    def header(self):
+        return self._header
+
+
+    def numberOfPoints(self):
+        return self._data.shape[1]
+
+
+    def pointsAvailable(self):
+        return self._pointsAvailable
+
+
+    def available(self):
+        return self._data[:, :self._pointsAvailable]
+
+
+    def done(self):
+        return self._done.is_set()
+
+
+    def cancel(self):
+        self._cancelled= True
+
+
+    def cancelled(self):
+        return self._cancelled
+
+
+    def waitForPoints(self, nPoints, timeoutInSec=None):
+        deadline= None
+        if timeoutInSec is not None:
+            deadline= time.time() + timeoutInSec
+        with self._progress:
+            while self._pointsAvailable < nPoints and not self.done():
+                remaining= None
+                if deadline is not None:
+                    remaining= deadline - time.time()
+                    if remaining <= 0:
+                        break
+                self._progress.wait(remaining)
+        return self._pointsAvailable >= nPoints
+
+
+    def result(self, timeoutInSec=None):
+        if not self._done.wait(timeoutInSec):
+            raise RuntimeError(
+                "recorded data not available after %s s" % timeoutInSec)
+        if self._exception is not None:
+            raise self._exception
+        return self._data
+
+
+    def exception(self):
+        return self._exception
+
+
+    def _buffer(self):
+        return self._data
+
+
+    def _setPointsAvailable(self, nPoints):
+        with self._progress:
+            self._pointsAvailable= nPoints
+            self._progress.notify_all()
+
+
+    def _setException(self, exception):
+        self._exception= exception
+        self._setDone()
+
+
+    def _setDone(self):
+        with self._progress:
+            self._done.set()
+            self._progress.notify_all()
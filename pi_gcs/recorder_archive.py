@@ -0,0 +1,350 @@
+import json
+import os
+import time
+import numpy as np
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration
+
+
+__version__= "$Id: $"
+
+
+class RecorderArchive(object):
+    '''
+    Chunked, append-only on-disk storage of recorder captures
+
+    An archive is a directory holding:
+      - data.bin: the uncompressed chunks, one after the other, stored
+        time-major (one record of nChannels float64 per sample)
+      - chunks/NNNNNN.npz: the compressed chunk NNNNNN, if any
+      - index.bin: one fixed-size record (CHUNK_RECORD) per chunk, with
+        its first sample index, number of samples, host timestamp and
+        offset in data.bin (-1 for compressed chunks)
+      - metadata.json: channel names, time step, data recorder
+        configuration and calibration, written once at creation
+
+    A chunk record is appended to index.bin after the chunk data has
+    been written, so that a reader (see refresh()) always sees complete
+    chunks, even while an acquisition is appending to the archive, and
+    the cost of appending a chunk doesn't grow with the archive. A
+    record truncated by a crash is ignored, and dropped when the archive
+    is opened for appending.
+    Uncompressed chunks are returned as read-only views of a memory map:
+    nothing is loaded in RAM until the values are used.
+
+    The archive has the write(firstSampleIndex, block) and close()
+    methods of an acquisition sink (see acquisition_sink), blocks being
+    (nChannels, nSamples) arrays like the ones returned by
+    getRecordedDataValues.
+    '''
+
+    DATA_FILE= 'data.bin'
+    METADATA_FILE= 'metadata.json'
+    INDEX_FILE= 'index.bin'
+    CHUNKS_DIR= 'chunks'
+    FORMAT_VERSION= 2
+    DTYPE= np.float64
+    CHUNK_RECORD= np.dtype([('firstSample', '<i8'),
+                            ('nSamples', '<i8'),
+                            ('hostTime', '<f8'),
+                            ('offset', '<i8')])
+
+    def __init__(self, path, metadata, writable):
+        self._path= path
+        self._meta= metadata
+        self._writable= writable
+        self._dataFile= None
+        self._indexFile= None
+        self._memmap= None
+        self._chunks= self._readChunks()
+        if writable:
+            self._openFilesForAppend()
+
+
+    @classmethod
+    def create(cls,
+               path,
+               channelNames,
+               timeStepInSec=None,
+               dataRecorderCfg=None,
+               calibration=None,
+               compress=False):
+        '''
+        Create a new archive in the directory path
+
+        channelNames labels the rows of the blocks, e.g. the table ids
+        of dataRecorderCfg. calibration is a json-serializable dict,
+        like TipTiltConfiguration.calibration(). If the metadata cannot
+        be written nothing is left in path
+        '''
+        if os.path.exists(os.path.join(path, cls.METADATA_FILE)):
+            raise IOError("archive %s already exists" % path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        metadata= {
+            'formatVersion': cls.FORMAT_VERSION,
+            'channelNames': list(channelNames),
+            'timeStepInSec': timeStepInSec,
+            'dataRecorderConfiguration':
+                cls._dataRecorderCfgToList(dataRecorderCfg),
+            'calibration': calibration,
+            'compress': bool(compress),
+            'creationTime': time.time(),
+        }
+        cls._saveMetadata(path, metadata)
+        open(os.path.join(path, cls.DATA_FILE), 'wb').close()
+        open(os.path.join(path, cls.INDEX_FILE), 'wb').close()
+        return cls(path, metadata, writable=True)
+
+
+    @classmethod
+    def open(cls, path, append=False):
+        with open(os.path.join(path, cls.METADATA_FILE)) as f:
+            metadata= json.load(f)
+        assert metadata['formatVersion'] == cls.FORMAT_VERSION, \
+            "unsupported archive format %s" % metadata['formatVersion']
+        return cls(path, metadata, writable=append)
+
+
+    @staticmethod
+    def _dataRecorderCfgToList(cfg):
+        if cfg is None:
+            return None
+        return [list(table) for table in cfg.tables()]
+
+
+    @staticmethod
+    def _dataRecorderCfgFromList(tables):
+        if tables is None:
+            return None
+        return DataRecorderConfiguration(tables)
+
+
+    def _fileName(self, name):
+        return os.path.join(self._path, name)
+
+
+    def _committedBytes(self):
+        return self._numberOfStoredRecords() * self._recordSize()
+
+
+    def _recordSize(self):
+        return self.numberOfChannels() * np.dtype(self.DTYPE).itemsize
+
+
+    def _numberOfStoredRecords(self):
+        return sum(c['nSamples'] for c in self._chunks if 'file' not in c)
+
+
+    def _openFilesForAppend(self):
+        # drop what a previous writer left after its last committed chunk
+        self._indexFile= open(self._fileName(self.INDEX_FILE), 'r+b')
+        self._indexFile.truncate(len(self._chunks) *
+                                 self.CHUNK_RECORD.itemsize)
+        self._indexFile.seek(0, os.SEEK_END)
+        self._dataFile= open(self._fileName(self.DATA_FILE), 'r+b')
+        self._dataFile.truncate(self._committedBytes())
+        self._dataFile.seek(0, os.SEEK_END)
+
+
+    @classmethod
+    def _saveMetadata(cls, path, metadata):
+        fileName= os.path.join(path, cls.METADATA_FILE)
+        tmpFileName= fileName + '.tmp'
+        try:
+            with open(tmpFileName, 'w') as f:
+                json.dump(metadata, f)
+        except Exception:
+            os.remove(tmpFileName)
+            raise
+        getattr(os, 'replace', os.rename)(tmpFileName, fileName)
+
+
+    def _chunkFileName(self, index):
+        return os.path.join(self.CHUNKS_DIR, '%06d.npz' % index)
+
+
+    def _readChunks(self):
+        with open(self._fileName(self.INDEX_FILE), 'rb') as f:
+            raw= f.read()
+        nChunks= len(raw) // self.CHUNK_RECORD.itemsize
+        records= np.frombuffer(raw[:nChunks * self.CHUNK_RECORD.itemsize],
+                               dtype=self.CHUNK_RECORD)
+        chunks= []
+        for i, record in enumerate(records):
+            chunk= {'firstSample': int(record['firstSample']),
+                    'nSamples': int(record['nSamples']),
+                    'hostTime': float(record['hostTime'])}
+            if record['offset'] < 0:
+                chunk['file']= self._chunkFileName(i)
+            else:
+                chunk['offset']= int(record['offset'])
+            chunks.append(chunk)
+        return chunks
+
+
+    def _appendChunkRecord(self, chunk):
+        record= np.array([(chunk['firstSample'], chunk['nSamples'],
+                           chunk['hostTime'], chunk.get('offset', -1))],
+                         dtype=self.CHUNK_RECORD)
+        self._indexFile.write(record.tobytes())
+        self._indexFile.flush()
+
+
+    def path(self):
+        return self._path
+
+
+    def channelNames(self):
+        return list(self._meta['channelNames'])
+
+
+    def numberOfChannels(self):
+        return len(self._meta['channelNames'])
+
+
+    def timeStepInSec(self):
+        return self._meta['timeStepInSec']
+
+
+    def dataRecorderConfiguration(self):
+        return self._dataRecorderCfgFromList(
+            self._meta['dataRecorderConfiguration'])
+
+
+    def calibration(self):
+        return self._meta['calibration']
+
+
+    def numberOfChunks(self):
+        return len(self._chunks)
+
+
+    def numberOfSamples(self):
+        return sum(c['nSamples'] for c in self._chunks)
+
+
+    def chunkFirstSampleIndices(self):
+        return np.array([c['firstSample'] for c in self._chunks],
+                        dtype=int)
+
+
+    def chunkHostTimes(self):
+        return np.array([c['hostTime'] for c in self._chunks])
+
+
+    def append(self, block, firstSampleIndex=None, hostTime=None):
+        '''
+        Store a (nChannels, nSamples) block as a new chunk
+
+        firstSampleIndex defaults to the end of the previous chunk,
+        hostTime to the current time
+        '''
+        assert self._writable, "archive %s is read-only" % self._path
+        block= np.asarray(block, dtype=self.DTYPE)
+        assert block.ndim == 2 and block.shape[0] == self.numberOfChannels(),\
+            "block must have shape (%d, nSamples), got %s" % (
+                self.numberOfChannels(), block.shape)
+        if firstSampleIndex is None:
+            firstSampleIndex= self._nextSampleIndex()
+        if hostTime is None:
+            hostTime= time.time()
+        chunk= {'firstSample': int(firstSampleIndex),
+                'nSamples': int(block.shape[1]),
+                'hostTime': float(hostTime)}
+        if self._meta['compress']:
+            chunk['file']= self._writeCompressedChunk(block)
+        else:
+            chunk['offset']= self._dataFile.tell()
+            self._dataFile.write(np.ascontiguousarray(block.T).tobytes())
+            self._dataFile.flush()
+        self._appendChunkRecord(chunk)
+        self._chunks.append(chunk)
+        self._memmap= None
+
+
+    def _nextSampleIndex(self):
+        if not self._chunks:
+            return 0
+        last= self._chunks[-1]
+        return last['firstSample'] + last['nSamples']
+
+
+    def _writeCompressedChunk(self, block):
+        chunksDir= self._fileName(self.CHUNKS_DIR)
+        if not os.path.isdir(chunksDir):
+            os.makedirs(chunksDir)
+        name= self._chunkFileName(self.numberOfChunks())
+        with open(self._fileName(name), 'wb') as f:
+            np.savez_compressed(f, data=block)
+        return name
+
+
+    def write(self, firstSampleIndex, block):
+        self.append(block, firstSampleIndex)
+
+
+    def close(self):
+        if self._dataFile is not None:
+            self._dataFile.close()
+            self._dataFile= None
+        if self._indexFile is not None:
+            self._indexFile.close()
+            self._indexFile= None
+        self._writable= False
+        self._memmap= None
+
+
+    def refresh(self):
+        '''
+        Reload the chunk index to see the chunks appended by a writer
+        '''
+        assert not self._writable, "refresh() is meant for readers"
+        self._chunks= self._readChunks()
+        self._memmap= None
+
+
+    def _records(self):
+        '''
+        Read-only (nRecords, nChannels) memory map of data.bin
+        '''
+        if self._memmap is None:
+            nRecords= self._numberOfStoredRecords()
+            if nRecords == 0:
+                self._memmap= np.zeros((0, self.numberOfChannels()),
+                                       dtype=self.DTYPE)
+            else:
+                self._memmap= np.memmap(
+                    self._fileName(self.DATA_FILE), dtype=self.DTYPE,
+                    mode='r', shape=(nRecords, self.numberOfChannels()))
+        return self._memmap
+
+
+    def chunk(self, index):
+        '''
+        (nChannels, nSamples) values of chunk index
+
+        Uncompressed chunks are zero-copy views of the memory map,
+        compressed ones are decompressed on every call
+        '''
+        c= self._chunks[index]
+        if 'file' in c:
+            with np.load(self._fileName(c['file'])) as npz:
+                return npz['data']
+        first= c['offset'] // self._recordSize()
+        return self._records()[first: first + c['nSamples']].T
+
+
+    def data(self):
+        '''
+        (nChannels, numberOfSamples()) values of all the chunks
+
+        Without compressed chunks this is a zero-copy view of the
+        memory map. Sample k is not recorded at k * timeStepInSec if
+        the chunks are not contiguous, see chunkFirstSampleIndices()
+        '''
+        if not any('file' in c for c in self._chunks):
+            return self._records().T
+        nChunks= self.numberOfChunks()
+        if nChunks == 0:
+            return np.zeros((self.numberOfChannels(), 0))
+        return np.hstack([self.chunk(i) for i in range(nChunks)])
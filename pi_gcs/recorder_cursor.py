@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import numpy as np
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration
+
+
+__version__= "$Id: $"
+
+
+class RecorderCursor(object):
+    '''
+    Incremental reader of the data recorder
+
+    Remembers, for every record table, the next point to be read.
+    read() asks the controller how many points have been recorded so far
+    (DRL?) and fetches only the ones added since the previous read, so a
+    running recording can be monitored without downloading the whole
+    buffer each time. If a table holds fewer points than already read,
+    the recording has been restarted and the cursor rewinds to its
+    beginning.
+    '''
+
+    def __init__(self, controller, tableIds, startFromPoint=1):
+        if isinstance(tableIds, DataRecorderConfiguration):
+            tableIds= tableIds.getTableIds()
+        self._ctrl= controller
+        self._tableIds= [int(x) for x in np.atleast_1d(tableIds)]
+        self._nextPoint= OrderedDict()
+        self.reset(startFromPoint)
+
+
+    def reset(self, startFromPoint=1):
+        for tableId in self._tableIds:
+            self._nextPoint[tableId]= startFromPoint
+
+
+    def tableIds(self):
+        return list(self._tableIds)
+
+
+    def nextPoint(self, tableId):
+        return self._nextPoint[tableId]
+
+
+    def pointsPending(self):
+        recorded= self._ctrl.getNumberOfRecordedPoints(self._tableIds)
+        return OrderedDict(
+            (tableId, max(int(n) - self._nextPoint[tableId] + 1, 0))
+            for tableId, n in zip(self._tableIds, recorded))
+
+
+    def read(self, maxPoints=None):
+        '''
+        Return an OrderedDict tableId -> points recorded since last read
+
+        Tables with the same start point and number of new points are
+        read with a single getRecordedDataValues call
+        '''
+        recorded= self._ctrl.getNumberOfRecordedPoints(self._tableIds)
+        groups= OrderedDict()
+        for tableId, nRecorded in zip(self._tableIds, recorded):
+            if nRecorded < self._nextPoint[tableId] - 1:
+                self._nextPoint[tableId]= 1
+            start= self._nextPoint[tableId]
+            nNew= int(nRecorded) - start + 1
+            if maxPoints is not None:
+                nNew= min(nNew, maxPoints)
+            groups.setdefault((start, nNew), []).append(tableId)
+
+        ret= OrderedDict((tableId, None) for tableId in self._tableIds)
+        for (start, nNew), tableIds in groups.items():
+            if nNew <= 0:
+                values= np.zeros((len(tableIds), 0))
+            else:
+                values= self._ctrl.getRecordedDataValues(
+                    nNew, start, tableIds=tableIds)
+            for tableId, row in zip(tableIds, values):
+                ret[tableId]= row
+                self._nextPoint[tableId]= start + max(nNew, 0)
+        return ret
+
+
+    def readAligned(self, maxPoints=None):
+        '''
+        Read the same number of new points from every table
+
+        Returns the first point read and a (nTables, nNew) array, nNew
+        being the number of new points of the slowest table
+        '''
+        recorded= self._ctrl.getNumberOfRecordedPoints(self._tableIds)
+        start= self._nextPoint[self._tableIds[0]]
+        assert all(self._nextPoint[t] == start for t in self._tableIds), \
+            "tables are not aligned"
+        if np.min(recorded) < start - 1:
+            self.reset(1)
+            start= 1
+        nNew= max(int(np.min(recorded)) - start + 1, 0)
+        if maxPoints is not None:
+            nNew= min(nNew, maxPoints)
+        if nNew == 0:
+            return start, np.zeros((len(self._tableIds), 0))
+        values= self._ctrl.getRecordedDataValues(
+            nNew, start, tableIds=self._tableIds)
+        for tableId in self._tableIds:
+            self._nextPoint[tableId]= start + nNew
+        return start, values
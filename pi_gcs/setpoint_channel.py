@@ -0,0 +1,155 @@
+import threading
+import time
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+class CoalescingSetpointChannel(object):
+    '''
+    Latest-value-wins channel for the target position of a tip-tilt
+
+    post() stores the target and returns immediately. A sender thread
+    calls tipTilt.setTargetPosition() with the newest posted target:
+    the targets posted while a MOV is in flight are replaced by the
+    following ones and counted as dropped. Whatever the posting rate,
+    the newest target is on the controller within two MOV round trips.
+
+    Latency is measured from post() to the completion of the MOV that
+    sent the target. A target whose setTargetPosition() raised is
+    counted as failed, not as sent, and has no latency.
+    '''
+
+    def __init__(self, tipTilt, timeModule=time):
+        self._tipTilt= tipTilt
+        self._time= timeModule
+        self._condition= threading.Condition()
+        self._pending= None
+        self._pendingPostTime= None
+        self._posted= 0
+        self._sent= 0
+        self._failed= 0
+        self._dropped= 0
+        self._inFlight= False
+        self._lastLatency= None
+        self._maxLatency= None
+        self._latencySum= 0.
+        self._exception= None
+        self._closed= False
+        self._thread= threading.Thread(target=self._run)
+        self._thread.daemon= True
+        self._thread.start()
+
+
+    def post(self, positionInMilliRad):
+        with self._condition:
+            assert not self._closed, "channel closed"
+            if self._pending is not None:
+                self._dropped+= 1
+            self._pending= np.array(positionInMilliRad, dtype=float)
+            self._pendingPostTime= self._time.time()
+            self._posted+= 1
+            self._condition.notify_all()
+
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                target, postTime= self._pending, self._pendingPostTime
+                self._pending= None
+                self._inFlight= True
+            succeeded= True
+            try:
+                self._tipTilt.setTargetPosition(target)
+            except Exception as e:
+                self._exception= e
+                succeeded= False
+            with self._condition:
+                self._inFlight= False
+                if succeeded:
+                    self._sent+= 1
+                    self._updateLatency(self._time.time() - postTime)
+                else:
+                    self._failed+= 1
+                self._condition.notify_all()
+
+
+    def _updateLatency(self, latency):
+        self._lastLatency= latency
+        if self._maxLatency is None or latency > self._maxLatency:
+            self._maxLatency= latency
+        self._latencySum+= latency
+
+
+    def flush(self, timeoutInSec=None):
+        '''
+        Wait until the newest posted target has been sent
+
+        Returns False on timeout
+        '''
+        deadline= None
+        if timeoutInSec is not None:
+            deadline= self._time.time() + timeoutInSec
+        with self._condition:
+            while self._pending is not None or self._inFlight:
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining= deadline - self._time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+
+    def close(self, timeoutInSec=None):
+        '''
+        Send the pending target, if any, and stop the sender thread
+        '''
+        with self._condition:
+            self._closed= True
+            self._condition.notify_all()
+        self._thread.join(timeoutInSec)
+
+
+    def numberOfPosted(self):
+        return self._posted
+
+
+    def numberOfSent(self):
+        return self._sent
+
+
+    def numberOfFailed(self):
+        return self._failed
+
+
+    def numberOfDropped(self):
+        return self._dropped
+
+
+    def lastLatencyInSec(self):
+        return self._lastLatency
+
+
+    def maxLatencyInSec(self):
+        return self._maxLatency
+
+
+    def meanLatencyInSec(self):
+        with self._condition:
+            if self._sent == 0:
+                return None
+            return self._latencySum / self._sent
+
+
+    def exception(self):
+        '''
+        Last exception raised by setTargetPosition, if any
+        '''
+        return self._exception
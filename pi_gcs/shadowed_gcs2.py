@@ -0,0 +1,448 @@
+import time
+import numpy as np
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration
+from pi_gcs.command_batch import CommandBatch
+
+
+__version__= "$Id: $"
+
+
+class ShadowedGeneralCommandSet(object):
+    '''
+    Serve the getters of the state this client sets from a local copy
+
+    Wraps a GeneralCommandSet2 (or a fake): every successful setter of
+    servo mode (SVO), voltage limits (VMI/VMA), wave generator start
+    mode (WGO), wave table connections (WSL), table rates (WTR/RTR) and
+    data recorder configuration (DRC), called directly or through
+    executeCommandBatch, is recorded. The matching getters are served
+    locally when every requested value is known and younger than
+    maxAgeInSec (None: never expire, 0: always read the controller),
+    also when queued in a command batch before any setter. Missing or
+    stale values are read from the controller and recorded.
+
+    verify() re-reads all the shadowed values in one batch. Every other
+    method is forwarded to the wrapped controller.
+    '''
+
+    SVO= 'SVO'
+    VMI= 'VMI'
+    VMA= 'VMA'
+    WGO= 'WGO'
+    WSL= 'WSL'
+    WTR= 'WTR'
+    RTR= 'RTR'
+    DRC= 'DRC'
+
+    def __init__(self, controller, maxAgeInSec=None, timeModule=time):
+        self._ctrl= controller
+        self._maxAgeInSec= maxAgeInSec
+        self._time= timeModule
+        self.invalidate()
+
+
+    def __getattr__(self, name):
+        return getattr(self._ctrl, name)
+
+
+    def controller(self):
+        return self._ctrl
+
+
+    def setMaxAge(self, maxAgeInSec):
+        self._maxAgeInSec= maxAgeInSec
+
+
+    def maxAge(self):
+        return self._maxAgeInSec
+
+
+    def invalidate(self):
+        self._state= {}
+        self._complete= set()
+
+
+    def _store(self, name, keys, values, complete=False):
+        now= self._time.time()
+        entries= self._state.setdefault(name, {})
+        for k, v in zip(keys, values):
+            entries[k]= (v, now)
+        if complete:
+            self._complete.add(name)
+
+
+    def _isFresh(self, timestamp, now):
+        return self._maxAgeInSec is None or \
+            now - timestamp <= self._maxAgeInSec
+
+
+    def _lookup(self, name, keys):
+        entries= self._state.get(name, {})
+        now= self._time.time()
+        values= []
+        for k in keys:
+            if k not in entries or not self._isFresh(entries[k][1], now):
+                return None
+            values.append(entries[k][0])
+        return values
+
+
+    def _lookupAll(self, name):
+        if name not in self._complete:
+            return None
+        keys= sorted(self._state[name])
+        values= self._lookup(name, keys)
+        if values is None:
+            return None
+        return keys, values
+
+
+    def _broadcast(self, keys, values):
+        return np.broadcast_to(np.atleast_1d(values), (len(keys),))
+
+
+    def _channels(self, channels):
+        return [int(c) for c in np.atleast_1d(channels)]
+
+
+    def _axes(self, axesString):
+        return axesString.split()
+
+
+    def _waveGeneratorIds(self, nWaveGenerators=None):
+        if nWaveGenerators is None:
+            nWaveGenerators= self._ctrl.getNumberOfWaveGenerators()
+        return list(range(1, nWaveGenerators + 1))
+
+
+    def _recordSetServoControlMode(self, axesString, controlMode):
+        axes= self._axes(axesString)
+        self._store(self.SVO, axes, self._broadcast(axes, controlMode))
+
+
+    def _recordSetLowerVoltageLimit(self, channels, lowerVoltage):
+        channels= self._channels(channels)
+        self._store(self.VMI, channels,
+                    self._broadcast(channels, lowerVoltage))
+
+
+    def _recordSetUpperVoltageLimit(self, channels, upperVoltage):
+        channels= self._channels(channels)
+        self._store(self.VMA, channels,
+                    self._broadcast(channels, upperVoltage))
+
+
+    def _recordSetWaveGeneratorStartStopMode(self, startModeArray):
+        wgIds= self._waveGeneratorIds(len(startModeArray))
+        self._store(self.WGO, wgIds, startModeArray,
+                    complete=len(wgIds) == len(self._waveGeneratorIds()))
+
+
+    def _recordSetConnectionOfWaveTableToWaveGenerator(self,
+                                                       waveGeneratorsArray,
+                                                       waveTableIdsArray):
+        wgIds= self._channels(waveGeneratorsArray)
+        self._store(self.WSL, wgIds,
+                    self._broadcast(wgIds, waveTableIdsArray))
+
+
+    def _recordSetWaveGeneratorTableRate(
+            self, waveGeneratorTableRateInServoLoopCycles):
+        wgIds= self._waveGeneratorIds()
+        self._store(self.WTR, wgIds, self._broadcast(
+            wgIds, waveGeneratorTableRateInServoLoopCycles), complete=True)
+
+
+    def _recordSetRecordTableRate(self, recordTableRateInServoLoopCycles=1):
+        self._store(self.RTR, [0], [recordTableRateInServoLoopCycles],
+                    complete=True)
+
+
+    def _recordSetDataRecorderConfiguration(self, dataRecorderConfiguration,
+                                            complete=False):
+        tableIds= dataRecorderConfiguration.getTableIds()
+        self._store(self.DRC, tableIds,
+                    [(dataRecorderConfiguration.getRecordSource(t),
+                      dataRecorderConfiguration.getRecordOption(t))
+                     for t in tableIds],
+                    complete=complete)
+
+
+    def _recorder(self, methodName):
+        return getattr(self, '_record' + methodName[0].upper() +
+                       methodName[1:], None)
+
+
+    def connectTCPIP(self, hostname, port=50000):
+        self.invalidate()
+        self._ctrl.connectTCPIP(hostname, port)
+
+
+    def closeConnection(self):
+        self.invalidate()
+        self._ctrl.closeConnection()
+
+
+    def _knownAnswer(self, methodName, args):
+        '''
+        Result of the getter methodName(*args) served from the shadow,
+        None if some of the values are unknown or stale
+        '''
+        if methodName == 'getServoControlMode':
+            values= self._lookup(self.SVO, self._axes(args[0]))
+            return None if values is None else np.array(values, dtype=bool)
+        if methodName in ('getLowerVoltageLimit', 'getUpperVoltageLimit'):
+            name= self.VMI if methodName == 'getLowerVoltageLimit' \
+                else self.VMA
+            values= self._lookup(name, self._channels(args[0]))
+            return None if values is None else np.array(values, dtype=float)
+        if methodName == 'getConnectionOfWaveTableToWaveGenerator':
+            values= self._lookup(self.WSL, self._channels(args[0]))
+            return None if values is None else np.array(values, dtype=int)
+        if methodName in ('getWaveGeneratorStartStopMode',
+                          'getWaveGeneratorTableRate'):
+            name= self.WGO if methodName == 'getWaveGeneratorStartStopMode' \
+                else self.WTR
+            known= self._lookupAll(name)
+            return None if known is None else np.array(known[1])
+        if methodName == 'getRecordTableRate':
+            known= self._lookupAll(self.RTR)
+            return None if known is None else known[1][0]
+        if methodName == 'getDataRecorderConfiguration':
+            known= self._lookupAll(self.DRC)
+            if known is None:
+                return None
+            return DataRecorderConfiguration(
+                (tableId, source, option)
+                for tableId, (source, option) in zip(*known))
+        return None
+
+
+    def _splitBatch(self, batch):
+        '''
+        Batch of the items to send and the known results of the
+        queries that come before any setter, by query index
+        '''
+        toSend= CommandBatch(self._ctrl)
+        known= {}
+        queryIndex= 0
+        afterSetter= False
+        for item in batch.items():
+            if item.parser is None:
+                afterSetter= True
+                toSend.addItem(item)
+                continue
+            answer= None
+            if not afterSetter:
+                answer= self._knownAnswer(item.methodName, item.args)
+            if answer is None:
+                toSend.addItem(item)
+            else:
+                known[queryIndex]= answer
+            queryIndex+= 1
+        return toSend, known
+
+
+    def executeCommandBatch(self, batch):
+        '''
+        Execute batch, answering locally the shadowed queries that come
+        before any setter of the batch, e.g. the SVO? of a status poll.
+        The rest of the batch is sent in a single round trip
+        '''
+        toSend, known= self._splitBatch(batch)
+        try:
+            sent= []
+            if toSend.items():
+                sent= self._ctrl.executeCommandBatch(toSend)
+        except Exception:
+            # the batch may have been partially applied
+            self.invalidate()
+            raise
+        for item in batch.items():
+            recorder= self._recorder(item.methodName)
+            if recorder is not None:
+                recorder(*item.args)
+        sent= iter(sent)
+        return [known[i] if i in known else next(sent)
+                for i in range(batch.numberOfQueries())]
+
+
+    def commandBatch(self):
+        return CommandBatch(self)
+
+
+    def setServoControlMode(self, axesString, controlMode):
+        self._ctrl.setServoControlMode(axesString, controlMode)
+        self._recordSetServoControlMode(axesString, controlMode)
+
+
+    def getServoControlMode(self, axesString):
+        values= self._knownAnswer('getServoControlMode', (axesString,))
+        if values is None:
+            values= self._ctrl.getServoControlMode(axesString)
+            self._store(self.SVO, self._axes(axesString), values)
+        return np.array(values, dtype=bool)
+
+
+    def setLowerVoltageLimit(self, channels, lowerVoltage):
+        self._ctrl.setLowerVoltageLimit(channels, lowerVoltage)
+        self._recordSetLowerVoltageLimit(channels, lowerVoltage)
+
+
+    def getLowerVoltageLimit(self, channels):
+        values= self._knownAnswer('getLowerVoltageLimit', (channels,))
+        if values is None:
+            values= self._ctrl.getLowerVoltageLimit(channels)
+            self._store(self.VMI, self._channels(channels), values)
+        return np.array(values, dtype=float)
+
+
+    def setUpperVoltageLimit(self, channels, upperVoltage):
+        self._ctrl.setUpperVoltageLimit(channels, upperVoltage)
+        self._recordSetUpperVoltageLimit(channels, upperVoltage)
+
+
+    def getUpperVoltageLimit(self, channels):
+        values= self._knownAnswer('getUpperVoltageLimit', (channels,))
+        if values is None:
+            values= self._ctrl.getUpperVoltageLimit(channels)
+            self._store(self.VMA, self._channels(channels), values)
+        return np.array(values, dtype=float)
+
+
+    def setWaveGeneratorStartStopMode(self, startModeArray):
+        self._ctrl.setWaveGeneratorStartStopMode(startModeArray)
+        self._recordSetWaveGeneratorStartStopMode(startModeArray)
+
+
+    def getWaveGeneratorStartStopMode(self):
+        values= self._knownAnswer('getWaveGeneratorStartStopMode', ())
+        if values is None:
+            values= self._ctrl.getWaveGeneratorStartStopMode()
+            self._store(self.WGO, self._waveGeneratorIds(len(values)),
+                        values, complete=True)
+        return np.array(values)
+
+
+    def setConnectionOfWaveTableToWaveGenerator(self,
+                                                waveGeneratorsArray,
+                                                waveTableIdsArray):
+        self._ctrl.setConnectionOfWaveTableToWaveGenerator(
+            waveGeneratorsArray, waveTableIdsArray)
+        self._recordSetConnectionOfWaveTableToWaveGenerator(
+            waveGeneratorsArray, waveTableIdsArray)
+
+
+    def getConnectionOfWaveTableToWaveGenerator(self, waveGeneratorsArray):
+        values= self._knownAnswer('getConnectionOfWaveTableToWaveGenerator',
+                                  (waveGeneratorsArray,))
+        if values is None:
+            values= self._ctrl.getConnectionOfWaveTableToWaveGenerator(
+                waveGeneratorsArray)
+            self._store(self.WSL, self._channels(waveGeneratorsArray),
+                        values)
+        return np.array(values, dtype=int)
+
+
+    def setWaveGeneratorTableRate(self,
+                                  waveGeneratorTableRateInServoLoopCycles,
+                                  interpolationType=None):
+        self._ctrl.setWaveGeneratorTableRate(
+            waveGeneratorTableRateInServoLoopCycles, interpolationType)
+        self._recordSetWaveGeneratorTableRate(
+            waveGeneratorTableRateInServoLoopCycles)
+
+
+    def getWaveGeneratorTableRate(self):
+        values= self._knownAnswer('getWaveGeneratorTableRate', ())
+        if values is None:
+            values= self._ctrl.getWaveGeneratorTableRate()
+            self._store(self.WTR, self._waveGeneratorIds(len(values)),
+                        values, complete=True)
+        return np.array(values)
+
+
+    def setRecordTableRate(self, recordTableRateInServoLoopCycles=1):
+        self._ctrl.setRecordTableRate(recordTableRateInServoLoopCycles)
+        self._recordSetRecordTableRate(recordTableRateInServoLoopCycles)
+
+
+    def getRecordTableRate(self):
+        rtr= self._knownAnswer('getRecordTableRate', ())
+        if rtr is None:
+            rtr= self._ctrl.getRecordTableRate()
+            self._recordSetRecordTableRate(rtr)
+        return rtr
+
+
+    def setDataRecorderConfiguration(self, dataRecorderConfiguration):
+        self._ctrl.setDataRecorderConfiguration(dataRecorderConfiguration)
+        self._recordSetDataRecorderConfiguration(dataRecorderConfiguration)
+
+
+    def getDataRecorderConfiguration(self):
+        cfg= self._knownAnswer('getDataRecorderConfiguration', ())
+        if cfg is None:
+            cfg= self._ctrl.getDataRecorderConfiguration()
+            self._recordSetDataRecorderConfiguration(cfg, complete=True)
+        return cfg
+
+
+    def _queueVerification(self, batch, name):
+        keys= sorted(self._state[name])
+        if name == self.SVO:
+            index= batch.getServoControlMode(' '.join(keys))
+        elif name == self.VMI:
+            index= batch.getLowerVoltageLimit(keys)
+        elif name == self.VMA:
+            index= batch.getUpperVoltageLimit(keys)
+        elif name == self.WSL:
+            index= batch.getConnectionOfWaveTableToWaveGenerator(keys)
+        elif name == self.WGO:
+            index= batch.getWaveGeneratorStartStopMode()
+            keys= None
+        elif name == self.WTR:
+            index= batch.getWaveGeneratorTableRate()
+            keys= None
+        elif name == self.RTR:
+            index= batch.getRecordTableRate()
+        elif name == self.DRC:
+            index= batch.getDataRecorderConfiguration()
+        return index, keys
+
+
+    def _actualValues(self, name, keys, result):
+        if name == self.RTR:
+            return [0], [result]
+        if name == self.DRC:
+            tableIds= result.getTableIds()
+            return tableIds, [(result.getRecordSource(t),
+                               result.getRecordOption(t)) for t in tableIds]
+        if keys is None:
+            keys= self._waveGeneratorIds(len(result))
+        return keys, list(result)
+
+
+    def verify(self):
+        '''
+        Re-read all the shadowed values in one batch
+
+        The local copy is updated with the values read. Returns a dict
+        {name: {key: (shadowValue, controllerValue)}} of the values
+        that differed (empty if the local copy was right)
+        '''
+        batch= self._ctrl.commandBatch()
+        pending= [(name,) + self._queueVerification(batch, name)
+                  for name in sorted(self._state)]
+        results= self._ctrl.executeCommandBatch(batch)
+        mismatches= {}
+        for name, index, keys in pending:
+            keys, values= self._actualValues(name, keys, results[index])
+            entries= self._state[name]
+            for k, v in zip(keys, values):
+                if k in entries and entries[k][0] != v:
+                    mismatches.setdefault(name, {})[k]= (entries[k][0], v)
+            self._store(name, keys, values,
+                        complete=name in self._complete or
+                        name in (self.WGO, self.WTR, self.RTR, self.DRC))
+        return mismatches
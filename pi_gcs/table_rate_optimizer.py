@@ -0,0 +1,81 @@
+from collections import namedtuple
+import numpy as np
+from pi_gcs.gcs2 import WaveformGenerator
+from pi_gcs.periodicity import divisors
+
+
+__version__= "$Id: $"
+
+
+TableRateChoice= namedtuple(
+    'TableRateChoice',
+    ['factor', 'interpolationType', 'trajectories', 'maxError'])
+
+
+def resample(trajectory, factor):
+    '''
+    One point every factor points of the trajectory, whose length must
+    be a multiple of factor
+    '''
+    trajectory= np.asarray(trajectory, dtype=float)
+    assert len(trajectory) % factor == 0, \
+        "length %d is not a multiple of %d" % (len(trajectory), factor)
+    return trajectory[::factor]
+
+
+def reconstruct(table, factor, interpolationType):
+    '''
+    Output of a wave generator playing table in loop with a table rate
+    factor times slower, one value per original point
+
+    With linear interpolation the last point of the table is joined to
+    the first one, as the table is played in loop
+    '''
+    table= np.asarray(table, dtype=float)
+    if factor == 1:
+        return table.copy()
+    if interpolationType == WaveformGenerator.NO_INTERPOLATION:
+        return np.repeat(table, factor)
+    assert interpolationType == WaveformGenerator.LINEAR_INTERPOLATION, \
+        "unknown interpolation type %s" % interpolationType
+    n= len(table)
+    return np.interp(np.arange(n * factor) / float(factor),
+                     np.arange(n + 1), np.append(table, table[:1]))
+
+
+def maxResamplingError(trajectory, factor, interpolationType):
+    trajectory= np.asarray(trajectory, dtype=float)
+    played= reconstruct(resample(trajectory, factor), factor,
+                        interpolationType)
+    return np.max(np.abs(played - trajectory))
+
+
+def optimizeTableRate(trajectories, maxError, maxFactor=None,
+                      interpolationTypes=(
+                          WaveformGenerator.LINEAR_INTERPOLATION,
+                          WaveformGenerator.NO_INTERPOLATION)):
+    '''
+    Largest table rate factor, and its interpolation, reproducing every
+    trajectory within maxError
+
+    The trajectories are played by wave generators sharing the table
+    rate, so the factor is a divisor of all their lengths (and at most
+    maxFactor). For each factor the interpolation types are tried in
+    the given order. Returns a TableRateChoice with the resampled
+    trajectories to upload; factor 1 (no resampling, no interpolation)
+    is always a valid choice
+    '''
+    trajectories= [np.asarray(t, dtype=float) for t in trajectories]
+    factors= [k for k in divisors(len(trajectories[0]))
+              if k > 1 and (maxFactor is None or k <= maxFactor) and
+              all(len(t) % k == 0 for t in trajectories)]
+    for factor in reversed(factors):
+        for interpolationType in interpolationTypes:
+            error= max(maxResamplingError(t, factor, interpolationType)
+                       for t in trajectories)
+            if error <= maxError:
+                return TableRateChoice(
+                    factor, interpolationType,
+                    [resample(t, factor) for t in trajectories], error)
+    return TableRateChoice(1, WaveformGenerator.NO_INTERPOLATION,
+                           trajectories, 0.)
@@ -1,71 +1,122 @@
+import time
 import numpy as np
 from pi_gcs.gcs2 import WaveformGenerator
 from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
     RecordOption
 from pi_gcs.abstract_tip_tilt_2_axes import AbstractTipTilt2Axis
+from pi_gcs.acquisition_sink import CallbackSink
+from pi_gcs.continuous_acquisition import ContinuousAcquisition
+from pi_gcs.tip_tilt_calibration import TipTiltCalibration
+from pi_gcs.tip_tilt_status import TipTiltStatus
+from pi_gcs.position_poller import PositionPoller
+from pi_gcs.wave_table_manager import WaveTableManager, \
+    NoSpareWaveTableError
+from pi_gcs.periodicity import commonPeriod, shortestPeriod
+from pi_gcs.table_rate_optimizer import optimizeTableRate
 
 __version__= "$Id: $"
 
 
+class _MilliRadSink(object):
+
+    def __init__(self, tipTilt, dataRecorderCfg, sink):
+        self._tipTilt= tipTilt
+        self._cfg= dataRecorderCfg
+        self._sink= sink
+
+
+    def write(self, firstSampleIndex, block):
+        self._sink.write(
+            firstSampleIndex,
+            self._tipTilt.convertRecordedDataToMilliRad(
+                block, self._cfg, out=block))
+
+
+    def close(self):
+        self._sink.close()
+
+
 class TipTilt2Axis(AbstractTipTilt2Axis):
 
     AXIS_A= "A"
     AXIS_B= "B"
+    AXIS_INDEX= {AXIS_A: 0, AXIS_B: 1}
     ALL_AXES= "A B"
     ALL_CHANNELS= [1, 2, 3]
+    WAVE_TABLE_IDS= [1, 2, 3]
+    WAVE_TABLE_MEMORY_IN_POINTS= None
+    WAVEFORM_UPLOAD_CHUNK_IN_POINTS= None
+    WAVEFORM_UPLOAD_DIFF= False
+    MAX_TABLE_RATE_FACTOR= None
+    BASE_TABLE_RATE= (1, WaveformGenerator.NO_INTERPOLATION)
 
     def __init__(self, piController, tipTiltConfiguration):
         self._ctrl= piController
         self._cfg= tipTiltConfiguration
+        self._calibration= None
+        self._calibrationRevision= None
 
         self._origTargetPosition= None
         self._modulationEnabled= False
         self._recordedDataTimeStep= None
-
+        self._dataRecorderCfg= None
+        self._poller= None
+        self._pollerMaxAge= None
+        self._waveTables= WaveTableManager(
+            self.WAVE_TABLE_IDS, clear=self._ctrl.clearWaveTableData)
+        self._modulationTables= []
+        self._baseTableRate= None
+        self._tableRate= None
 
 
     def setUp(self, enableControlLoop=True):
         self._connectController()
-        self._checkNumberOfChannels()
-        self._enableRemoteControlMode()
-        self._stopWaveformGenerators()
-        self._setVoltageLimits()
-        self.disableControlLoop()
-        self._configure3rdAxisAsPivot()
+        pivotAxis= self._checkConfigurationAndGetPivotAxis()
+        batch= self._ctrl.commandBatch()
+        batch.enableControlMode(self.ALL_CHANNELS)
+        batch.setWaveGeneratorStartStopMode([0, 0, 0])
+        batch.setLowerVoltageLimit(
+            self.ALL_CHANNELS, self._cfg.lowerVoltageLimit)
+        batch.setUpperVoltageLimit(
+            self.ALL_CHANNELS, self._cfg.upperVoltageLimit)
+        batch.setServoControlMode(self.ALL_AXES, [False, False])
+        batch.setServoControlMode(pivotAxis, [False])
+        batch.setOpenLoopAxisValue(pivotAxis, self._cfg.pivotValue)
         if enableControlLoop:
-            self.enableControlLoop()
+            batch.setServoControlMode(self.ALL_AXES, [True, True])
+        batch.execute()
 
 
     def _connectController(self):
         self._ctrl.connectTCPIP(self._cfg.hostname)
+        self._ctrl.prefetchStaticProperties()
+        self._waveTables.invalidate()
+        self._waveTables.setTotalPoints(self._waveTableMemoryInPoints())
+        self._baseTableRate= None
+        self._tableRate= None
 
 
-    def _checkNumberOfChannels(self):
-        assert 3 == self._ctrl.getNumberOfInputSignalChannels()
-        assert 3 == self._ctrl.getNumberOfOutputSignalChannels()
+    def _waveTableMemoryInPoints(self):
+        '''
+        WAVE_TABLE_MEMORY_IN_POINTS or, if None, the wave memory of the
+        controller, shared by the tables: the largest WMS? answer
+        '''
+        if self.WAVE_TABLE_MEMORY_IN_POINTS is not None:
+            return self.WAVE_TABLE_MEMORY_IN_POINTS
+        return int(np.max(self._ctrl.getMaximumNumberOfWavePoints(
+            self.WAVE_TABLE_IDS)))
 
 
-    def _enableRemoteControlMode(self):
-        self._ctrl.enableControlMode(self.ALL_CHANNELS)
+    def _checkConfigurationAndGetPivotAxis(self):
+        assert 3 == self._ctrl.getNumberOfInputSignalChannels()
+        assert 3 == self._ctrl.getNumberOfOutputSignalChannels()
+        return self._ctrl.getAxesIdentifiers()[2]
 
 
     def _stopWaveformGenerators(self):
         self._ctrl.setWaveGeneratorStartStopMode([0, 0, 0])
 
 
-    def _setVoltageLimits(self):
-        self._ctrl.setLowerVoltageLimit(
-            self.ALL_CHANNELS, self._cfg.lowerVoltageLimit)
-        self._ctrl.setUpperVoltageLimit(
-            self.ALL_CHANNELS, self._cfg.upperVoltageLimit)
-
-
-    def _configure3rdAxisAsPivot(self):
-        pivotAxis= self._ctrl.getAxesIdentifiers()[2]
-        self._ctrl.setServoControlMode(pivotAxis, [False])
-        self._ctrl.setOpenLoopAxisValue(pivotAxis, self._cfg.pivotValue)
-
-
     def enableControlLoop(self):
         self._ctrl.setServoControlMode(self.ALL_AXES, [True, True])
 
@@ -78,48 +129,97 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
         return np.all(self._ctrl.getServoControlMode(self.ALL_AXES))
 
 
-    def _positionConversionCoefficients(self, axisName):
-        if axisName == self.AXIS_A:
-            offset= self._cfg.positionToMilliRadAxisAOffsetCoeff
-            linear= self._cfg.positionToMilliRadAxisALinearCoeff
-        elif axisName == self.AXIS_B:
-            offset= self._cfg.positionToMilliRadAxisBOffsetCoeff
-            linear= self._cfg.positionToMilliRadAxisBLinearCoeff
-        else:
-            raise KeyError("unknown axis %s")
-        return offset, linear
+    def calibration(self):
+        '''
+        TipTiltCalibration converting GCS units to milliradians
+
+        Built from the configuration, and built again when the
+        configuration changes, unless set with setCalibration()
+        '''
+        revision= self._cfg.positionToMilliRadRevision()
+        if self._calibration is None or \
+                self._calibrationRevision not in (None, revision):
+            self._calibration= TipTiltCalibration.fromConfiguration(self._cfg)
+            self._calibrationRevision= revision
+        return self._calibration
+
+
+    def setCalibration(self, calibration):
+        '''
+        Use calibration instead of the one of the configuration
+        '''
+        self._calibration= calibration
+        self._calibrationRevision= None
+
+
+    def _axisIndex(self, axisName):
+        try:
+            return self.AXIS_INDEX[axisName]
+        except KeyError:
+            raise KeyError("unknown axis %s" % axisName)
 
 
     def _gcsUnitsToMilliRadOneAxis(self, posInGcsUnits, axisName):
-        offset, linear= self._positionConversionCoefficients(axisName)
-        return linear * posInGcsUnits + offset
+        return self.calibration().axisGcsUnitsToMilliRad(
+            posInGcsUnits, self._axisIndex(axisName))
 
 
     def _gcsUnitsToMilliRad(self, positionInGcsUnits):
-        mradA= self._gcsUnitsToMilliRadOneAxis(positionInGcsUnits[0],
-                                               self.AXIS_A)
-        mradB= self._gcsUnitsToMilliRadOneAxis(positionInGcsUnits[1],
-                                               self.AXIS_B)
-        return np.array([mradA, mradB])
+        return self.calibration().gcsUnitsToMilliRad(positionInGcsUnits)
 
 
     def _milliRadToGcsUnitsOneAxis(self, posInMilliRad, axisName):
-        offset, linear= self._positionConversionCoefficients(axisName)
-        return (posInMilliRad - offset) / linear
+        return self.calibration().axisMilliRadToGcsUnits(
+            posInMilliRad, self._axisIndex(axisName))
 
 
     def _milliRadToGcsUnits(self, positionInMilliRad):
-        posA= self._milliRadToGcsUnitsOneAxis(positionInMilliRad[0],
-                                              self.AXIS_A)
-        posB= self._milliRadToGcsUnitsOneAxis(positionInMilliRad[1],
-                                              self.AXIS_B)
-        return np.array([posA, posB])
+        return self.calibration().milliRadToGcsUnits(positionInMilliRad)
 
 
     def getPosition(self):
+        poller= self._poller
+        if poller is not None and TipTiltStatus.POSITION in poller.fields():
+            sample= poller.latest(self._pollerMaxAge)
+            if sample is not None:
+                return sample[1]
         return self._gcsUnitsToMilliRad(self._ctrl.getPosition(self.ALL_AXES))
 
 
+    def startPositionPoller(self,
+                            periodInSec=0.01,
+                            maxAgeInSec=None,
+                            capacity=1000,
+                            fields=(TipTiltStatus.POSITION,)):
+        '''
+        Sample the position on a background PositionPoller
+
+        While the poller runs getPosition() returns its newest sample,
+        if younger than maxAgeInSec (2 periods by default), instead of
+        querying the controller. If fields does not include the
+        position, getPosition() always queries the controller
+        '''
+        assert self._poller is None, "position poller already started"
+        if maxAgeInSec is None:
+            maxAgeInSec= 2 * periodInSec
+        poller= PositionPoller(self, periodInSec, capacity, fields)
+        self._pollerMaxAge= maxAgeInSec
+        self._poller= poller
+        poller.start()
+        return poller
+
+
+    def positionPoller(self):
+        return self._poller
+
+
+    def stopPositionPoller(self):
+        if self._poller is not None:
+            poller= self._poller
+            self._poller= None
+            poller.stop()
+
+
     def getTargetPosition(self):
         return self._gcsUnitsToMilliRad(
             self._ctrl.getTargetPosition(self.ALL_AXES))
@@ -131,6 +231,14 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
             self._milliRadToGcsUnits(positionInMilliRad))
 
 
+    def setTargetPositionInGcsUnits(self, positionInGcsUnits):
+        '''
+        setTargetPosition without the conversion, for callers that
+        convert their setpoints in advance (see calibration())
+        '''
+        return self._ctrl.setTargetPosition(self.ALL_AXES, positionInGcsUnits)
+
+
     def getVoltages(self):
         return self._ctrl.getVoltages(self.ALL_CHANNELS)
 
@@ -142,7 +250,36 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
                                   centerInMilliRad):
         self._origTargetPosition= centerInMilliRad
         self.stopModulation()
-
+        self._setTableRate(*self.BASE_TABLE_RATE)
+        self._startWaveforms(*self._sinusoidalWaveforms(
+            radiusInMilliRad, frequencyInHz, phasesInRadians,
+            centerInMilliRad))
+
+
+    def switchSinusoidalModulation(self,
+                                   radiusInMilliRad,
+                                   frequencyInHz,
+                                   phasesInRadians,
+                                   centerInMilliRad):
+        '''
+        Like startSinusoidalModulation, but without stopping the running
+        modulation: see switchFreeformModulation
+        '''
+        self._origTargetPosition= centerInMilliRad
+        if self._tableRate != self.BASE_TABLE_RATE:
+            self.startSinusoidalModulation(radiusInMilliRad, frequencyInHz,
+                                           phasesInRadians, centerInMilliRad)
+            return
+        self._switchWaveforms(*self._sinusoidalWaveforms(
+            radiusInMilliRad, frequencyInHz, phasesInRadians,
+            centerInMilliRad))
+
+
+    def _sinusoidalWaveforms(self,
+                             radiusInMilliRad,
+                             frequencyInHz,
+                             phasesInRadians,
+                             centerInMilliRad):
         assert np.ptp(self._ctrl.getWaveGeneratorTableRate()) == 0, \
             "wave generator table rate must be the same for every table"
         wgtr= self._ctrl.getWaveGeneratorTableRate()[0]
@@ -159,13 +296,12 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
 #         startPoint= np.array([0, 0.25])* wavelengthOfTheSineCurveInPoints
 #         curveCenterPoint= 0.5* wavelengthOfTheSineCurveInPoints
 
-        self._ctrl.clearWaveTableData([1, 2, 3])
-        self._setSinusoidalWaveform(1, timestep, radiusInMilliRad[0],
-                                    frequencyInHz, phasesInRadians[0],
-                                    centerInMilliRad[0])
-        self._setSinusoidalWaveform(2, timestep, radiusInMilliRad[1],
-                                    frequencyInHz, phasesInRadians[1],
-                                    centerInMilliRad[1])
+        waveformA= self._sinusoidalWaveform(
+            self.AXIS_A, timestep, radiusInMilliRad[0], frequencyInHz,
+            phasesInRadians[0], centerInMilliRad[0])
+        waveformB= self._sinusoidalWaveform(
+            self.AXIS_B, timestep, radiusInMilliRad[1], frequencyInHz,
+            phasesInRadians[1], centerInMilliRad[1])
 #         self._ctrl.setSinusoidalWaveform(
 #             1, WaveformGenerator.CLEAR, lengthInPoints,
 #             amplitudeOfTheSineCurve[0], offsetOfTheSineCurve[0],
@@ -174,24 +310,122 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
 #             2, WaveformGenerator.CLEAR, lengthInPoints,
 #             amplitudeOfTheSineCurve[1], offsetOfTheSineCurve[1],
 #             wavelengthOfTheSineCurveInPoints, startPoint[1], curveCenterPoint)
-        self._ctrl.setConnectionOfWaveTableToWaveGenerator([1, 2], [1, 2])
+        return waveformA, waveformB
+
+
+    def waveTableManager(self):
+        return self._waveTables
+
+
+    def _setTableRate(self, factor, interpolationType):
+        '''
+        Play the wave tables factor times slower than the table rate
+        found on the controller before the first change
+        '''
+        if self._baseTableRate is None:
+            tableRates= self._ctrl.getWaveGeneratorTableRate()
+            assert np.ptp(tableRates) == 0, \
+                "wave generator table rate must be the same for every table"
+            self._baseTableRate= int(tableRates[0])
+        if (factor, interpolationType) != self._tableRate:
+            self._ctrl.setWaveGeneratorTableRate(
+                self._baseTableRate * factor, interpolationType)
+            self._tableRate= (factor, interpolationType)
+
+
+    def tableRate(self):
+        '''
+        (factor, interpolationType) of the running modulation, None if
+        the table rate was never set
+        '''
+        return self._tableRate
+
+
+    def _loadWaveforms(self, waveformA, waveformB):
+        '''
+        Load the (key, lengthInPoints, upload) waveforms of axis A and
+        B, uploading only the ones not already in a wave table
+        '''
+        keyA, lengthA, uploadA= waveformA
+        keyB, lengthB, uploadB= waveformB
+        residentB= self._waveTables.tableOf(keyB)
+        tableA= self._waveTables.load(
+            keyA, lengthA, uploadA,
+            excluded=() if residentB is None else (residentB,))
+        tableB= self._waveTables.load(keyB, lengthB, uploadB,
+                                      excluded=(tableA,))
+        return [tableA, tableB]
+
+
+    def _startWaveforms(self, waveformA, waveformB):
+        '''
+        Load the waveforms, then connect and start wave generators 1
+        and 2
+        '''
+        tables= self._loadWaveforms(waveformA, waveformB)
+        self._ctrl.setConnectionOfWaveTableToWaveGenerator([1, 2], tables)
         self._ctrl.setWaveGeneratorStartStopMode([1, 1, 0])
+        self._setModulationTables(tables)
         self._modulationEnabled= True
 
 
-    def _getAxisFromWaveTableId(self, waveTableId):
-        if waveTableId == 1:
-            return self.AXIS_A
-        elif waveTableId == 2:
-            return self.AXIS_B
-        else:
-            raise ValueError("Unknown waveTableId %d" % waveTableId)
-
-
-    def _setSinusoidalWaveform(self, waveTableId, timeStepInSec,
-                               amplitudeInMilliRad, frequencyInHz,
-                               phaseInRadians, offsetInMilliRad):
-        axisName= self._getAxisFromWaveTableId(waveTableId)
+    def _setModulationTables(self, tables):
+        self._modulationTables= list(tables)
+        self._waveTables.unpin()
+        self._waveTables.pin(tables)
+
+
+    def _switchWaveforms(self, waveformA, waveformB):
+        if not self._modulationEnabled:
+            self.stopModulation()
+            self._startWaveforms(waveformA, waveformB)
+            return
+        try:
+            # the running tables are pinned: the new waveforms go in
+            # spare tables
+            self._swapWaveTables(
+                [1, 2], self._loadWaveforms(waveformA, waveformB))
+            return
+        except NoSpareWaveTableError:
+            pass
+        try:
+            # not enough spare tables for both axes: one at a time
+            for generator, (key, length, upload) in ((1, waveformA),
+                                                     (2, waveformB)):
+                table= self._waveTables.load(key, length, upload)
+                self._swapWaveTables([generator], [table])
+        except NoSpareWaveTableError:
+            self._stopWaveformGenerators()
+            self._waveTables.unpin()
+            self._startWaveforms(waveformA, waveformB)
+
+
+    def _swapWaveTables(self, waveGenerators, tables):
+        '''
+        Connect the running waveGenerators to tables in one round trip
+
+        The generators keep their output index if the new tables have
+        the length of the old ones, so that the modulation keeps its
+        phase; otherwise they restart from the first point
+        '''
+        current= list(self._modulationTables)
+        newTables= list(current)
+        for generator, table in zip(waveGenerators, tables):
+            newTables[generator - 1]= table
+        restart= [self._waveTables.lengthOf(t) for t in newTables] != \
+            [self._waveTables.lengthOf(t) for t in current]
+        batch= self._ctrl.commandBatch()
+        batch.setConnectionOfWaveTableToWaveGenerator(waveGenerators, tables)
+        if restart:
+            batch.setWaveGeneratorStartStopMode([0, 0, 0])
+            batch.setWaveGeneratorStartStopMode([1, 1, 0])
+        batch.execute()
+        self._setModulationTables(newTables)
+
+
+    def _sinusoidalWaveform(self, axisName, timeStepInSec,
+                            amplitudeInMilliRad, frequencyInHz,
+                            phaseInRadians, offsetInMilliRad):
         periodInSec= 1./ frequencyInHz
         wgtr= self._ctrl.getWaveGeneratorTableRate()[0]
         timestep= self._ctrl.getServoUpdateTimeInSeconds() * wgtr
@@ -206,16 +440,23 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
         startPoint= phaseInRadians/ (2* np.pi) * \
             wavelengthOfTheSineCurveInPoints
         curveCenterPoint= 0.5* wavelengthOfTheSineCurveInPoints
-        self._ctrl.setSinusoidalWaveform(
-            waveTableId, WaveformGenerator.CLEAR, lengthInPoints,
-            amplitudeOfTheSineCurve, valleyOfTheSineCurve,
-            wavelengthOfTheSineCurveInPoints, startPoint, curveCenterPoint)
+        parameters= (lengthInPoints, amplitudeOfTheSineCurve,
+                     valleyOfTheSineCurve, wavelengthOfTheSineCurveInPoints,
+                     startPoint, curveCenterPoint)
+
+        def upload(waveTableId):
+            self._ctrl.setSinusoidalWaveform(
+                waveTableId, WaveformGenerator.CLEAR, *parameters)
+
+        return (WaveTableManager.contentKey('SIN', *parameters),
+                lengthInPoints, upload)
 
 
 
 
     def stopModulation(self):
         self._stopWaveformGenerators()
+        self._waveTables.unpin()
         self._modulationEnabled= False
         if self._origTargetPosition is not None:
             self.setTargetPosition(self._origTargetPosition)
@@ -226,44 +467,127 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
 
 
     def _defaultDataRecorderConfiguration(self):
-        dataRecorderCfg= DataRecorderConfiguration()
-        dataRecorderCfg.setTable(1, "A", RecordOption.REAL_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(2, "B", RecordOption.REAL_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(3, "A", RecordOption.POSITION_ERROR_OF_AXIS)
-        dataRecorderCfg.setTable(4, "B", RecordOption.POSITION_ERROR_OF_AXIS)
-        dataRecorderCfg.setTable(5, "A", RecordOption.TARGET_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(6, "B", RecordOption.TARGET_POSITION_OF_AXIS)
-        return dataRecorderCfg
+        return DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS),
+            (3, "A", RecordOption.POSITION_ERROR_OF_AXIS),
+            (4, "B", RecordOption.POSITION_ERROR_OF_AXIS),
+            (5, "A", RecordOption.TARGET_POSITION_OF_AXIS),
+            (6, "B", RecordOption.TARGET_POSITION_OF_AXIS)])
 
 
     def _configureDataRecoders(self, dataRecorderCfg=None):
         if dataRecorderCfg is None:
             dataRecorderCfg= self._defaultDataRecorderConfiguration()
         self._ctrl.setDataRecorderConfiguration(dataRecorderCfg)
+        self._dataRecorderCfg= dataRecorderCfg
 
 
     def getDataRecorderConfiguration(self):
         return self._ctrl.getDataRecorderConfiguration()
 
 
-    def _convertRecordedDataToMilliRad(self, recData):
-        ret= recData.copy()
-        recordOptionsToConvert= [RecordOption.TARGET_POSITION_OF_AXIS,
-                                 RecordOption.POSITION_ERROR_OF_AXIS,
-                                 RecordOption.REAL_POSITION_OF_AXIS]
-        cfg= self.getDataRecorderConfiguration()
-        ids= cfg.getTableIds()
-        for i in np.arange(len(ids)):
-            source= cfg.getRecordSource(ids[i])
-            option= cfg.getRecordOption(ids[i])
-            if option in recordOptionsToConvert:
-                ret[i]= self._gcsUnitsToMilliRadOneAxis(ret[i], source)
-        return ret
+    RECORD_OPTIONS_IN_GCS_UNITS= [RecordOption.TARGET_POSITION_OF_AXIS,
+                                  RecordOption.POSITION_ERROR_OF_AXIS,
+                                  RecordOption.REAL_POSITION_OF_AXIS]
+
+    def _positionRows(self, cfg):
+        '''
+        (row, axisIndex, recordOption) of the rows to be converted
+        '''
+        return [(i, self._axisIndex(cfg.getRecordSource(tableId)),
+                 cfg.getRecordOption(tableId))
+                for i, tableId in enumerate(cfg.getTableIds())
+                if cfg.getRecordOption(tableId) in
+                self.RECORD_OPTIONS_IN_GCS_UNITS]
+
+
+    def _milliRadConversionRuns(self, cfg):
+        '''
+        Runs of consecutive position rows, as (firstRow, lastRow + 1,
+        linear, offset) with per-row coefficients shaped to broadcast
+        over the points. Valid for uncoupled linear calibrations
+        '''
+        calibration= self.calibration()
+        linear= np.diag(calibration.matrix())
+        offset= calibration.offset()
+        runs= []
+        for i, axis, _ in self._positionRows(cfg):
+            if runs and runs[-1][1] == i:
+                runs[-1][1]= i + 1
+                runs[-1][2].append(axis)
+            else:
+                runs.append([i, i + 1, [axis]])
+        return [(first, last,
+                 linear[axes][:, np.newaxis], offset[axes][:, np.newaxis])
+                for first, last, axes in runs]
+
+
+    def _convertRecordedDataByRuns(self, recData, cfg, out):
+        copied= 0
+        for first, last, linear, offset in self._milliRadConversionRuns(cfg):
+            if out is not recData:
+                out[copied: first]= recData[copied: first]
+            np.multiply(recData[first: last], linear, out=out[first: last])
+            np.add(out[first: last], offset, out=out[first: last])
+            copied= last
+        if out is not recData:
+            out[copied:]= recData[copied:]
+
+
+    def _convertRecordedDataByAxesPairs(self, recData, cfg, out):
+        # A and B rows of the same option are converted together
+        if out is not recData:
+            out[...]= recData
+        calibration= self.calibration()
+        rowsOfOption= {}
+        for row, axis, option in self._positionRows(cfg):
+            rowsOfOption.setdefault(option, {})[axis]= row
+        for rows in rowsOfOption.values():
+            if len(rows) == 2:
+                pair= [rows[0], rows[1]]
+                out[pair]= calibration.gcsUnitsToMilliRad(recData[pair])
+            else:
+                for axis, row in rows.items():
+                    out[row]= calibration.axisGcsUnitsToMilliRad(
+                        recData[row], axis)
+
+
+    def convertRecordedDataToMilliRad(self, recData, dataRecorderCfg=None,
+                                      out=None):
+        '''
+        Convert the position rows of recData to milliradians
+
+        recData has one row per table of dataRecorderCfg (the
+        configuration of the last capture if None). The result is
+        written in out, that can be recData itself to convert in place.
+        Rows that are not positions are copied unchanged. With coupled
+        axes every position option must be recorded for both axes.
+        Raises ValueError if no configuration is given and nothing has
+        been captured yet
+        '''
+        if dataRecorderCfg is None:
+            dataRecorderCfg= self._dataRecorderCfg
+        if dataRecorderCfg is None:
+            raise ValueError(
+                "no data recorder configuration: pass dataRecorderCfg or "
+                "capture some data first")
+        if out is None:
+            out= np.empty(recData.shape)
+        assert out.shape == recData.shape, \
+            "out must have shape %s, got %s" % (recData.shape, out.shape)
+        calibration= self.calibration()
+        if calibration.isUncoupled() and calibration.isLinear():
+            self._convertRecordedDataByRuns(recData, dataRecorderCfg, out)
+        else:
+            self._convertRecordedDataByAxesPairs(recData, dataRecorderCfg,
+                                                 out)
+        return out
 
 
-    def getRecordedData(self, howManyPoints, dataRecorderCfg=None):
+    def getRecordedData(self, howManyPoints, dataRecorderCfg=None, out=None):
         self._startDataRecorder(dataRecorderCfg)
-        return self._retrieveRecordedData(howManyPoints)
+        return self._retrieveRecordedData(howManyPoints, out)
 
 
     def _startDataRecorder(self, dataRecorderCfg=None):
@@ -279,47 +603,209 @@ class TipTilt2Axis(AbstractTipTilt2Axis):
         return self._recordedDataTimeStep
 
 
-    def _retrieveRecordedData(self, howManyPoints):
-        timeValues= np.arange(howManyPoints) * self.getRecordedDataTimeStep()
-        recDataGcs= self._ctrl.getRecordedDataValues(howManyPoints, 1)
-        recDataMilliRad= self._convertRecordedDataToMilliRad(recDataGcs)
-        return np.vstack((timeValues, recDataMilliRad))
+    def _retrieveRecordedData(self, howManyPoints, out=None):
+        shape= (len(self._dataRecorderCfg) + 1, howManyPoints)
+        if out is None:
+            out= np.empty(shape)
+        assert out.shape == shape, \
+            "out must have shape %s, got %s" % (shape, out.shape)
+        np.multiply(np.arange(howManyPoints), self.getRecordedDataTimeStep(),
+                    out=out[0])
+        values= out[1:]
+        recData= self._ctrl.getRecordedDataValues(
+            howManyPoints, 1, out=values, tableIds=self._dataRecorderCfg)
+        self.convertRecordedDataToMilliRad(recData, out=values)
+        return out
+
+
+    def continuousAcquisition(self, sink, recorderLengthInPoints,
+                              dataRecorderCfg=None, **kwds):
+        '''
+        Configure the recorder and return a ContinuousAcquisition
+
+        The blocks are converted to milliradians before reaching sink.
+        Call start() or run() on the returned object to acquire
+        '''
+        if not hasattr(sink, 'write'):
+            sink= CallbackSink(sink)
+        self._configureDataRecoders(dataRecorderCfg)
+        cfg= self._dataRecorderCfg
+        return ContinuousAcquisition(
+            self._ctrl, cfg, _MilliRadSink(self, cfg, sink),
+            recorderLengthInPoints, self.getRecordedDataTimeStep(), **kwds)
 
 
     def status(self):
-        status={}
-        status['POSITION']= self.getPosition()
-        status['TARGET']= self.getTargetPosition()
-        status['OUTPUT_VOLTAGE']= self.getVoltages()
-        status['CONTROL_LOOP_CLOSED']= self.isControlLoopEnabled()
-        status['OVERFLOW']= self._ctrl.getOverflowState(self.ALL_AXES)
+        return self.statusSnapshot().asDict()
+
+
+    def statusSnapshot(self, fields=None):
+        '''
+        Read the requested TipTiltStatus fields (all by default) in a
+        single round trip to the controller
+        '''
+        if fields is None:
+            fields= TipTiltStatus.ALL_FIELDS
+        for field in fields:
+            assert field in TipTiltStatus.ALL_FIELDS, \
+                "unknown status field %s" % field
+        batch= self._ctrl.commandBatch()
+        queries= []
+        for field in TipTiltStatus.ALL_FIELDS:
+            if field in fields:
+                queries.append(field)
+                self._addStatusQuery(batch, field)
+        t0= time.time()
+        answers= batch.execute()
+        t1= time.time()
+        status= TipTiltStatus(0.5 * (t0 + t1), queries)
+        for field, answer in zip(queries, answers):
+            self._setStatusField(status, field, answer)
         return status
 
 
-    def _setUserDefinedWaveform(self, tableId, axisTrajectoryInMilliRad):
-        axisName= self._getAxisFromWaveTableId(tableId)
-        self._ctrl.setUserDefinedWaveform(
-            tableId,
-            1,
-            len(axisTrajectoryInMilliRad),
-            WaveformGenerator.CLEAR,
-            self._milliRadToGcsUnitsOneAxis(
-                axisTrajectoryInMilliRad,
-                axisName))
-
-
-    def startFreeformModulation(self, axisATrajectory, axisBTrajectory):
+    def _addStatusQuery(self, batch, field):
+        if field == TipTiltStatus.POSITION:
+            batch.getPosition(self.ALL_AXES)
+        elif field == TipTiltStatus.TARGET:
+            batch.getTargetPosition(self.ALL_AXES)
+        elif field == TipTiltStatus.OUTPUT_VOLTAGE:
+            batch.getVoltages(self.ALL_CHANNELS)
+        elif field == TipTiltStatus.CONTROL_LOOP_CLOSED:
+            batch.getServoControlMode(self.ALL_AXES)
+        elif field == TipTiltStatus.OVERFLOW:
+            batch.getOverflowState(self.ALL_AXES)
+
+
+    def _setStatusField(self, status, field, answer):
+        if field == TipTiltStatus.POSITION:
+            status.position= self._gcsUnitsToMilliRad(answer)
+        elif field == TipTiltStatus.TARGET:
+            status.target= self._gcsUnitsToMilliRad(answer)
+        elif field == TipTiltStatus.OUTPUT_VOLTAGE:
+            status.outputVoltage= np.asarray(answer)
+        elif field == TipTiltStatus.CONTROL_LOOP_CLOSED:
+            status.controlLoopClosed= np.all(answer)
+        elif field == TipTiltStatus.OVERFLOW:
+            status.overflow= np.asarray(answer)
+
+
+    def _setUserDefinedWaveform(self, tableId, axisTrajectoryInGcsUnits):
+        self._ctrl.uploadUserDefinedWaveform(
+            tableId, axisTrajectoryInGcsUnits,
+            chunkSizeInPoints=self.WAVEFORM_UPLOAD_CHUNK_IN_POINTS,
+            diff=self.WAVEFORM_UPLOAD_DIFF)
+
+
+    def _userDefinedWaveform(self, axisTrajectoryInGcsUnits):
+        trajectory= np.asarray(axisTrajectoryInGcsUnits, dtype=float)
+
+        def upload(waveTableId):
+            self._setUserDefinedWaveform(waveTableId, trajectory)
+
+        return (WaveTableManager.contentKey('PNT', trajectory),
+                len(trajectory), upload)
+
+
+    def _trajectoriesToGcsUnits(self, axisATrajectory, axisBTrajectory):
+        if len(axisATrajectory) == len(axisBTrajectory):
+            return self._milliRadToGcsUnits(
+                np.vstack((axisATrajectory, axisBTrajectory)))
+        return (self._milliRadToGcsUnitsOneAxis(axisATrajectory, self.AXIS_A),
+                self._milliRadToGcsUnitsOneAxis(axisBTrajectory, self.AXIS_B))
+
+
+    def _oneCommonPeriod(self, axisATrajectory, axisBTrajectory,
+                         toleranceInMilliRad=None):
+        '''
+        The first period of the trajectories, that of equal length are
+        cut to their common period to keep the axes in phase
+        '''
+        if len(axisATrajectory) == len(axisBTrajectory):
+            period= commonPeriod([axisATrajectory, axisBTrajectory],
+                                 toleranceInMilliRad)
+            return axisATrajectory[:period], axisBTrajectory[:period]
+        return (
+            axisATrajectory[:shortestPeriod(axisATrajectory,
+                                            toleranceInMilliRad)],
+            axisBTrajectory[:shortestPeriod(axisBTrajectory,
+                                            toleranceInMilliRad)])
+
+
+    def _freeformWaveforms(self, axisATrajectory, axisBTrajectory,
+                           uploadOnePeriod, maxResamplingErrorInMilliRad,
+                           periodToleranceInMilliRad):
+        '''
+        Waveforms of axis A and B and the (factor, interpolationType) of
+        the table rate to play them with
+        '''
+        if uploadOnePeriod:
+            axisATrajectory, axisBTrajectory= self._oneCommonPeriod(
+                axisATrajectory, axisBTrajectory, periodToleranceInMilliRad)
+        tableRate= self.BASE_TABLE_RATE
+        if maxResamplingErrorInMilliRad is not None:
+            choice= optimizeTableRate(
+                [axisATrajectory, axisBTrajectory],
+                maxResamplingErrorInMilliRad,
+                maxFactor=self.MAX_TABLE_RATE_FACTOR)
+            axisATrajectory, axisBTrajectory= choice.trajectories
+            tableRate= (choice.factor, choice.interpolationType)
+        gcsA, gcsB= self._trajectoriesToGcsUnits(axisATrajectory,
+                                                 axisBTrajectory)
+        return (self._userDefinedWaveform(gcsA),
+                self._userDefinedWaveform(gcsB), tableRate)
+
+
+    def startFreeformModulation(self, axisATrajectory, axisBTrajectory,
+                                uploadOnePeriod=False,
+                                maxResamplingErrorInMilliRad=None,
+                                periodToleranceInMilliRad=None):
+        '''
+        Play the trajectories (in milliradians) in loop
+
+        If uploadOnePeriod, trajectories made of repetitions of a
+        shorter pattern are uploaded as one repetition: the motion is
+        the same, but wave table memory and upload time scale with the
+        period. The repetitions may differ by periodToleranceInMilliRad
+        (by default a negligible fraction of the largest value, see
+        periodicity.RELATIVE_TOLERANCE), e.g. for trajectories computed
+        with float rounding or measured
+
+        If maxResamplingErrorInMilliRad is given, the trajectories are
+        uploaded with one point every k and played k times slower, with
+        the wave generator interpolation, choosing the largest k that
+        reproduces them within that error (see optimizeTableRate)
+        '''
         self.stopModulation()
-
-        assert np.ptp(self._ctrl.getWaveGeneratorTableRate()) == 0, \
-            "wave generator table rate must be the same for every table"
-
-        self._ctrl.clearWaveTableData([1, 2, 3])
-        self._setUserDefinedWaveform(1, axisATrajectory)
-        self._setUserDefinedWaveform(2, axisBTrajectory)
-        self._ctrl.setConnectionOfWaveTableToWaveGenerator([1, 2], [1, 2])
-        self._ctrl.setWaveGeneratorStartStopMode([1, 1, 0])
-        self._modulationEnabled= True
+        waveformA, waveformB, tableRate= self._freeformWaveforms(
+            axisATrajectory, axisBTrajectory, uploadOnePeriod,
+            maxResamplingErrorInMilliRad, periodToleranceInMilliRad)
+        self._setTableRate(*tableRate)
+        self._startWaveforms(waveformA, waveformB)
+
+
+    def switchFreeformModulation(self, axisATrajectory, axisBTrajectory,
+                                 uploadOnePeriod=False,
+                                 maxResamplingErrorInMilliRad=None,
+                                 periodToleranceInMilliRad=None):
+        '''
+        Switch to a new freeform modulation without stopping the
+        running one
+
+        The new trajectories are uploaded in spare wave tables while
+        the current ones play, then the wave generators are connected to
+        them with a single WSL. If there is only one spare table the axes
+        are switched one after the other. Without spare tables, if
+        no modulation is running or if the new trajectories need another
+        table rate, this is startFreeformModulation
+        '''
+        waveformA, waveformB, tableRate= self._freeformWaveforms(
+            axisATrajectory, axisBTrajectory, uploadOnePeriod,
+            maxResamplingErrorInMilliRad, periodToleranceInMilliRad)
+        if tableRate != self._tableRate:
+            self.stopModulation()
+            self._setTableRate(*tableRate)
+        self._switchWaveforms(waveformA, waveformB)
 
 
     def setOpenLoopValue(self, openLoopValue):
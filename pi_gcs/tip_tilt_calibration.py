@@ -0,0 +1,157 @@
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+class TipTiltCalibration(object):
+    '''
+    Conversion between GCS units and milliradians of a 2 axes tip-tilt
+
+        mrad = matrix . (p_A(gcs_A), p_B(gcs_B)) + offset
+
+    where matrix is a 2x2 cross-coupling matrix and p_A, p_B are
+    optional per-axis polynomials (coefficients highest power first, as
+    in np.polyval) applied before the coupling. The matrix inverse is
+    computed once. Inverting a polynomial requires Newton iterations,
+    so the polynomials must be monotonic over the range of use.
+
+    Positions are (2, ...) arrays, e.g. a (2, N) recorder block or a
+    (N, 2) trajectory passed as trajectory.T
+    '''
+
+    NEWTON_MAX_ITERATIONS= 50
+    NEWTON_TOLERANCE= 1e-12
+
+    def __init__(self, matrix=None, offset=(0., 0.), polynomials=None):
+        if matrix is None:
+            matrix= np.eye(2)
+        self._matrix= np.array(matrix, dtype=float)
+        assert self._matrix.shape == (2, 2), \
+            "matrix must be 2x2, got %s" % (self._matrix.shape,)
+        self._inverse= np.linalg.inv(self._matrix)
+        self._offset= np.array(offset, dtype=float).reshape(2, 1)
+        if polynomials is None:
+            self._polynomials= None
+        else:
+            assert len(polynomials) == 2, "one polynomial per axis"
+            self._polynomials= [np.array(p, dtype=float)
+                                for p in polynomials]
+            self._derivatives= [np.polyder(p) for p in self._polynomials]
+
+
+    @classmethod
+    def fromConfiguration(cls, tipTiltConfiguration):
+        cfg= tipTiltConfiguration
+        matrix= cfg.positionToMilliRadMatrix
+        if matrix is None:
+            matrix= np.diag([cfg.positionToMilliRadAxisALinearCoeff,
+                             cfg.positionToMilliRadAxisBLinearCoeff])
+        return cls(matrix,
+                   [cfg.positionToMilliRadAxisAOffsetCoeff,
+                    cfg.positionToMilliRadAxisBOffsetCoeff],
+                   cfg.positionToMilliRadPolynomials)
+
+
+    def matrix(self):
+        return self._matrix
+
+
+    def offset(self):
+        return self._offset[:, 0]
+
+
+    def polynomials(self):
+        return self._polynomials
+
+
+    def isUncoupled(self):
+        return self._matrix[0, 1] == 0 and self._matrix[1, 0] == 0
+
+
+    def isLinear(self):
+        return self._polynomials is None
+
+
+    def _asColumns(self, positions):
+        return np.asarray(positions, dtype=float).reshape(2, -1)
+
+
+    def _shapeLike(self, result, positions, out):
+        positions= np.asarray(positions)
+        result= result.reshape(positions.shape)
+        if out is None:
+            return result
+        out[...]= result
+        return out
+
+
+    def _polyval(self, values):
+        if self._polynomials is None:
+            return values
+        return np.vstack([np.polyval(p, v) for p, v in
+                          zip(self._polynomials, values)])
+
+
+    def _inversePolyval(self, values):
+        if self._polynomials is None:
+            return values
+        return np.vstack([self._solvePolynomial(p, d, v) for p, d, v in
+                          zip(self._polynomials, self._derivatives, values)])
+
+
+    def _solvePolynomial(self, polynomial, derivative, values):
+        x= values.copy()
+        for _ in range(self.NEWTON_MAX_ITERATIONS):
+            step= (np.polyval(polynomial, x) - values) / \
+                np.polyval(derivative, x)
+            x-= step
+            if np.all(np.abs(step) <= self.NEWTON_TOLERANCE *
+                      np.maximum(1., np.abs(x))):
+                break
+        return x
+
+
+    def gcsUnitsToMilliRad(self, positionsInGcsUnits, out=None):
+        values= self._asColumns(positionsInGcsUnits)
+        result= np.dot(self._matrix, self._polyval(values)) + self._offset
+        return self._shapeLike(result, positionsInGcsUnits, out)
+
+
+    def milliRadToGcsUnits(self, positionsInMilliRad, out=None):
+        values= self._asColumns(positionsInMilliRad)
+        result= self._inversePolyval(
+            np.dot(self._inverse, values - self._offset))
+        return self._shapeLike(result, positionsInMilliRad, out)
+
+
+    def _checkUncoupled(self):
+        if not self.isUncoupled():
+            raise ValueError("the axes of the calibration are coupled: "
+                             "convert both axes together")
+
+
+    def axisGcsUnitsToMilliRad(self, values, axisIndex):
+        '''
+        Convert the values of one axis. Valid only if the axes are
+        uncoupled
+        '''
+        self._checkUncoupled()
+        if self._polynomials is not None:
+            values= np.polyval(self._polynomials[axisIndex], values)
+        return self._matrix[axisIndex, axisIndex] * values + \
+            self._offset[axisIndex, 0]
+
+
+    def axisMilliRadToGcsUnits(self, values, axisIndex):
+        '''
+        Inverse of axisGcsUnitsToMilliRad
+        '''
+        self._checkUncoupled()
+        values= (values - self._offset[axisIndex, 0]) / \
+            self._matrix[axisIndex, axisIndex]
+        if self._polynomials is None:
+            return values
+        return self._solvePolynomial(self._polynomials[axisIndex],
+                                     self._derivatives[axisIndex],
+                                     np.array(values, dtype=float))
@@ -16,6 +16,8 @@ class TipTiltConfiguration():
         'positionToMilliRadAxisBLinearCoeff'
     POSITION_TO_MILLIRAD_AXIS_B_OFFSET_COEFF= \
         'positionToMilliRadAxisBOffsetCoeff'
+    POSITION_TO_MILLIRAD_MATRIX= 'positionToMilliRadMatrix'
+    POSITION_TO_MILLIRAD_POLYNOMIALS= 'positionToMilliRadPolynomials'
 
     def __init__(self):
         self._calib= {}
@@ -27,12 +29,37 @@ class TipTiltConfiguration():
         self._calib[self.POSITION_TO_MILLIRAD_AXIS_A_OFFSET_COEFF]= 0.0
         self._calib[self.POSITION_TO_MILLIRAD_AXIS_B_LINEAR_COEFF]= 1.0
         self._calib[self.POSITION_TO_MILLIRAD_AXIS_B_OFFSET_COEFF]= 0.0
+        self._calib[self.POSITION_TO_MILLIRAD_MATRIX]= None
+        self._calib[self.POSITION_TO_MILLIRAD_POLYNOMIALS]= None
+        self._positionToMilliRadRevision= 0
 
 
     def calibration(self):
         return self._calib
 
 
+    def positionToMilliRadRevision(self):
+        '''
+        Incremented by every setter of the position to milliradians
+        conversion, to tell whether a TipTiltCalibration built from
+        this configuration is still up to date
+        '''
+        return self._positionToMilliRadRevision
+
+
+    def _setPositionToMilliRad(self, key, value):
+        self._calib[key]= value
+        self._positionToMilliRadRevision+= 1
+
+
+    @staticmethod
+    def _listOfLists(value):
+        # plain floats keep calibration() json-serializable
+        if value is None:
+            return None
+        return [[float(x) for x in row] for row in value]
+
+
     @property
     def lowerVoltageLimit(self):
         return self._calib[self.LOWER_VOLTAGE_LIMIT]
@@ -65,7 +92,8 @@ class TipTiltConfiguration():
 
     @positionToMilliRadAxisALinearCoeff.setter
     def positionToMilliRadAxisALinearCoeff(self, value):
-        self._calib[self.POSITION_TO_MILLIRAD_AXIS_A_LINEAR_COEFF]= value
+        self._setPositionToMilliRad(
+            self.POSITION_TO_MILLIRAD_AXIS_A_LINEAR_COEFF, float(value))
 
 
     @property
@@ -75,7 +103,8 @@ class TipTiltConfiguration():
 
     @positionToMilliRadAxisAOffsetCoeff.setter
     def positionToMilliRadAxisAOffsetCoeff(self, value):
-        self._calib[self.POSITION_TO_MILLIRAD_AXIS_A_OFFSET_COEFF]= value
+        self._setPositionToMilliRad(
+            self.POSITION_TO_MILLIRAD_AXIS_A_OFFSET_COEFF, float(value))
 
 
     @property
@@ -85,7 +114,8 @@ class TipTiltConfiguration():
 
     @positionToMilliRadAxisBLinearCoeff.setter
     def positionToMilliRadAxisBLinearCoeff(self, value):
-        self._calib[self.POSITION_TO_MILLIRAD_AXIS_B_LINEAR_COEFF]= value
+        self._setPositionToMilliRad(
+            self.POSITION_TO_MILLIRAD_AXIS_B_LINEAR_COEFF, float(value))
 
 
     @property
@@ -95,7 +125,36 @@ class TipTiltConfiguration():
 
     @positionToMilliRadAxisBOffsetCoeff.setter
     def positionToMilliRadAxisBOffsetCoeff(self, value):
-        self._calib[self.POSITION_TO_MILLIRAD_AXIS_B_OFFSET_COEFF]= value
+        self._setPositionToMilliRad(
+            self.POSITION_TO_MILLIRAD_AXIS_B_OFFSET_COEFF, float(value))
 
 
+    @property
+    def positionToMilliRadMatrix(self):
+        '''
+        2x2 cross-coupling matrix. If None the matrix is diagonal with
+        the linear coefficients of axis A and B
+        '''
+        return self._calib[self.POSITION_TO_MILLIRAD_MATRIX]
+
+
+    @positionToMilliRadMatrix.setter
+    def positionToMilliRadMatrix(self, value):
+        self._setPositionToMilliRad(
+            self.POSITION_TO_MILLIRAD_MATRIX, self._listOfLists(value))
 
+
+    @property
+    def positionToMilliRadPolynomials(self):
+        '''
+        Per-axis polynomials applied to GCS units before the matrix,
+        highest power first. None for a linear calibration
+        '''
+        return self._calib[self.POSITION_TO_MILLIRAD_POLYNOMIALS]
+
+
+    @positionToMilliRadPolynomials.setter
+    def positionToMilliRadPolynomials(self, value):
+        self._setPositionToMilliRad(
+            self.POSITION_TO_MILLIRAD_POLYNOMIALS,
+            self._listOfLists(value))
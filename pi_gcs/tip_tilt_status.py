@@ -0,0 +1,51 @@
+__version__= "$Id: $"
+
+
+class TipTiltStatus(object):
+    '''
+    Snapshot of the state of a tip-tilt read in a single round trip
+
+    timestamp is the host time (time.time()) at the middle of the
+    round trip. fields lists the requested fields, the others are None.
+    Positions are in milliradians, voltages in Volt.
+    '''
+
+    POSITION= 'POSITION'
+    TARGET= 'TARGET'
+    OUTPUT_VOLTAGE= 'OUTPUT_VOLTAGE'
+    CONTROL_LOOP_CLOSED= 'CONTROL_LOOP_CLOSED'
+    OVERFLOW= 'OVERFLOW'
+
+    ALL_FIELDS= (POSITION, TARGET, OUTPUT_VOLTAGE, CONTROL_LOOP_CLOSED,
+                 OVERFLOW)
+
+    __slots__= ('timestamp', 'fields', 'position', 'target', 'outputVoltage',
+                'controlLoopClosed', 'overflow')
+
+    def __init__(self, timestamp, fields=ALL_FIELDS, position=None,
+                 target=None, outputVoltage=None, controlLoopClosed=None,
+                 overflow=None):
+        self.timestamp= timestamp
+        self.fields= tuple(fields)
+        self.position= position
+        self.target= target
+        self.outputVoltage= outputVoltage
+        self.controlLoopClosed= controlLoopClosed
+        self.overflow= overflow
+
+
+    def asDict(self):
+        '''
+        The requested fields, with the keys of TipTilt2Axis.status()
+        '''
+        values= {self.POSITION: self.position,
+                 self.TARGET: self.target,
+                 self.OUTPUT_VOLTAGE: self.outputVoltage,
+                 self.CONTROL_LOOP_CLOSED: self.controlLoopClosed,
+                 self.OVERFLOW: self.overflow}
+        return dict((k, values[k]) for k in self.fields)
+
+
+    def __repr__(self):
+        return 'TipTiltStatus(%s)' % ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
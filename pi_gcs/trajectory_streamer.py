@@ -0,0 +1,229 @@
+from collections import namedtuple
+import threading
+import time
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+StreamerStatistics= namedtuple('StreamerStatistics', [
+    'sentPoints', 'skippedPoints', 'overruns',
+    'meanJitterInSec', 'stdJitterInSec', 'maxJitterInSec'])
+
+
+class TrajectoryStreamer(object):
+    '''
+    Play a trajectory through setTargetPosition at a fixed rate
+
+    trajectoryInMilliRad is a (N, 2) array, converted to GCS units once
+    with the calibration of tipTilt and sent point by point with
+    TipTilt2Axis.setTargetPositionInGcsUnits. This is meant for the
+    trajectories that do not fit the wave tables or are computed while
+    playing: see append(). The points are kept in buffers that double
+    their size when full, so streaming a trajectory in small blocks
+    costs a time linear in its length.
+
+    The thread started by start() plays the points as they are
+    appended, waiting for more when the queue is empty, until stop() or
+    until the points queued before finish() are played. run() plays in
+    the calling thread and returns when the queue is empty.
+
+    Point k is due at start + k / rateInHz on the monotonic clock, so
+    the timing does not drift whatever the duration of each MOV. When
+    the streamer is late by one period or more (an overrun) the points
+    whose deadline has passed are skipped and the following one is sent
+    on time: the trajectory stays aligned to the clock instead of
+    stretching. sendTimes() holds the actual send time of each point
+    (nan for the skipped ones), jitter is send time minus deadline.
+    If the queue ran empty, the points appended later are not late:
+    the deadlines are shifted so that the next point is due when it is
+    appended, and the sending goes on at the same rate from there.
+    '''
+
+    def __init__(self, tipTilt, trajectoryInMilliRad, rateInHz,
+                 timeModule=time):
+        self._tipTilt= tipTilt
+        self._period= 1. / rateInHz
+        self._time= timeModule
+        self._clock= getattr(timeModule, 'monotonic', timeModule.time)
+        self._trajectory= np.zeros((0, 2))
+        self._sendTimes= np.zeros(0)
+        self._jitters= np.zeros(0)
+        self._length= 0
+        self._lock= threading.Lock()
+        self._nextPoint= 0
+        self._skipped= 0
+        self._overruns= 0
+        self._startTime= None
+        self._deadlineShift= 0.
+        self._starved= False
+        self._finished= False
+        self._thread= None
+        self._stopRequested= threading.Event()
+        self._appended= threading.Event()
+        self._exception= None
+        self.append(trajectoryInMilliRad)
+
+
+    def append(self, trajectoryInMilliRad):
+        '''
+        Queue more (N, 2) points after the current ones
+        '''
+        trajectory= np.asarray(trajectoryInMilliRad, dtype=float)
+        assert trajectory.ndim == 2 and trajectory.shape[1] == 2, \
+            "trajectory must have shape (N, 2), got %s" % (trajectory.shape,)
+        inGcsUnits= self._tipTilt.calibration().milliRadToGcsUnits(
+            trajectory.T).T
+        with self._lock:
+            assert not self._finished, "stream already finished"
+            newLength= self._length + len(inGcsUnits)
+            if newLength > len(self._trajectory):
+                self._grow(max(newLength, 2 * len(self._trajectory)))
+            self._trajectory[self._length:newLength]= inGcsUnits
+            self._length= newLength
+        self._appended.set()
+
+
+    def finish(self):
+        '''
+        No more points will be appended: the thread ends after playing
+        the queued ones
+        '''
+        with self._lock:
+            self._finished= True
+        self._appended.set()
+
+
+    def _grow(self, capacity):
+        trajectory= np.zeros((capacity, 2))
+        trajectory[:self._length]= self._trajectory[:self._length]
+        sendTimes= np.full(capacity, np.nan)
+        sendTimes[:self._length]= self._sendTimes[:self._length]
+        jitters= np.full(capacity, np.nan)
+        jitters[:self._length]= self._jitters[:self._length]
+        self._trajectory= trajectory
+        self._sendTimes= sendTimes
+        self._jitters= jitters
+
+
+    def numberOfPoints(self):
+        return self._length
+
+
+    def periodInSec(self):
+        return self._period
+
+
+    def sendTimes(self):
+        '''
+        Send time of each point relative to the start, nan if skipped
+        or not played yet
+        '''
+        with self._lock:
+            return self._sendTimes[:self._length].copy()
+
+
+    def exception(self):
+        return self._exception
+
+
+    def isDone(self):
+        return self._nextPoint >= self.numberOfPoints()
+
+
+    def _deadline(self, pointIndex):
+        return self._startTime + self._deadlineShift + \
+            pointIndex * self._period
+
+
+    def step(self):
+        '''
+        Wait for the deadline of the next point and send it
+
+        Returns False when there are no points left
+        '''
+        if self.isDone():
+            self._starved= self._startTime is not None
+            return False
+        if self._startTime is None:
+            self._startTime= self._clock()
+        now= self._clock()
+        if self._starved:
+            self._starved= False
+            self._deadlineShift+= max(now - self._deadline(self._nextPoint),
+                                      0.)
+        late= int((now - self._deadline(self._nextPoint)) // self._period)
+        if late >= 1:
+            late= min(late, self.numberOfPoints() - self._nextPoint)
+            self._overruns+= 1
+            self._skipped+= late
+            self._nextPoint+= late
+            if self.isDone():
+                return False
+        wait= self._deadline(self._nextPoint) - now
+        if wait > 0:
+            self._time.sleep(wait)
+        with self._lock:
+            point= self._trajectory[self._nextPoint].copy()
+        sendTime= self._clock()
+        self._tipTilt.setTargetPositionInGcsUnits(point)
+        with self._lock:
+            self._sendTimes[self._nextPoint]= sendTime - self._startTime
+            self._jitters[self._nextPoint]= \
+                sendTime - self._deadline(self._nextPoint)
+        self._nextPoint+= 1
+        return True
+
+
+    def statistics(self):
+        with self._lock:
+            jitter= self._jitters[:self._length]
+            jitter= jitter[np.isfinite(jitter)]
+        if len(jitter) == 0:
+            return StreamerStatistics(0, self._skipped, self._overruns,
+                                      None, None, None)
+        return StreamerStatistics(len(jitter), self._skipped,
+                                  self._overruns, jitter.mean(),
+                                  jitter.std(), jitter.max())
+
+
+    def _run(self, waitForPoints):
+        try:
+            while not self._stopRequested.is_set():
+                self._appended.clear()
+                if self.step():
+                    continue
+                if not waitForPoints or self._finished:
+                    return
+                self._appended.wait()
+        except Exception as e:
+            self._exception= e
+
+
+    def run(self):
+        self._stopRequested.clear()
+        self._run(False)
+        if self._exception is not None:
+            raise self._exception
+
+
+    def start(self):
+        assert self._thread is None or not self._thread.is_alive(), \
+            "streamer already started"
+        self._stopRequested.clear()
+        self._thread= threading.Thread(target=self._run, args=(True,))
+        self._thread.daemon= True
+        self._thread.start()
+
+
+    def stop(self, timeoutInSec=None):
+        self._stopRequested.set()
+        self._appended.set()
+        self.join(timeoutInSec)
+
+
+    def join(self, timeoutInSec=None):
+        if self._thread is not None:
+            self._thread.join(timeoutInSec)
+            self._thread= None
@@ -0,0 +1,192 @@
+import hashlib
+import itertools
+import numpy as np
+
+
+__version__= "$Id: $"
+
+
+class NoSpareWaveTableError(Exception):
+    '''
+    Every wave table is pinned or excluded
+    '''
+    pass
+
+
+class WaveTableManager(object):
+    '''
+    Keep track of the waveforms resident in the wave tables
+
+    Each waveform is identified by a content key (see contentKey()).
+    load() returns the table already holding the waveform, if any, and
+    uploads it otherwise, evicting the least recently used table when
+    there are no free tables or the total memory totalPoints would be
+    exceeded. Pinned tables, e.g. the ones connected to running wave
+    generators, are never evicted. An evicted table keeps its points
+    in the controller memory until it is written again: if it is not
+    reused for the waveform being loaded, clear(tableIds) is called,
+    e.g. the WCL of the controller, so that totalPoints stays true.
+
+    The manager only knows what has been loaded through it: call
+    invalidate() after reconnecting or after writing the wave tables
+    by other means.
+    '''
+
+    def __init__(self, waveTableIds, totalPoints=None, clear=None):
+        self._tableIds= list(waveTableIds)
+        self._totalPoints= totalPoints
+        self._clear= clear
+        self._clock= itertools.count()
+        self._hits= 0
+        self._uploads= 0
+        self._evictions= 0
+        self.invalidate()
+
+
+    @staticmethod
+    def contentKey(*parts):
+        '''
+        Hash of the waveform description: arrays and scalars, e.g. the
+        points in GCS units or the parameters of PI_WAV_SIN_P
+        '''
+        sha= hashlib.sha1()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                sha.update(str((part.dtype.str, part.shape)).encode())
+                sha.update(np.ascontiguousarray(part).tobytes())
+            else:
+                sha.update(repr(part).encode())
+            sha.update(b'|')
+        return sha.hexdigest()
+
+
+    def invalidate(self):
+        self._keyOfTable= {}
+        self._lengthOfTable= {}
+        self._lastUseOfTable= {}
+        self._pinned= set()
+
+
+    def tableOf(self, key):
+        for tableId, k in self._keyOfTable.items():
+            if k == key:
+                return tableId
+        return None
+
+
+    def residentKeys(self):
+        return dict(self._keyOfTable)
+
+
+    def lengthOf(self, tableId):
+        return self._lengthOfTable.get(tableId)
+
+
+    def usedPoints(self):
+        return sum(self._lengthOfTable.values())
+
+
+    def totalPoints(self):
+        return self._totalPoints
+
+
+    def setTotalPoints(self, totalPoints):
+        '''
+        Wave table memory, in points, shared by the tables. None for
+        no limit other than the number of tables
+        '''
+        self._totalPoints= totalPoints
+
+
+    def numberOfHits(self):
+        return self._hits
+
+
+    def numberOfUploads(self):
+        return self._uploads
+
+
+    def numberOfEvictions(self):
+        return self._evictions
+
+
+    def pin(self, tableIds):
+        self._pinned.update(tableIds)
+
+
+    def unpin(self, tableIds=None):
+        if tableIds is None:
+            self._pinned.clear()
+        else:
+            self._pinned.difference_update(tableIds)
+
+
+    def pinnedTables(self):
+        return set(self._pinned)
+
+
+    def _touch(self, tableId):
+        self._lastUseOfTable[tableId]= next(self._clock)
+
+
+    def _evict(self, tableId):
+        del self._keyOfTable[tableId]
+        del self._lengthOfTable[tableId]
+        del self._lastUseOfTable[tableId]
+        self._evictions+= 1
+
+
+    def _leastRecentlyUsed(self, excluded):
+        candidates= [t for t in self._keyOfTable
+                     if t not in self._pinned and t not in excluded]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda t: self._lastUseOfTable[t])
+
+
+    def _fits(self, lengthInPoints):
+        return self._totalPoints is None or \
+            self.usedPoints() + lengthInPoints <= self._totalPoints
+
+
+    def _freeTable(self, lengthInPoints, excluded):
+        free= [t for t in self._tableIds
+               if t not in self._keyOfTable and t not in excluded]
+        victims= []
+        while not free or not self._fits(lengthInPoints):
+            victim= self._leastRecentlyUsed(excluded)
+            if victim is None:
+                raise NoSpareWaveTableError(
+                    "no wave table available for %d points: tables %s "
+                    "are pinned or in use" % (
+                        lengthInPoints, sorted(self._keyOfTable)))
+            self._evict(victim)
+            free.append(victim)
+            victims.append(victim)
+        tableId= min(free)
+        notReused= [t for t in victims if t != tableId]
+        if notReused and self._clear is not None:
+            self._clear(notReused)
+        return tableId
+
+
+    def load(self, key, lengthInPoints, upload, excluded=()):
+        '''
+        Id of a table holding the waveform identified by key
+
+        If the waveform is not resident upload(tableId) is called to
+        write it into a free table, that is not one of excluded.
+        Raises NoSpareWaveTableError if no table can be freed
+        '''
+        tableId= self.tableOf(key)
+        if tableId is not None:
+            self._hits+= 1
+            self._touch(tableId)
+            return tableId
+        tableId= self._freeTable(lengthInPoints, excluded)
+        upload(tableId)
+        self._keyOfTable[tableId]= key
+        self._lengthOfTable[tableId]= int(lengthInPoints)
+        self._touch(tableId)
+        self._uploads+= 1
+        return tableId
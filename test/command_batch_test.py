@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.command_batch import CommandBatch
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+
+__version__ = "$Id:$"
+
+
+class CommandBatchTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._batch= CommandBatch()
+
+
+    def testCommandString(self):
+        self._batch.setTargetPosition('A B', [1, 2.5])
+        self._batch.getPosition('A B')
+        self._batch.getVoltages([1, 2, 3])
+        self._batch.setServoControlMode('A B', [True, False])
+        self._batch.getServoControlMode('A B')
+        self.assertEqual(
+            'MOV A 1.000000000 B 2.500000000\n'
+            'POS? A B\n'
+            'VOL? 1 2 3\n'
+            'SVO A 1 B 0\n'
+            'SVO? A B',
+            self._batch.commandString())
+        self.assertEqual(3, self._batch.numberOfQueries())
+
+
+    def testQueriesReturnResultIndex(self):
+        self._batch.setTargetPosition('A', 1)
+        self.assertEqual(0, self._batch.getPosition('A'))
+        self.assertEqual(1, self._batch.getTargetPosition('A'))
+
+
+    def testParseAnswer(self):
+        self._batch.setTargetPosition('A B', [1, 2])
+        self._batch.getPosition('A B')
+        self._batch.getVoltages([1, 2, 3])
+        self._batch.getServoControlMode('A B')
+        self._batch.getAxesIdentifiers()
+        self._batch.getNumberOfInputSignalChannels()
+        pos, vol, svo, axes, nCh= self._batch.parseAnswer(
+            'A=1.0 \nB=2.0\n1=10.5 \n2=20 \n3=30\nA=1 \nB=0\n'
+            'A \nB \nC\n3\n')
+        self.assertTrue(np.array_equal([1., 2.], pos))
+        self.assertTrue(np.array_equal([10.5, 20., 30.], vol))
+        self.assertTrue(np.array_equal([True, False], svo))
+        self.assertEqual(['A', 'B', 'C'], axes)
+        self.assertEqual(3, nCh)
+
+
+    def testVolatileMemoryParameters(self):
+        self._batch.getVolatileMemoryParameters(1, 0x16000300)
+        self.assertEqual('SPA? 1 0x16000300', self._batch.commandString())
+        nTables,= self._batch.parseAnswer('1 0x16000300=8\n')
+        self.assertTrue(np.array_equal([8.], nTables))
+
+
+    def testTableRatesAndRecorderConfiguration(self):
+        self._batch.getWaveGeneratorTableRate()
+        self._batch.getDataRecorderConfiguration()
+        wtr, cfg= self._batch.parseAnswer(
+            '1=10 0 \n2=20 1 \n3=1 0\n1=A 2 \n2=B 3\n')
+        self.assertTrue(np.array_equal([10, 20, 1], wtr))
+        self.assertEqual([1, 2], cfg.getTableIds())
+        self.assertEqual('B', cfg.getRecordSource(2))
+        self.assertEqual(3, cfg.getRecordOption(2))
+
+
+    def testWaveGeneratorInterpolation(self):
+        self._batch.getWaveGeneratorInterpolation()
+        self.assertEqual('WTR?', self._batch.commandString())
+        interpolation,= self._batch.parseAnswer('1=10 0 \n2=20 1 \n3=1 0\n')
+        self.assertTrue(np.array_equal([0, 1, 0], interpolation))
+
+
+    def testAddItemsOfAnotherBatch(self):
+        self._batch.setTargetPosition('A', [1.])
+        self._batch.getPosition('A')
+        other= CommandBatch()
+        self.assertEqual([None, 0],
+                         [other.addItem(i) for i in self._batch.items()])
+        self.assertEqual(1, other.numberOfQueries())
+        self.assertEqual(self._batch.commandString(), other.commandString())
+
+
+    def testParseAnswerRaisesIfAnswersAreMissing(self):
+        self._batch.getPosition('A B')
+        self._batch.getVoltages([1])
+        self.assertRaises(AssertionError,
+                          self._batch.parseAnswer, 'A=1.0 \nB=2.0\n')
+
+
+    def testExecuteOnFakeController(self):
+        ctrl= FakeGeneralCommandSet()
+        batch= ctrl.commandBatch()
+        batch.setServoControlMode('A B', [True, True])
+        batch.setTargetPosition('A B', [3, 4])
+        batch.getTargetPosition('A B')
+        batch.getServoControlMode('A')
+        target, svo= batch.execute()
+        self.assertTrue(np.array_equal([3, 4], target))
+        self.assertTrue(np.array_equal([True], svo))
+
+
+if __name__ == "__main__":
+    unittest.main()
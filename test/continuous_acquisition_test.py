@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import unittest
+import tempfile
+import os
+import numpy as np
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+from pi_gcs.gcs2 import WaveformGenerator
+from pi_gcs.continuous_acquisition import ContinuousAcquisition
+from pi_gcs.acquisition_sink import RingBufferSink, FileSink
+
+__version__ = "$Id:$"
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now= 0.
+
+
+    def time(self):
+        return self.now
+
+
+    def sleep(self, seconds):
+        self.now+= seconds
+
+
+class ContinuousAcquisitionTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._ctrl= FakeGeneralCommandSet()
+        self._ctrl.setUserDefinedWaveform(1, 1, 50, WaveformGenerator.CLEAR,
+                                          np.arange(50.))
+        self._ctrl.setUserDefinedWaveform(2, 1, 50, WaveformGenerator.CLEAR,
+                                          np.arange(50.) + 100)
+        self._time= FakeTime()
+        self._blocks= []
+        self._acq= ContinuousAcquisition(
+            self._ctrl, [1, 2], self._collect,
+            recorderLengthInPoints=20, timeStepInSec=0.001,
+            rearm=self._rearm, timeModule=self._time)
+
+
+    def _collect(self, firstSampleIndex, block):
+        self._blocks.append((firstSampleIndex, block.copy()))
+
+
+    def _rearm(self):
+        self._ctrl.recordedPoints= 0
+
+
+    def _record(self, nPoints):
+        self._time.now+= nPoints * 0.001
+        self._ctrl.recordedPoints= min(self._ctrl.recordedPoints + nPoints,
+                                       20)
+
+
+    def _stream(self):
+        return np.hstack([b for _, b in self._blocks])
+
+
+    def testStitchesSegmentsWithoutGaps(self):
+        self._acq.step()
+        for _ in range(5):
+            self._record(10)
+            self._acq.step()
+        self.assertEqual(3, self._acq.numberOfSegments())
+        self.assertEqual([], self._acq.gaps())
+        stream= self._stream()
+        self.assertEqual((2, 50), stream.shape)
+        self.assertEqual([0, 10, 20, 30, 40], [i for i, _ in self._blocks])
+        self.assertTrue(np.array_equal(np.tile(np.arange(20.), 3)[:50],
+                                       stream[0]))
+        self.assertTrue(np.array_equal(stream[0] + 100, stream[1]))
+
+
+    def testNeedsARecorderConfiguration(self):
+        self._ctrl.setDataRecorderConfiguration(None)
+        self.assertRaises(
+            ValueError, ContinuousAcquisition, self._ctrl,
+            self._ctrl.getDataRecorderConfiguration(), self._collect,
+            recorderLengthInPoints=20, timeStepInSec=0.001)
+
+
+    def testDetectsAndFillsGaps(self):
+        self._acq.step()
+        self._record(20)
+        self._acq.step()
+        self._time.now+= 0.005
+        self._record(20)
+        self._acq.step()
+        self.assertEqual(1, len(self._acq.gaps()))
+        gap= self._acq.gaps()[0]
+        self.assertEqual(40, gap.firstSampleIndex)
+        self.assertEqual(5, gap.missingSamples)
+        stream= self._stream()
+        self.assertEqual(20 + 20 + 5, stream.shape[1])
+        self.assertTrue(np.all(np.isnan(stream[:, 40:45])))
+        self.assertEqual(self._acq.samplesAcquired(), stream.shape[1])
+
+
+class AcquisitionSinkTest(unittest.TestCase):
+
+
+    def testRingBufferWindowIsContiguousView(self):
+        sink= RingBufferSink(2, 5)
+        sink.write(0, np.vstack([np.arange(3.), -np.arange(3.)]))
+        sink.write(3, np.vstack([np.arange(3., 7.), -np.arange(3., 7.)]))
+        latest= sink.latest()
+        self.assertTrue(np.array_equal(np.arange(2., 7.), latest[0]))
+        self.assertTrue(np.array_equal([5., 6.], sink.latest(2)[0]))
+        self.assertEqual(7, sink.samplesWritten())
+        self.assertTrue(latest.base is not None)
+
+
+    def testFileSink(self):
+        fd, path= tempfile.mkstemp()
+        os.close(fd)
+        try:
+            sink= FileSink(path)
+            sink.write(0, np.array([[1., 2.], [3., 4.]]))
+            sink.write(2, np.array([[5.], [6.]]))
+            self.assertRaises(AssertionError, sink.write, 7,
+                              np.zeros((2, 1)))
+            sink.close()
+            data= np.memmap(path, dtype=np.float64).reshape(-1, 2)
+            self.assertTrue(np.array_equal([[1, 3], [2, 4], [5, 6]], data))
+            del data
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
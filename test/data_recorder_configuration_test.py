@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import unittest
+import warnings
 from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
     RecordOption
 
@@ -10,9 +11,9 @@ class DataRecorderConfigurationTest(unittest.TestCase):
 
 
     def testSetAndGet(self):
-        cfg= DataRecorderConfiguration()
-        cfg.setTable(42, "foo", RecordOption.CONTROL_OUTPUT_OF_AXIS)
-        cfg.setTable(3.14, 111, RecordOption.VOLTAGE_OF_PIEZO_CHANNEL)
+        cfg= DataRecorderConfiguration([
+            (42, "foo", RecordOption.CONTROL_OUTPUT_OF_AXIS),
+            (3.14, 111, RecordOption.VOLTAGE_OF_PIEZO_CHANNEL)])
         self.assertEqual("foo", cfg.getRecordSource(42))
         self.assertEqual(RecordOption.CONTROL_OUTPUT_OF_AXIS,
                          cfg.getRecordOption(42))
@@ -22,12 +23,59 @@ class DataRecorderConfigurationTest(unittest.TestCase):
 
 
     def testRaiseIfUnknownOption(self):
-        cfg= DataRecorderConfiguration()
         self.assertRaises(
             Exception,
-            cfg.setTable, 0, "bar", "UNKNOWN_OPTION")
+            DataRecorderConfiguration, [(0, "bar", "UNKNOWN_OPTION")])
+
+
+    def testWithTableReturnsANewConfiguration(self):
+        cfg= DataRecorderConfiguration()
+        cfg2= cfg.withTable(1, "A", RecordOption.REAL_POSITION_OF_AXIS)
+        self.assertEqual([], cfg.getTableIds())
+        self.assertEqual([1], cfg2.getTableIds())
+        cfg3= cfg2.withTable(1, "B", RecordOption.REAL_POSITION_OF_AXIS)
+        self.assertEqual([1], cfg3.getTableIds())
+        self.assertEqual("B", cfg3.getRecordSource(1))
+
+
+    def testEqualityAndHash(self):
+        cfg= DataRecorderConfiguration(
+            [(1, "A", RecordOption.REAL_POSITION_OF_AXIS)])
+        same= DataRecorderConfiguration().withTable(
+            1, "A", RecordOption.REAL_POSITION_OF_AXIS)
+        other= cfg.withTable(2, "B", RecordOption.REAL_POSITION_OF_AXIS)
+        self.assertEqual(cfg, same)
+        self.assertNotEqual(cfg, other)
+        self.assertEqual(2, len(set([cfg, same, other])))
+
+
+    def testDiff(self):
+        previous= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS)])
+        cfg= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.POSITION_ERROR_OF_AXIS),
+            (3, "A", RecordOption.TARGET_POSITION_OF_AXIS)])
+        self.assertEqual([2, 3], cfg.diff(previous).getTableIds())
+        self.assertEqual(0, len(previous.diff(cfg.updatedWith(previous))))
+        self.assertEqual(cfg, cfg.diff(None))
+
+
+    def testDeprecatedSetTable(self):
+        cfg= DataRecorderConfiguration()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            cfg.setTable(1, "A", RecordOption.REAL_POSITION_OF_AXIS)
+            cfg.setTable(2, "B", RecordOption.REAL_POSITION_OF_AXIS)
+            cfg.setTable(1, "A", RecordOption.POSITION_ERROR_OF_AXIS)
+        self.assertEqual(3, len(caught))
+        self.assertTrue(issubclass(caught[0].category, DeprecationWarning))
+        self.assertEqual([1, 2], cfg.getTableIds())
+        self.assertEqual(RecordOption.POSITION_ERROR_OF_AXIS,
+                         cfg.getRecordOption(1))
 
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
-    unittest.main()
\ No newline at end of file
+    unittest.main()
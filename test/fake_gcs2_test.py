@@ -98,6 +98,40 @@ class FakeGeneralCommandSetTest(unittest.TestCase):
         self.assertEqual(50, waveform[-1])
 
 
+    def testRecordedDataInChunksMatchesFullRead(self):
+        self._ctrl.setUserDefinedWaveform(1, 1, 7, WaveformGenerator.CLEAR,
+                                          np.arange(7.))
+        self._ctrl.setUserDefinedWaveform(2, 1, 5, WaveformGenerator.CLEAR,
+                                          np.arange(5.))
+        full= self._ctrl.getRecordedDataValues(30, 4)
+        for tableId, firstPoint, values in \
+                self._ctrl.getRecordedDataValuesInChunks(30, 8, 4):
+            offset= firstPoint - 4
+            self.assertTrue(np.array_equal(
+                full[tableId - 1, offset: offset + len(values)], values))
+
+
+    def testUserDefinedWaveformAppendAndAdd(self):
+        self._ctrl.setUserDefinedWaveform(1, 1, 3, WaveformGenerator.CLEAR,
+                                          [1., 2., 3.])
+        self._ctrl.setUserDefinedWaveform(1, 3, 2, WaveformGenerator.APPEND,
+                                          [30., 40.])
+        self._ctrl.setUserDefinedWaveform(1, 1, 1, WaveformGenerator.ADD,
+                                          [10.])
+        self.assertTrue(np.array_equal([11., 2., 30., 40.],
+                                       self._ctrl.getWaveform(1)))
+
+
+    def testChunkedUpload(self):
+        points= np.arange(10.)
+        self._ctrl.uploadUserDefinedWaveform(2, points, chunkSizeInPoints=3)
+        self.assertTrue(np.array_equal(points, self._ctrl.getWaveform(2)))
+        points[4]= -1
+        self.assertEqual(1, self._ctrl.uploadUserDefinedWaveform(
+            2, points, diff=True))
+        self.assertTrue(np.array_equal(points, self._ctrl.getWaveform(2)))
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
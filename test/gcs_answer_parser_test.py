@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.gcs_answer_parser import splitAnswers, parseKeyValueAnswer, \
+    parseDataArray
+
+__version__ = "$Id:$"
+
+
+class GcsAnswerParserTest(unittest.TestCase):
+
+
+    def testSplitAnswers(self):
+        self.assertEqual(['A=1 \nB=2\n', '3\n', 'X \nY\n'],
+                         splitAnswers('A=1 \nB=2\n3\nX \nY\n'))
+        self.assertEqual([], splitAnswers(''))
+
+
+    def testKeyValue(self):
+        keys, values= parseKeyValueAnswer('1=0.5 \n2=0.7\n')
+        self.assertEqual(['1', '2'], keys)
+        self.assertTrue(np.array_equal([0.5, 0.7], values))
+
+
+    def testKeyWithSpaces(self):
+        keys, values= parseKeyValueAnswer('1 0x16000300=8\n', int)
+        self.assertEqual(['1 0x16000300'], keys)
+        self.assertEqual(8, values[0])
+
+
+    def testDataArray(self):
+        text= ('# TYPE = 1 \n'
+               '# SEPARATOR = 32 \n'
+               '# DIM = 2 \n'
+               '# SAMPLE_TIME = 0.000040 \n'
+               '# NAME0 = Real position of axis A \n'
+               '# END_HEADER \n'
+               '0.1 1.1 \n'
+               '0.2 1.2 \n'
+               '0.3 1.3\n')
+        header, data= parseDataArray(text)
+        self.assertEqual(1, header['TYPE'])
+        self.assertEqual(2, header['DIM'])
+        self.assertEqual(40e-6, header['SAMPLE_TIME'])
+        self.assertEqual('Real position of axis A', header['NAME0'])
+        self.assertEqual((2, 3), data.shape)
+        self.assertTrue(np.allclose([0.1, 0.2, 0.3], data[0]))
+        self.assertTrue(np.allclose([1.1, 1.2, 1.3], data[1]))
+
+
+    def testDataArrayWithoutDim(self):
+        header, data= parseDataArray('# END_HEADER\n1 2 3\n4 5 6\n')
+        self.assertEqual({}, header)
+        self.assertTrue(np.array_equal([[1, 4], [2, 5], [3, 6]], data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.periodicity import divisors, isPeriodic, shortestPeriod, \
+    commonPeriod
+
+__version__ = "$Id:$"
+
+
+class PeriodicityTest(unittest.TestCase):
+
+
+    def testDivisors(self):
+        self.assertEqual([1, 2, 3, 4, 6, 12], divisors(12))
+        self.assertEqual([1, 3, 9], divisors(9))
+        self.assertEqual([1, 7], divisors(7))
+
+
+    def testExactPeriod(self):
+        self.assertEqual(3, shortestPeriod(np.tile([1., 5., 2.], 4)))
+        self.assertEqual(1, shortestPeriod(np.ones(8)))
+        self.assertEqual(5, shortestPeriod(np.arange(5.)))
+
+
+    def testPeriodMustDivideTheLength(self):
+        self.assertEqual(7, shortestPeriod(np.tile([1., 2., 3.], 3)[:7]))
+
+
+    def testNearExactPeriod(self):
+        t= np.arange(1000)
+        circle= 10 * np.sin(2 * np.pi * t / 50.)
+        self.assertEqual(50, shortestPeriod(circle))
+        self.assertFalse(isPeriodic(circle + 1e-3 * (t > 500), 50))
+        self.assertEqual(50, shortestPeriod(circle + 1e-3 * (t > 500),
+                                            tolerance=1e-2))
+
+
+    def testDriftIsNotPeriodic(self):
+        drift= np.tile(np.arange(5.), 10) + 1e-3 * np.repeat(np.arange(10), 5)
+        self.assertFalse(isPeriodic(drift, 5, tolerance=2e-3))
+        self.assertTrue(isPeriodic(drift, 5, tolerance=1e-2))
+        self.assertEqual(50, shortestPeriod(drift, tolerance=2e-3))
+        self.assertFalse(isPeriodic(np.zeros(7), 3))
+
+
+    def testCommonPeriod(self):
+        a= np.tile(np.arange(4.), 6)
+        b= np.tile(np.arange(6.), 4)
+        self.assertEqual(12, commonPeriod([a, b]))
+        self.assertEqual(24, commonPeriod([a, np.arange(24.)]))
+        self.assertRaises(AssertionError, commonPeriod, [a, b[:-1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
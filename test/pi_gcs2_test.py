@@ -3,10 +3,17 @@
 import unittest
 import numpy as np
 import time
+import threading
+import warnings
 from pi_gcs.gcs2 import GeneralCommandSet2, PIConnectionError, CHANNEL_ONLINE,\
-    CHANNEL_OFFLINE, PIException, WaveformGenerator
+    CHANNEL_OFFLINE, PIException, WaveformGenerator, CDoubleArray, CIntArray,\
+    PI_FUNCTION_PROTOTYPES, PITimeoutError, changedSegments
+import re
+import inspect
 import ctypes
 from ctypes.util import find_library
+import pi_gcs.gcs2
+from pi_gcs.gcs_answer_parser import parseText
 from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
     RecordOption
 
@@ -123,6 +130,686 @@ class CTypesTest(unittest.TestCase):
         self.assertEqual(3, self.libm.floor(3.3))
 
 
+class CTypeArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.libc= ctypes.CDLL(find_library("c"))
+        self.libc.memcpy.restype= ctypes.c_void_p
+
+
+    def testWrapsContiguousArrayWithoutCopy(self):
+        buf= np.arange(5, dtype=np.float64)
+        arr= CDoubleArray(buf)
+        self.assertTrue(arr.toNumpyArray() is buf)
+
+
+    def testConvertsToCType(self):
+        arr= CIntArray([1, 2, 3])
+        self.assertEqual(np.int32, arr.toNumpyArray().dtype)
+        self.assertTrue(np.array_equal([1, 2, 3], arr.toNumpyArray()))
+
+
+    def testLibraryWritesIntoNumpyBuffer(self):
+        self.libc.memcpy.argtypes= [CDoubleArray, CDoubleArray,
+                                    ctypes.c_size_t]
+        src= np.linspace(0, 1, 1000)
+        dest= np.zeros((2, 1000))
+        self.libc.memcpy(CDoubleArray(dest[1]), CDoubleArray(src),
+                         src.nbytes)
+        self.assertTrue(np.array_equal(src, dest[1]))
+        self.assertTrue(np.all(dest[0] == 0))
+
+
+    def testZeros(self):
+        arr= CDoubleArray.zeros(4)
+        self.assertEqual((4,), arr.toNumpyArray().shape)
+        self.assertTrue(np.all(arr.toNumpyArray() == 0))
+
+
+class FunctionPrototypesTest(unittest.TestCase):
+
+    class FakeFunction(object):
+        restype= 'unset'
+        argtypes= 'unset'
+
+
+    class FakeLibrary(object):
+        pass
+
+
+    def testEveryUsedFunctionHasAPrototype(self):
+        source= inspect.getsource(pi_gcs.gcs2)
+        used= set(re.findall(r'_lib\.(PI_\w+)', source))
+        self.assertEqual(set(), used - set(PI_FUNCTION_PROTOTYPES.keys()))
+
+
+    def testPrototypesAreAppliedOnceAndMissingFunctionsSkipped(self):
+        lib= self.FakeLibrary()
+        lib.PI_qPOS= self.FakeFunction()
+        lib.PI_GetError= self.FakeFunction()
+        GeneralCommandSet2._setFunctionPrototypes(lib)
+        self.assertEqual(PI_FUNCTION_PROTOTYPES['PI_qPOS'][1],
+                         lib.PI_qPOS.argtypes)
+        self.assertEqual(ctypes.c_int, lib.PI_qPOS.restype)
+        self.assertEqual(ctypes.c_int, lib.PI_GetError.restype)
+
+
+class FakeGcsAnswerLibrary(object):
+
+    def __init__(self):
+        self.commands= []
+        self.answers= {}
+        self.errorCode= 0
+        self.delayedPolls= 3
+        self.pauseAfter= None
+        self.pausePolls= 0
+        self._pending= ''
+        self._sent= 0
+        self._polls= 0
+
+
+    def PI_GcsCommandset(self, ide, command):
+        self.commands.append(command.decode())
+        for line in command.decode().splitlines():
+            if line == 'ERR?':
+                self._pending+= '%d\n' % self.errorCode
+            elif line.startswith('ECO? '):
+                self._pending+= line[len('ECO? '):] + '\n'
+            elif line in self.answers:
+                self._pending+= self.answers[line]
+        self._sent= 0
+        self._polls= 0
+        return 1
+
+
+    def _paused(self):
+        if self._sent != self.pauseAfter or self.pausePolls == 0:
+            return False
+        self.pausePolls-= 1
+        return True
+
+
+    def PI_GcsGetAnswerSize(self, ide, retSize):
+        self._polls+= 1
+        if self._polls <= self.delayedPolls or self._paused():
+            retSize._obj.value= 0
+        elif self.pauseAfter is not None and self._sent < self.pauseAfter:
+            retSize._obj.value= min(len(self._pending), 4,
+                                    self.pauseAfter - self._sent)
+        else:
+            retSize._obj.value= min(len(self._pending), 4)
+        return 1
+
+
+    def PI_GcsGetAnswer(self, ide, buf, bufSize):
+        chunk= self._pending[:bufSize - 1]
+        self._pending= self._pending[len(chunk):]
+        self._sent+= len(chunk)
+        buf.value= chunk.encode()
+        return 1
+
+
+    def PI_TranslateError(self, errorCode, buf, bufSize):
+        buf.value= b'Unknown command'
+        return 1
+
+
+    def PI_qVER(self, ide, buf, bufSize):
+        buf.value= self.answers['VER?'].encode()
+        return 1
+
+
+class FakeGcsAnswerAndMoveLibrary(FakeGcsAnswerLibrary):
+    '''
+    Records the PI_MOV calls made while a GCS command is unanswered
+    '''
+
+    def __init__(self):
+        FakeGcsAnswerLibrary.__init__(self)
+        self.interleaved= 0
+        self._unanswered= False
+
+
+    def PI_GcsCommandset(self, ide, command):
+        self._unanswered= True
+        return FakeGcsAnswerLibrary.PI_GcsCommandset(self, ide, command)
+
+
+    def PI_GcsGetAnswer(self, ide, buf, bufSize):
+        ret= FakeGcsAnswerLibrary.PI_GcsGetAnswer(self, ide, buf, bufSize)
+        self._unanswered= len(self._pending) > 0
+        return ret
+
+
+    def PI_MOV(self, ide, axes, values):
+        if self._unanswered:
+            self.interleaved+= 1
+        time.sleep(0.0001)
+        return 1
+
+
+class GcsCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeGcsAnswerLibrary()
+        self._gcs= GeneralCommandSet2(gcsCommandTimeoutInSec=1.0,
+                                      library=self._lib)
+
+
+    def testCommandWithoutAnswer(self):
+        t0= time.time()
+        self.assertEqual('', self._gcs.gcsCommand('MOV A 1'))
+        self.assertEqual(['MOV A 1\nERR?\nECO? %s' %
+                          GeneralCommandSet2.END_OF_ANSWER_MARKER],
+                         self._lib.commands)
+        self.assertTrue(time.time() - t0 < 0.1)
+
+
+    def testMultiLineAnswerOfSeveralQueries(self):
+        self._lib.answers['POS? A B']= 'A=1.5 \nB=2.5\n'
+        self._lib.answers['VER?']= 'E-518 \nlib 1.0\n'
+        self.assertEqual('A=1.5 \nB=2.5\nE-518 \nlib 1.0\n',
+                         self._gcs.gcsCommand('POS? A B\nVER?'))
+
+
+    def testCommandBatchIsOneRoundTrip(self):
+        self._lib.answers['POS? A B']= 'A=1.5 \nB=2.5\n'
+        self._lib.answers['SVO? A B']= 'A=1 \nB=1\n'
+        batch= self._gcs.commandBatch()
+        batch.setTargetPosition('A B', [1.5, 2.5])
+        batch.getPosition('A B')
+        batch.getServoControlMode('A B')
+        pos, svo= batch.execute()
+        self.assertEqual(1, len(self._lib.commands))
+        self.assertTrue(np.array_equal([1.5, 2.5], pos))
+        self.assertTrue(np.array_equal([True, True], svo))
+
+
+    def testCommandsFromSeveralThreadsDoNotMixAnswers(self):
+        self._lib.answers['POS? A']= 'A=1.5\n'
+        self._lib.answers['VER?']= 'E-518\n'
+        wrong= []
+
+        def query(command, want):
+            for _ in range(20):
+                answer= self._gcs.gcsCommand(command)
+                if answer != want:
+                    wrong.append(answer)
+
+        threads= [threading.Thread(target=query, args=('POS? A', 'A=1.5\n')),
+                  threading.Thread(target=query, args=('VER?', 'E-518\n'))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], wrong)
+
+
+    def testTypedCallsDoNotInterleaveWithCommands(self):
+        self._lib= FakeGcsAnswerAndMoveLibrary()
+        self._lib.answers['POS? A']= 'A=1.5\n'
+        self._gcs= GeneralCommandSet2(library=self._lib)
+
+        def move():
+            for _ in range(50):
+                self._gcs.setTargetPosition('A', [1.])
+
+        mover= threading.Thread(target=move)
+        mover.start()
+        for _ in range(50):
+            self.assertEqual('A=1.5\n', self._gcs.gcsCommand('POS? A'))
+        mover.join()
+        self.assertEqual(0, self._lib.interleaved)
+
+
+    def testErrorRaises(self):
+        self._lib.errorCode= 2
+        self.assertRaises(PIException, self._gcs.gcsCommand, 'FOO 1')
+
+
+    def testFailingQueryRaisesTheControllerError(self):
+        self._lib.errorCode= 15
+        t0= time.time()
+        self.assertRaises(PIException, self._gcs.gcsCommand, 'POS? X')
+        self.assertTrue(time.time() - t0 < 0.5)
+
+
+    def testIntegerAnswerIsNotTakenForAnError(self):
+        self._lib.answers['TSC?']= '3\n'
+        self._lib.answers['POS? A']= 'A=1.5\n'
+        self.assertEqual('3\nA=1.5\n', self._gcs.gcsCommand('TSC?\nPOS? A'))
+
+
+    def testSlowErrorAnswerAfterAnIntegerAnswer(self):
+        self._lib.answers['TSC?']= '3\n'
+        self._lib.pauseAfter= len('3\n')
+        self._lib.pausePolls= 40
+        self.assertEqual('3\n', self._gcs.gcsCommand('TSC?'))
+        self.assertEqual(0, self._lib.pausePolls)
+
+
+    def testFailingQueryAmongIntegerAnswers(self):
+        self._lib.answers['TSC?']= '3\n'
+        self._lib.errorCode= 2
+        self.assertRaises(PIException, self._gcs.gcsCommand, 'FOO?\nTSC?')
+
+
+    def testTimeout(self):
+        self._lib.delayedPolls= 10**9
+        self.assertRaises(PITimeoutError,
+                          self._gcs.gcsCommand, 'POS? A', 0.05)
+
+
+    def testPrefetchStaticPropertiesInOneRoundTrip(self):
+        self._lib.answers['VER?']= 'E-518 \nlib 1.0\n'
+        self._lib.answers['SAI?']= 'A \nB \nC\n'
+        self._lib.answers['TSC?']= '3\n'
+        self._lib.answers['TPC?']= '3\n'
+        self._lib.answers['SPA? 1 0x16000300']= '1 0x16000300=8\n'
+        self._lib.answers['SPA? 1 0xE000200']= '1 0xE000200=5e-05\n'
+        self._gcs.prefetchStaticProperties()
+        self.assertEqual(1, len(self._lib.commands))
+        self.assertEqual(['A', 'B', 'C'], self._gcs.getAxesIdentifiers())
+        self.assertEqual(3, self._gcs.getNumberOfOutputSignalChannels())
+        self.assertEqual(8, self._gcs.getNumberOfRecorderTables())
+        self.assertEqual(5e-5, self._gcs.getServoUpdateTimeInSeconds())
+        self.assertEqual('E-518\nlib 1.0', self._gcs.getVersion())
+        self.assertEqual(1, len(self._lib.commands))
+
+
+    def testVersionIsTheSameWithAndWithoutPrefetch(self):
+        self._lib.answers['VER?']= 'E-518 \nlib 1.0\n'
+        self.assertEqual('E-518\nlib 1.0', self._gcs.getVersion())
+
+
+class FakeRecorderLibrary(object):
+
+    def __init__(self, nTables, nPoints):
+        self.data= np.arange(nTables * nPoints, dtype=float).reshape(
+            nTables, nPoints)
+        self.calls= []
+        self.spaCalls= 0
+
+
+    def PI_qSPA(self, ide, items, params, values, szStrings, bufSize):
+        self.spaCalls+= 1
+        if params.toNumpyArray()[0] == 0x16000300:
+            values.toNumpyArray()[0]= self.data.shape[0]
+        return 1
+
+
+    def PI_qDRR_SYNC(self, ide, table, start, nValues, values):
+        self.calls.append((table, start, nValues))
+        values.toNumpyArray()[:]= self.data[table - 1,
+                                            start - 1: start - 1 + nValues]
+        return 1
+
+
+class FakeAsyncRecorderLibrary(FakeRecorderLibrary):
+
+    def __init__(self, nTables, nPoints, pointsPerPoll):
+        FakeRecorderLibrary.__init__(self, nTables, nPoints)
+        self.pointsPerPoll= pointsPerPoll
+        self._interleaved= None
+        self._index= 0
+
+
+    def PI_qDRR(self, ide, tables, nTables, start, nValues, ppValues,
+                header, headerSize):
+        rows= self.data[tables.toNumpyArray() - 1,
+                        start - 1: start - 1 + nValues]
+        self._interleaved= np.ascontiguousarray(rows.T).ravel()
+        self._nTables= nTables
+        self._index= 0
+        header.value= b'# DIM = 2 \n# END_HEADER\n'
+        return 1
+
+
+    def PI_GetAsyncBufferIndex(self, ide):
+        self._index= min(self._index + self.pointsPerPoll * self._nTables,
+                         len(self._interleaved))
+        return self._index
+
+
+    def PI_GetAsyncBuffer(self, ide, ppValues):
+        ppValues._obj.contents= ctypes.c_double.from_address(
+            self._interleaved.ctypes.data)
+        return 1
+
+
+class RecordedDataValuesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeRecorderLibrary(4, 100)
+        self._gcs= GeneralCommandSet2(library=self._lib)
+
+
+    def testNumberOfRecorderTablesIsCachedUntilClose(self):
+        self.assertEqual(4, self._gcs.getNumberOfRecorderTables())
+        self._gcs.getRecordedDataValues(10)
+        self.assertEqual(1, self._lib.spaCalls)
+        self._gcs.closeConnection()
+        self.assertEqual(4, self._gcs.getNumberOfRecorderTables())
+        self.assertEqual(2, self._lib.spaCalls)
+
+
+    def testReadAll(self):
+        data= self._gcs.getRecordedDataValues(10, 5)
+        self.assertTrue(np.array_equal(self._lib.data[:, 4:14], data))
+
+
+    def testReadIntoOut(self):
+        out= np.zeros((4, 10))
+        ret= self._gcs.getRecordedDataValues(10, 1, out=out)
+        self.assertTrue(ret is out)
+        self.assertTrue(np.array_equal(self._lib.data[:, :10], out))
+
+
+    def testReadIntoNonContiguousOut(self):
+        out= np.zeros((10, 4)).T
+        self._gcs.getRecordedDataValues(10, 1, out=out)
+        self.assertTrue(np.array_equal(self._lib.data[:, :10], out))
+
+
+    def testReadOnlyRequestedTables(self):
+        cfg= DataRecorderConfiguration([
+            (3, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (1, "B", RecordOption.REAL_POSITION_OF_AXIS)])
+        data= self._gcs.getRecordedDataValues(10, 1, tableIds=cfg)
+        self.assertEqual([3, 1], [c[0] for c in self._lib.calls])
+        self.assertTrue(np.array_equal(self._lib.data[[2, 0], :10], data))
+
+
+    def testReadByTable(self):
+        byTable= self._gcs.getRecordedDataValuesByTable(10, [4, 2])
+        self.assertEqual([4, 2], list(byTable.keys()))
+        self.assertTrue(np.array_equal(self._lib.data[3, :10], byTable[4]))
+
+
+    def testOutOfWrongShapeRaises(self):
+        self.assertRaises(AssertionError, self._gcs.getRecordedDataValues,
+                          10, 1, np.zeros((3, 10)))
+
+
+    def testChunks(self):
+        got= {}
+        for tableId, firstPoint, values in \
+                self._gcs.getRecordedDataValuesInChunks(25, 10, 3):
+            got.setdefault(tableId, []).append(values.copy())
+            self.assertTrue(len(values) <= 10)
+        self.assertEqual([1, 2, 3, 4], sorted(got.keys()))
+        for tableId in got:
+            self.assertTrue(np.array_equal(self._lib.data[tableId - 1, 2:27],
+                                           np.concatenate(got[tableId])))
+
+
+class FakeWaveTableLibrary(object):
+
+    def __init__(self):
+        self.calls= []
+
+
+    def PI_WAV_PNT(self, ide, tableId, offset, nPoints, mode, points):
+        self.calls.append((tableId, offset, nPoints, mode,
+                           list(points.toNumpyArray())))
+        return 1
+
+
+    def PI_WCL(self, ide, tables, nTables):
+        return 1
+
+
+class WaveformUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeWaveTableLibrary()
+        self._gcs= GeneralCommandSet2(library=self._lib)
+        self._points= np.arange(10.)
+
+
+    def testChangedSegments(self):
+        changed= self._points.copy()
+        changed[[2, 3, 5, 9]]= -1
+        self.assertEqual([(2, 4), (5, 6), (9, 10)],
+                         changedSegments(self._points, changed))
+        self.assertEqual([(2, 6), (9, 10)],
+                         changedSegments(self._points, changed, 1))
+        self.assertEqual([], changedSegments(self._points, self._points))
+
+
+    def testChunkedUpload(self):
+        self.assertEqual(10, self._gcs.uploadUserDefinedWaveform(
+            1, self._points, chunkSizeInPoints=4))
+        self.assertEqual(
+            [(1, 1, 4, WaveformGenerator.CLEAR, [0., 1., 2., 3.]),
+             (1, 5, 4, WaveformGenerator.APPEND, [4., 5., 6., 7.]),
+             (1, 9, 2, WaveformGenerator.APPEND, [8., 9.])],
+            self._lib.calls)
+
+
+    def testOnlyChangedSegmentIsSentAgain(self):
+        self._gcs.uploadUserDefinedWaveform(1, self._points, diff=True)
+        changed= self._points.copy()
+        changed[6:8]= [60., 70.]
+        self.assertEqual(2, self._gcs.uploadUserDefinedWaveform(
+            1, changed, diff=True))
+        self.assertEqual((1, 7, 2, WaveformGenerator.APPEND, [60., 70.]),
+                         self._lib.calls[-1])
+        self.assertEqual(0, self._gcs.uploadUserDefinedWaveform(
+            1, changed, diff=True))
+        self.assertEqual(2, len(self._lib.calls))
+
+
+    def testFullUploadAfterTheTableIsWrittenByOtherMeans(self):
+        self._gcs.uploadUserDefinedWaveform(1, self._points, diff=True)
+        self._gcs.clearWaveTableData([1])
+        self.assertEqual(10, self._gcs.uploadUserDefinedWaveform(
+            1, self._points, diff=True))
+        self._gcs.setUserDefinedWaveform(1, 1, 2, WaveformGenerator.CLEAR,
+                                         [1., 2.])
+        self.assertEqual(10, self._gcs.uploadUserDefinedWaveform(
+            1, self._points, diff=True))
+        self.assertEqual(10, self._gcs.uploadUserDefinedWaveform(
+            1, self._points))
+
+
+    def testFullUploadByDefault(self):
+        self._gcs.uploadUserDefinedWaveform(1, self._points)
+        changed= self._points.copy()
+        changed[6]= 60.
+        self.assertEqual(10, self._gcs.uploadUserDefinedWaveform(1, changed))
+        self.assertEqual(WaveformGenerator.CLEAR, self._lib.calls[-1][3])
+
+
+class FakeTableRateLibrary(object):
+
+    def __init__(self):
+        self.tableRate= np.ones(3, dtype=int)
+        self.interpolation= np.zeros(3, dtype=int)
+
+
+    def PI_WTR(self, ide, wgIds, tableRate, interpolation, nIds):
+        ids= wgIds.toNumpyArray() - 1
+        self.tableRate[ids]= tableRate.toNumpyArray()
+        self.interpolation[ids]= interpolation.toNumpyArray()
+        return 1
+
+
+    def PI_qWTR(self, ide, wgIds, tableRate, interpolation, nIds):
+        ids= wgIds.toNumpyArray() - 1
+        tableRate.toNumpyArray()[:]= self.tableRate[ids]
+        interpolation.toNumpyArray()[:]= self.interpolation[ids]
+        return 1
+
+
+class WaveGeneratorTableRateTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeTableRateLibrary()
+        self._gcs= GeneralCommandSet2(library=self._lib)
+
+
+    def testScalarsAreSetForEveryWaveGenerator(self):
+        self._gcs.setWaveGeneratorTableRate(
+            4, WaveformGenerator.LINEAR_INTERPOLATION)
+        self.assertTrue(np.array_equal(
+            [4, 4, 4], self._gcs.getWaveGeneratorTableRate()))
+        self.assertTrue(np.array_equal(
+            [1, 1, 1], self._gcs.getWaveGeneratorInterpolation()))
+
+
+    def testDefaultIsNoInterpolation(self):
+        self._lib.interpolation[:]= WaveformGenerator.LINEAR_INTERPOLATION
+        self._gcs.setWaveGeneratorTableRate([1, 2, 3])
+        self.assertTrue(np.array_equal(
+            [1, 2, 3], self._gcs.getWaveGeneratorTableRate()))
+        self.assertTrue(np.array_equal(
+            [0, 0, 0], self._gcs.getWaveGeneratorInterpolation()))
+
+
+class FakeDrcLibrary(object):
+
+    def __init__(self):
+        self.calls= []
+
+
+    def PI_DRC(self, ide, tables, sources, options):
+        self.calls.append((list(tables.toNumpyArray()), sources.decode(),
+                           list(options.toNumpyArray())))
+        return 1
+
+
+    def PI_CloseConnection(self, ide):
+        pass
+
+
+class DataRecorderConfigurationUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeDrcLibrary()
+        self._gcs= GeneralCommandSet2(library=self._lib)
+        self._cfg= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS)])
+
+
+    def testAllTablesInOneCall(self):
+        self._gcs.setDataRecorderConfiguration(self._cfg)
+        self.assertEqual([([1, 2], 'A B', [2, 2])], self._lib.calls)
+
+
+    def testSameConfigurationIsNotSentAgain(self):
+        self._gcs.setDataRecorderConfiguration(self._cfg)
+        self._gcs.setDataRecorderConfiguration(self._cfg)
+        self.assertEqual(1, len(self._lib.calls))
+
+
+    def testOnlyChangedTablesAreSent(self):
+        self._gcs.setDataRecorderConfiguration(self._cfg)
+        self._gcs.setDataRecorderConfiguration(
+            self._cfg.withTable(2, "B", RecordOption.POSITION_ERROR_OF_AXIS))
+        self._gcs.setDataRecorderConfiguration(DataRecorderConfiguration(
+            [(1, "A", RecordOption.REAL_POSITION_OF_AXIS)]))
+        self.assertEqual([([2], 'B', [3])], self._lib.calls[1:])
+
+
+    def testConfigurationChangedWithSetTableIsSentAgain(self):
+        cfg= DataRecorderConfiguration()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            cfg.setTable(1, "A", RecordOption.REAL_POSITION_OF_AXIS)
+            self._gcs.setDataRecorderConfiguration(cfg)
+            cfg.setTable(1, "A", RecordOption.POSITION_ERROR_OF_AXIS)
+        self._gcs.setDataRecorderConfiguration(cfg)
+        self.assertEqual([([1], 'A', [3])], self._lib.calls[1:])
+
+
+    def testCloseConnectionForgetsAppliedConfiguration(self):
+        self._gcs.setDataRecorderConfiguration(self._cfg)
+        self._gcs.closeConnection()
+        self._gcs.setDataRecorderConfiguration(self._cfg)
+        self.assertEqual(2, len(self._lib.calls))
+
+
+class FakeFailingMoveLibrary(object):
+    '''
+    PI_MOV fails; PI_GetError records whether another thread could
+    take the lock while the error codes are read
+    '''
+
+    def __init__(self):
+        self.lock= None
+        self.lockFreeWhileReadingErrors= []
+        self._errorIds= []
+
+
+    def _lockIsFree(self):
+        free= []
+
+        def tryLock():
+            free.append(self.lock.acquire(False))
+            if free[0]:
+                self.lock.release()
+
+        t= threading.Thread(target=tryLock)
+        t.start()
+        t.join()
+        return free[0]
+
+
+    def PI_MOV(self, ide, axes, values):
+        self._errorIds= [10, 5]
+        return 0
+
+
+    def PI_GetError(self, ide):
+        self.lockFreeWhileReadingErrors.append(self._lockIsFree())
+        return self._errorIds.pop(0) if self._errorIds else 0
+
+
+    def PI_TranslateError(self, errorCode, buf, bufSize):
+        buf.value= b'error'
+        return 1
+
+
+class LibraryErrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeFailingMoveLibrary()
+        self._gcs= GeneralCommandSet2(library=self._lib)
+        self._lib.lock= self._gcs._gcsCommandLock
+
+
+    def testErrorsAreReadHoldingTheLockOfTheFailedCall(self):
+        with self.assertRaises(PIException) as cm:
+            self._gcs.setTargetPosition('A', [1.])
+        self.assertEqual('error (10) error (5) ', str(cm.exception))
+        self.assertEqual([False] * 3, self._lib.lockFreeWhileReadingErrors)
+
+
+class AsyncRecordedDataValuesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lib= FakeAsyncRecorderLibrary(4, 1000, 7)
+        self._gcs= GeneralCommandSet2(library=self._lib)
+        self._gcs.ASYNC_READOUT_POLL_PERIOD_SEC= 0.0001
+
+
+    def testAsyncReadout(self):
+        future= self._gcs.getRecordedDataValuesAsync(500, 11, [2, 4])
+        data= future.result(timeoutInSec=5)
+        self.assertEqual(500, future.pointsAvailable())
+        self.assertEqual({'DIM': 2}, future.header())
+        self.assertTrue(np.array_equal(self._lib.data[[1, 3], 10:510], data))
+
+
+    def testAsyncReadoutAllTables(self):
+        future= self._gcs.getRecordedDataValuesAsync(100)
+        self.assertEqual([1, 2, 3, 4], list(future.tableIds()))
+        self.assertTrue(np.array_equal(self._lib.data[:, :100],
+                                       future.result(timeoutInSec=5)))
+
+
 @unittest.skip('need real hw')
 class GeneralCommandSet2TestWithE517(unittest.TestCase):
 
@@ -207,7 +894,7 @@ class GeneralCommandSet2TestWithE517(unittest.TestCase):
 
 
     def _testGcsCommand(self):
-        self.assertEqual(self._gcs.gcsCommand('VER?'),
+        self.assertEqual(parseText(self._gcs.gcsCommand('VER?')),
                          self._gcs.getVersion())
 
 
@@ -349,10 +1036,10 @@ class GeneralCommandSet2TestWithE517(unittest.TestCase):
         nRecorders= self._gcs.getNumberOfRecorderTables()
         self.assertEqual(8, nRecorders)
 
-        dataRecorderCfg= DataRecorderConfiguration()
-        dataRecorderCfg.setTable(1, "A", RecordOption.REAL_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(2, "B", RecordOption.REAL_POSITION_OF_AXIS)
-        dataRecorderCfg.setTable(3, "1", RecordOption.VOLTAGE_OF_PIEZO_CHANNEL)
+        dataRecorderCfg= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS),
+            (3, "1", RecordOption.VOLTAGE_OF_PIEZO_CHANNEL)])
         self._gcs.setDataRecorderConfiguration(dataRecorderCfg)
         retrievedCfg= self._gcs.getDataRecorderConfiguration()
         self.assertEqual(RecordOption.REAL_POSITION_OF_AXIS,
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+import unittest
+import time
+import numpy as np
+from pi_gcs.position_poller import PositionPoller
+from pi_gcs.tip_tilt_status import TipTiltStatus
+from pi_gcs.tip_tilt_2_axes import TipTilt2Axis
+from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+
+__version__ = "$Id:$"
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now= 1000.
+
+
+    def time(self):
+        return self.now
+
+
+class CountingTipTilt(object):
+
+    def __init__(self, timeModule=time):
+        self.snapshots= 0
+        self._time= timeModule
+
+
+    def statusSnapshot(self, fields):
+        self.snapshots+= 1
+        return TipTiltStatus(self._time.time(), fields,
+                             position=np.array([self.snapshots, 0.]),
+                             outputVoltage=np.ones(3) * self.snapshots)
+
+
+class PositionPollerTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._tt= CountingTipTilt()
+        self._poller= PositionPoller(self._tt, capacity=4)
+
+
+    def testHistoryIsContiguousAcrossWrapAround(self):
+        for _ in range(6):
+            self._poller.step()
+        timestamps, positions= self._poller.history()
+        self.assertEqual(4, len(timestamps))
+        self.assertTrue(np.array_equal([3, 4, 5, 6], positions[:, 0]))
+        self.assertTrue(np.all(np.diff(timestamps) >= 0))
+        self.assertTrue(np.array_equal([5, 6],
+                                       self._poller.history(2)[1][:, 0]))
+
+
+    def testHistoryIsAView(self):
+        self._poller.step()
+        _, positions= self._poller.history()
+        self.assertFalse(positions.flags.owndata)
+
+
+    def testLatest(self):
+        self.assertEqual(None, self._poller.latest())
+        self._poller.step()
+        self._poller.step()
+        timestamp, position= self._poller.latest(maxAgeInSec=10)
+        self.assertTrue(np.array_equal([2, 0], position))
+        self.assertEqual(None, self._poller.latest(maxAgeInSec=-1))
+
+
+    def testLatestAgeIsMeasuredWithTheGivenClock(self):
+        fakeTime= FakeTime()
+        poller= PositionPoller(CountingTipTilt(fakeTime), capacity=4,
+                               timeModule=fakeTime)
+        poller.step()
+        fakeTime.now+= 0.5
+        self.assertNotEqual(None, poller.latest(maxAgeInSec=1))
+        fakeTime.now+= 1
+        self.assertEqual(None, poller.latest(maxAgeInSec=1))
+
+
+    def testSeveralFields(self):
+        poller= PositionPoller(
+            self._tt, capacity=4, fields=(TipTiltStatus.POSITION,
+                                          TipTiltStatus.OUTPUT_VOLTAGE))
+        poller.step()
+        _, voltages= poller.history(field=TipTiltStatus.OUTPUT_VOLTAGE)
+        self.assertEqual((1, 3), voltages.shape)
+
+
+    def testThread(self):
+        poller= PositionPoller(self._tt, periodInSec=0.001, capacity=100)
+        poller.start()
+        t0= time.time()
+        while poller.numberOfSamples() < 5 and time.time() - t0 < 2:
+            time.sleep(0.001)
+        poller.stop()
+        self.assertEqual(None, poller.exception())
+        self.assertTrue(poller.numberOfSamples() >= 5)
+        self.assertFalse(poller.isRunning())
+
+
+class TipTiltPositionPollerTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._ctrl= FakeGeneralCommandSet()
+        self._tt= TipTilt2Axis(self._ctrl, TipTiltConfiguration())
+        self._tt.setUp()
+        self._ctrl.setTargetPosition(self._tt.ALL_AXES, np.array([1., 2.]))
+
+
+    def tearDown(self):
+        self._tt.stopPositionPoller()
+
+
+    def testGetPositionServesPolledSample(self):
+        poller= self._tt.startPositionPoller(periodInSec=0.001,
+                                             maxAgeInSec=10)
+        t0= time.time()
+        while poller.numberOfSamples() == 0 and time.time() - t0 < 2:
+            time.sleep(0.001)
+        poller.stop()
+        self._ctrl.getPosition= None
+        self.assertTrue(np.allclose(poller.latest()[1],
+                                    self._tt.getPosition()))
+
+
+    def testGetPositionQueriesControllerIfSampleIsStale(self):
+        poller= self._tt.startPositionPoller(maxAgeInSec=-1)
+        poller.stop()
+        self.assertTrue(np.allclose(
+            self._tt.calibration().gcsUnitsToMilliRad([1., 2.]),
+            self._tt.getPosition()))
+
+
+    def testGetPositionQueriesControllerIfPositionIsNotPolled(self):
+        poller= self._tt.startPositionPoller(
+            periodInSec=0.001, maxAgeInSec=10,
+            fields=(TipTiltStatus.OUTPUT_VOLTAGE,))
+        t0= time.time()
+        while poller.numberOfSamples() == 0 and time.time() - t0 < 2:
+            time.sleep(0.001)
+        self.assertTrue(np.allclose(
+            self._tt.calibration().gcsUnitsToMilliRad([1., 2.]),
+            self._tt.getPosition()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+import unittest
+import threading
+import numpy as np
+from pi_gcs.recorded_data_future import RecordedDataFuture
+
+__version__ = "$Id:$"
+
+
+class RecordedDataFutureTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._future= RecordedDataFuture([1, 2], 10)
+
+
+    def testPrefixIsAView(self):
+        self._future._buffer()[:, :4]= 7
+        self._future._setPointsAvailable(4)
+        self.assertEqual(4, self._future.pointsAvailable())
+        self.assertEqual((2, 4), self._future.available().shape)
+        self.assertTrue(np.all(self._future.available() == 7))
+        self.assertTrue(np.may_share_memory(self._future.available(),
+                                            self._future._buffer()))
+        self.assertFalse(self._future.done())
+
+
+    def testResultWaitsForProducer(self):
+        def produce():
+            self._future._buffer()[:]= 1
+            self._future._setPointsAvailable(10)
+            self._future._setDone()
+
+        threading.Timer(0.05, produce).start()
+        self.assertTrue(self._future.waitForPoints(10, timeoutInSec=5))
+        self.assertTrue(np.all(self._future.result(timeoutInSec=5) == 1))
+
+
+    def testResultReraisesProducerException(self):
+        self._future._setException(ValueError('broken'))
+        self.assertTrue(self._future.done())
+        self.assertRaises(ValueError, self._future.result)
+
+
+    def testResultTimeout(self):
+        self.assertRaises(RuntimeError, self._future.result, 0.01)
+        self.assertFalse(self._future.waitForPoints(1, timeoutInSec=0.01))
+
+
+    def testOutBuffer(self):
+        out= np.zeros((2, 10))
+        future= RecordedDataFuture([1, 2], 10, out=out)
+        self.assertTrue(future._buffer() is out)
+        self.assertRaises(AssertionError,
+                          RecordedDataFuture, [1, 2], 10, np.zeros((3, 10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import unittest
+import tempfile
+import shutil
+import os
+import numpy as np
+from pi_gcs.recorder_archive import RecorderArchive
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
+    RecordOption
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+from pi_gcs.gcs2 import WaveformGenerator
+from pi_gcs.continuous_acquisition import ContinuousAcquisition
+from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
+
+__version__ = "$Id:$"
+
+
+class RecorderArchiveTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._dir= tempfile.mkdtemp()
+        self._path= os.path.join(self._dir, 'capture')
+        self._cfg= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS)])
+
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+
+    def _create(self, **kwds):
+        return RecorderArchive.create(
+            self._path, self._cfg.getTableIds(), timeStepInSec=1e-4,
+            dataRecorderCfg=self._cfg, calibration={'pivotValue': 100},
+            **kwds)
+
+
+    def _block(self, first, n):
+        return np.vstack((np.arange(first, first + n),
+                          -np.arange(first, first + n))).astype(float)
+
+
+    def testCalibrationOfTheConfiguration(self):
+        cfg= TipTiltConfiguration()
+        cfg.positionToMilliRadMatrix= np.array([[2., 0.5], [0., 1.]])
+        RecorderArchive.create(self._path, [1, 2],
+                               calibration=cfg.calibration()).close()
+        self.assertEqual(cfg.calibration(),
+                         RecorderArchive.open(self._path).calibration())
+
+
+    def testNothingIsLeftIfTheMetadataCannotBeWritten(self):
+        self.assertRaises(TypeError, RecorderArchive.create, self._path,
+                          [1, 2], calibration={'matrix': np.eye(2)})
+        self.assertEqual([], os.listdir(self._path))
+        self._create().close()
+
+
+    def testAppendAndReopenAsMemoryMap(self):
+        archive= self._create()
+        archive.append(self._block(0, 10), hostTime=1.)
+        archive.append(self._block(10, 5), hostTime=2.)
+        archive.close()
+
+        archive= RecorderArchive.open(self._path)
+        data= archive.data()
+        self.assertEqual((2, 15), data.shape)
+        self.assertTrue(np.array_equal(self._block(0, 15), data))
+        self.assertTrue(isinstance(data.base, np.memmap))
+        self.assertTrue(np.array_equal(self._block(10, 5), archive.chunk(1)))
+        self.assertTrue(np.array_equal([0, 10],
+                                       archive.chunkFirstSampleIndices()))
+        self.assertTrue(np.array_equal([1., 2.], archive.chunkHostTimes()))
+
+
+    def testMetadata(self):
+        self._create().close()
+        archive= RecorderArchive.open(self._path)
+        self.assertEqual([1, 2], archive.channelNames())
+        self.assertEqual(1e-4, archive.timeStepInSec())
+        self.assertEqual({'pivotValue': 100}, archive.calibration())
+        cfg= archive.dataRecorderConfiguration()
+        self.assertEqual([1, 2], cfg.getTableIds())
+        self.assertEqual("B", cfg.getRecordSource(2))
+        self.assertEqual(RecordOption.REAL_POSITION_OF_AXIS,
+                         cfg.getRecordOption(2))
+        self.assertEqual(self._cfg, cfg)
+        self.assertEqual((2, 0), archive.data().shape)
+
+
+    def testCompressedChunks(self):
+        archive= self._create(compress=True)
+        archive.append(self._block(0, 100))
+        archive.append(self._block(100, 100))
+        archive.close()
+        archive= RecorderArchive.open(self._path)
+        self.assertTrue(np.array_equal(self._block(100, 100),
+                                       archive.chunk(1)))
+        self.assertTrue(np.array_equal(self._block(0, 200), archive.data()))
+
+
+    def testReaderSeesChunksAppendedByWriter(self):
+        writer= self._create()
+        writer.append(self._block(0, 10))
+        reader= RecorderArchive.open(self._path)
+        writer.append(self._block(10, 10))
+        self.assertEqual(10, reader.numberOfSamples())
+        reader.refresh()
+        self.assertTrue(np.array_equal(self._block(0, 20), reader.data()))
+        writer.close()
+
+
+    def testAppendModeDropsUncommittedData(self):
+        archive= self._create()
+        archive.append(self._block(0, 10))
+        archive.close()
+        with open(os.path.join(self._path, RecorderArchive.DATA_FILE),
+                  'ab') as f:
+            f.write(b'partial chunk')
+        with open(os.path.join(self._path, RecorderArchive.INDEX_FILE),
+                  'ab') as f:
+            f.write(b'partial record')
+        self.assertEqual(1, RecorderArchive.open(self._path).numberOfChunks())
+        archive= RecorderArchive.open(self._path, append=True)
+        archive.append(self._block(10, 10))
+        archive.close()
+        archive= RecorderArchive.open(self._path)
+        self.assertTrue(np.array_equal(self._block(0, 20), archive.data()))
+
+
+    def testAppendDoesNotRewriteTheMetadata(self):
+        archive= self._create()
+        metadataFile= os.path.join(self._path, RecorderArchive.METADATA_FILE)
+        with open(metadataFile) as f:
+            metadata= f.read()
+        os.remove(metadataFile)
+        archive.append(self._block(0, 10))
+        self.assertFalse(os.path.exists(metadataFile))
+        self.assertEqual(
+            RecorderArchive.CHUNK_RECORD.itemsize,
+            os.path.getsize(os.path.join(self._path,
+                                         RecorderArchive.INDEX_FILE)))
+        archive.close()
+        with open(metadataFile, 'w') as f:
+            f.write(metadata)
+        archive= RecorderArchive.open(self._path)
+        self.assertTrue(np.array_equal(self._block(0, 10), archive.data()))
+
+
+    def testCannotOverwriteAnArchive(self):
+        self._create().close()
+        self.assertRaises(IOError, self._create)
+
+
+    def testAsSinkOfContinuousAcquisition(self):
+        ctrl= FakeGeneralCommandSet()
+        ctrl.setUserDefinedWaveform(1, 1, 50, WaveformGenerator.CLEAR,
+                                    np.arange(50.))
+        ctrl.setUserDefinedWaveform(2, 1, 50, WaveformGenerator.CLEAR,
+                                    np.arange(50.) + 100)
+        archive= self._create()
+        acq= ContinuousAcquisition(ctrl, [1, 2], archive,
+                                   recorderLengthInPoints=20,
+                                   timeStepInSec=1.)
+        ctrl.recordedPoints= 12
+        acq.step()
+        ctrl.recordedPoints= 20
+        acq.step()
+        archive.close()
+        archive= RecorderArchive.open(self._path)
+        self.assertEqual(2, archive.numberOfChunks())
+        self.assertTrue(np.array_equal(np.arange(20.), archive.data()[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
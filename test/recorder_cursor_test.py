@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+from pi_gcs.gcs2 import WaveformGenerator
+from pi_gcs.recorder_cursor import RecorderCursor
+
+__version__ = "$Id:$"
+
+
+class RecorderCursorTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._ctrl= FakeGeneralCommandSet()
+        self._ctrl.setUserDefinedWaveform(1, 1, 100, WaveformGenerator.CLEAR,
+                                          np.arange(100.))
+        self._ctrl.setUserDefinedWaveform(2, 1, 100, WaveformGenerator.CLEAR,
+                                          -np.arange(100.))
+        self._cursor= RecorderCursor(self._ctrl, [1, 2])
+
+
+    def testReadsOnlyNewPoints(self):
+        self._ctrl.recordedPoints= 30
+        first= self._cursor.read()
+        self.assertTrue(np.array_equal(np.arange(30.), first[1]))
+        self.assertTrue(np.array_equal(-np.arange(30.), first[2]))
+        self._ctrl.recordedPoints= 45
+        second= self._cursor.read()
+        self.assertTrue(np.array_equal(np.arange(30., 45.), second[1]))
+        self.assertEqual(46, self._cursor.nextPoint(1))
+
+
+    def testNothingNew(self):
+        self._ctrl.recordedPoints= 10
+        self._cursor.read()
+        self.assertEqual(0, len(self._cursor.read()[2]))
+        self.assertEqual({1: 0, 2: 0}, dict(self._cursor.pointsPending()))
+
+
+    def testMaxPoints(self):
+        self._ctrl.recordedPoints= 50
+        self.assertEqual(20, len(self._cursor.read(maxPoints=20)[1]))
+        self.assertEqual(30, self._cursor.pointsPending()[1])
+
+
+    def testRewindsWhenRecordingRestarts(self):
+        self._ctrl.recordedPoints= 50
+        self._cursor.read()
+        self._ctrl.recordedPoints= 5
+        self.assertTrue(np.array_equal(np.arange(5.),
+                                       self._cursor.read()[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import unittest
+import threading
+import numpy as np
+from pi_gcs.setpoint_channel import CoalescingSetpointChannel
+
+__version__ = "$Id:$"
+
+
+class BlockingTipTilt(object):
+
+    def __init__(self):
+        self.targets= []
+        self.release= threading.Event()
+        self.release.set()
+        self.moving= threading.Event()
+
+
+    def setTargetPosition(self, positionInMilliRad):
+        self.moving.set()
+        self.release.wait()
+        self.targets.append(positionInMilliRad)
+
+
+class CoalescingSetpointChannelTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._tt= BlockingTipTilt()
+        self._channel= CoalescingSetpointChannel(self._tt)
+
+
+    def tearDown(self):
+        self._tt.release.set()
+        self._channel.close(1)
+
+
+    def testSendsPostedTarget(self):
+        self._channel.post([1., 2.])
+        self.assertTrue(self._channel.flush(1))
+        self.assertEqual(1, len(self._tt.targets))
+        self.assertTrue(np.array_equal([1., 2.], self._tt.targets[0]))
+        self.assertEqual(1, self._channel.numberOfSent())
+        self.assertTrue(self._channel.lastLatencyInSec() >= 0)
+
+
+    def testOnlyNewestTargetIsSentWhileMoving(self):
+        self._tt.release.clear()
+        self._channel.post([0., 0.])
+        self._tt.moving.wait(1)
+        for i in range(1, 11):
+            self._channel.post([i, i])
+        self.assertFalse(self._channel.flush(0.01))
+        self._tt.release.set()
+        self.assertTrue(self._channel.flush(1))
+        self.assertEqual(2, len(self._tt.targets))
+        self.assertTrue(np.array_equal([10, 10], self._tt.targets[-1]))
+        self.assertEqual(11, self._channel.numberOfPosted())
+        self.assertEqual(9, self._channel.numberOfDropped())
+        self.assertTrue(self._channel.maxLatencyInSec() >=
+                        self._channel.meanLatencyInSec())
+
+
+    def testExceptionDoesNotStopTheSender(self):
+        def fail(position):
+            raise IOError("link down")
+        self._tt.setTargetPosition= fail
+        self._channel.post([1., 2.])
+        self.assertTrue(self._channel.flush(1))
+        self.assertTrue(isinstance(self._channel.exception(), IOError))
+        self.assertEqual(0, self._channel.numberOfSent())
+        self.assertEqual(1, self._channel.numberOfFailed())
+        self.assertEqual(None, self._channel.meanLatencyInSec())
+        del self._tt.setTargetPosition
+        self._channel.post([3., 4.])
+        self.assertTrue(self._channel.flush(1))
+        self.assertTrue(np.array_equal([3., 4.], self._tt.targets[-1]))
+        self.assertEqual(1, self._channel.numberOfSent())
+        self.assertEqual(1, self._channel.numberOfFailed())
+
+
+    def testCloseSendsPendingTarget(self):
+        self._channel.post([3., 4.])
+        self._channel.close(1)
+        self.assertTrue(np.array_equal([3., 4.], self._tt.targets[-1]))
+        self.assertRaises(AssertionError, self._channel.post, [0., 0.])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+from pi_gcs.shadowed_gcs2 import ShadowedGeneralCommandSet
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
+    RecordOption
+from pi_gcs.tip_tilt_2_axes import TipTilt2Axis
+from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
+from pi_gcs.tip_tilt_status import TipTiltStatus
+
+__version__ = "$Id:$"
+
+
+class CountingFakeGeneralCommandSet(FakeGeneralCommandSet):
+
+    def __init__(self):
+        FakeGeneralCommandSet.__init__(self)
+        self.calls= {}
+        self.batches= []
+        self._inBatch= False
+
+
+    def _count(self, name):
+        # queries replayed by executeCommandBatch are not direct calls
+        if not self._inBatch:
+            self.calls[name]= self.calls.get(name, 0) + 1
+
+
+    def getServoControlMode(self, axesString):
+        self._count('getServoControlMode')
+        return FakeGeneralCommandSet.getServoControlMode(self, axesString)
+
+
+    def getUpperVoltageLimit(self, channels):
+        self._count('getUpperVoltageLimit')
+        return FakeGeneralCommandSet.getUpperVoltageLimit(self, channels)
+
+
+    def getDataRecorderConfiguration(self):
+        self._count('getDataRecorderConfiguration')
+        return FakeGeneralCommandSet.getDataRecorderConfiguration(self)
+
+
+    def getRecordTableRate(self):
+        self._count('getRecordTableRate')
+        return FakeGeneralCommandSet.getRecordTableRate(self)
+
+
+    def executeCommandBatch(self, batch):
+        self._count('executeCommandBatch')
+        self.batches.append(batch.commandString())
+        self._inBatch= True
+        try:
+            return FakeGeneralCommandSet.executeCommandBatch(self, batch)
+        finally:
+            self._inBatch= False
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now= 0.
+
+
+    def time(self):
+        return self.now
+
+
+class ShadowedGeneralCommandSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self._fake= CountingFakeGeneralCommandSet()
+        self._time= FakeTime()
+        self._ctrl= ShadowedGeneralCommandSet(self._fake,
+                                              timeModule=self._time)
+
+
+    def _calls(self, name):
+        return self._fake.calls.get(name, 0)
+
+
+    def testGetterServedAfterSetter(self):
+        self._ctrl.setServoControlMode('A B', [True, False])
+        self.assertTrue(np.array_equal(
+            [False, True], self._ctrl.getServoControlMode('B A')))
+        self.assertEqual(0, self._calls('getServoControlMode'))
+
+
+    def testUnknownValuesAreReadOnce(self):
+        self._fake.setUpperVoltageLimit([1, 2], [10, 20])
+        self.assertTrue(np.array_equal(
+            [10, 20], self._ctrl.getUpperVoltageLimit([1, 2])))
+        self.assertTrue(np.array_equal(
+            [20], self._ctrl.getUpperVoltageLimit(2)))
+        self.assertEqual(1, self._calls('getUpperVoltageLimit'))
+
+
+    def testMaxAge(self):
+        self._ctrl.setMaxAge(1.0)
+        self._ctrl.setRecordTableRate(4)
+        self.assertEqual(4, self._ctrl.getRecordTableRate())
+        self._time.now= 2.0
+        self.assertEqual(4, self._ctrl.getRecordTableRate())
+        self.assertEqual(1, self._calls('getRecordTableRate'))
+
+
+    def testSettersInBatchAreRecorded(self):
+        batch= self._ctrl.commandBatch()
+        batch.setServoControlMode('A B', [True, True])
+        batch.setUpperVoltageLimit([1, 2, 3], [100., 100., 100.])
+        batch.execute()
+        self.assertTrue(np.array_equal(
+            [True, True], self._ctrl.getServoControlMode('A B')))
+        self.assertTrue(np.array_equal(
+            [100., 100., 100.], self._ctrl.getUpperVoltageLimit([1, 2, 3])))
+        self.assertEqual(0, self._calls('getServoControlMode'))
+        self.assertEqual(0, self._calls('getUpperVoltageLimit'))
+
+
+    def testVerifyDetectsChangesMadeBehindTheShadow(self):
+        self._ctrl.setServoControlMode('A B', [True, True])
+        self._ctrl.setWaveGeneratorStartStopMode([0, 0, 0])
+        self._ctrl.setConnectionOfWaveTableToWaveGenerator([1, 2], [1, 2])
+        self._fake.setServoControlMode('B', [False])
+        self._fake.calls= {}
+        mismatches= self._ctrl.verify()
+        self.assertEqual({ShadowedGeneralCommandSet.SVO: {'B': (True, False)}},
+                         mismatches)
+        self.assertTrue(np.array_equal(
+            [True, False], self._ctrl.getServoControlMode('A B')))
+        self.assertEqual(0, self._calls('getServoControlMode'))
+
+
+    def testVerifyIsOneRoundTrip(self):
+        self._ctrl.setServoControlMode('A B', [True, True])
+        self._ctrl.setRecordTableRate(2)
+        self._ctrl.setDataRecorderConfiguration(
+            self._fake.getDataRecorderConfiguration())
+        self._fake.calls= {}
+        self.assertEqual({}, self._ctrl.verify())
+        self.assertEqual(1, self._calls('executeCommandBatch'))
+
+
+    def testPartialDataRecorderConfigurationIsNotServed(self):
+        cfg= DataRecorderConfiguration(
+            [(1, "A", RecordOption.POSITION_ERROR_OF_AXIS)])
+        self._ctrl.setDataRecorderConfiguration(cfg)
+        got= self._ctrl.getDataRecorderConfiguration()
+        self.assertEqual([1], got.getTableIds())
+        self._ctrl.getDataRecorderConfiguration()
+        self.assertEqual(1, self._calls('getDataRecorderConfiguration'))
+
+
+    def testCloseConnectionDropsShadow(self):
+        self._ctrl.setServoControlMode('A', [True])
+        self._ctrl.closeConnection()
+        self._ctrl.getServoControlMode('A')
+        self.assertEqual(1, self._calls('getServoControlMode'))
+
+
+    def testOtherMethodsAreForwarded(self):
+        self.assertEqual(['A', 'B', 'C'], self._ctrl.getAxesIdentifiers())
+
+
+    def testTipTiltControlLoopStateIsServedLocally(self):
+        tt= TipTilt2Axis(self._ctrl, TipTiltConfiguration())
+        tt.setUp()
+        self.assertTrue(tt.isControlLoopEnabled())
+        tt.disableControlLoop()
+        self.assertFalse(tt.isControlLoopEnabled())
+        self.assertEqual(0, self._calls('getServoControlMode'))
+
+
+    def testTipTiltStatusServesControlLoopStateLocally(self):
+        tt= TipTilt2Axis(self._ctrl, TipTiltConfiguration())
+        tt.setUp()
+        status= tt.statusSnapshot([TipTiltStatus.CONTROL_LOOP_CLOSED,
+                                   TipTiltStatus.OUTPUT_VOLTAGE])
+        self.assertTrue(status.controlLoopClosed)
+        self.assertEqual(3, len(status.outputVoltage))
+        self.assertEqual('VOL? 1 2 3', self._fake.batches[-1])
+
+
+    def testBatchQueriesAfterASetterAreSent(self):
+        self._ctrl.setServoControlMode('A B', [True, True])
+        batch= self._ctrl.commandBatch()
+        batch.getServoControlMode('A B')
+        batch.setServoControlMode('A', [False])
+        batch.getServoControlMode('A B')
+        before, after= batch.execute()
+        self.assertTrue(np.array_equal([True, True], before))
+        self.assertTrue(np.array_equal([False, True], after))
+        self.assertEqual('SVO A 0\nSVO? A B', self._fake.batches[-1])
+        self.assertTrue(np.array_equal([False, True],
+                                       self._ctrl.getServoControlMode('A B')))
+
+
+if __name__ == "__main__":
+    unittest.main()
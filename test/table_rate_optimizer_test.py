@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.gcs2 import WaveformGenerator
+from pi_gcs.table_rate_optimizer import resample, reconstruct, \
+    maxResamplingError, optimizeTableRate
+
+__version__ = "$Id:$"
+
+
+class TableRateOptimizerTest(unittest.TestCase):
+
+
+    def testReconstruct(self):
+        table= np.array([0., 4., 8.])
+        self.assertTrue(np.array_equal(
+            [0, 0, 4, 4, 8, 8],
+            reconstruct(table, 2, WaveformGenerator.NO_INTERPOLATION)))
+        self.assertTrue(np.array_equal(
+            [0, 2, 4, 6, 8, 4],
+            reconstruct(table, 2, WaveformGenerator.LINEAR_INTERPOLATION)))
+
+
+    def testResampleNeedsAMultipleOfTheFactor(self):
+        self.assertTrue(np.array_equal([0, 3], resample(np.arange(6.), 3)))
+        self.assertRaises(AssertionError, resample, np.arange(7.), 3)
+
+
+    def testTriangleIsReproducedByLinearInterpolation(self):
+        triangle= np.concatenate((np.arange(0., 8.), np.arange(8., 0., -1)))
+        self.assertAlmostEqual(0, maxResamplingError(
+            triangle, 8, WaveformGenerator.LINEAR_INTERPOLATION))
+        choice= optimizeTableRate([triangle], 1e-9)
+        self.assertEqual(8, choice.factor)
+        self.assertEqual(WaveformGenerator.LINEAR_INTERPOLATION,
+                         choice.interpolationType)
+        self.assertTrue(np.array_equal([0., 8.], choice.trajectories[0]))
+
+
+    def testSmoothWaveformWithinTheErrorBound(self):
+        t= np.arange(1000)
+        circle= [np.cos(2 * np.pi * t / 1000.), np.sin(2 * np.pi * t / 1000.)]
+        choice= optimizeTableRate(circle, 1e-2)
+        self.assertEqual(40, choice.factor)
+        self.assertTrue(choice.maxError <= 1e-2)
+        self.assertEqual([1000 // choice.factor] * 2,
+                         [len(c) for c in choice.trajectories])
+        self.assertTrue(optimizeTableRate(circle, 1e-3).factor <
+                        choice.factor)
+        self.assertEqual(25, optimizeTableRate(circle, 1e-2,
+                                               maxFactor=30).factor)
+
+
+    def testFactorDividesEveryLength(self):
+        choice= optimizeTableRate([np.zeros(12), np.zeros(18)], 0.)
+        self.assertEqual(6, choice.factor)
+        self.assertEqual([2, 3], [len(c) for c in choice.trajectories])
+
+
+    def testNoResamplingIfNothingFits(self):
+        noise= np.random.RandomState(1).normal(size=64)
+        choice= optimizeTableRate([noise], 1e-6)
+        self.assertEqual(1, choice.factor)
+        self.assertEqual(WaveformGenerator.NO_INTERPOLATION,
+                         choice.interpolationType)
+        self.assertTrue(np.array_equal(noise, choice.trajectories[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
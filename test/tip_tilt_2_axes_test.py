@@ -1,9 +1,15 @@
 import unittest
+import time
 import numpy as np
 from pi_gcs.tip_tilt_2_axes import TipTilt2Axis
 from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
 from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
-from pi_gcs.gcs2 import PIException
+from pi_gcs.tip_tilt_calibration import TipTiltCalibration
+from pi_gcs.gcs2 import PIException, WaveformGenerator
+from pi_gcs.tip_tilt_status import TipTiltStatus
+from pi_gcs.wave_table_manager import WaveTableManager
+from pi_gcs.data_recorder_configuration import DataRecorderConfiguration,\
+    RecordOption
 
 
 class TipTilt2AxisTest(unittest.TestCase):
@@ -121,14 +127,119 @@ class TipTilt2AxisTest(unittest.TestCase):
                                          np.arange(10))
 
         howManySamples= 100
-        nRecorderTables= self._ctrl.getNumberOfRecorderTables()
+        nConfiguredTables= len(
+            self._tt._defaultDataRecorderConfiguration().getTableIds())
         cntr= self._ctrl.triggerStartRecordingInSyncWithWaveGenerator
+        tablesRead= self._ctrl.recordTablesRead
 
         recData= self._tt.getRecordedData(howManySamples)
-        self.assertEqual((nRecorderTables + 1, howManySamples), recData.shape)
+        self.assertEqual((nConfiguredTables + 1, howManySamples),
+                         recData.shape)
         self.assertEqual(
             cntr + 1,
             self._ctrl.triggerStartRecordingInSyncWithWaveGenerator)
+        self.assertEqual(tablesRead + nConfiguredTables,
+                         self._ctrl.recordTablesRead)
+
+
+    def testRecordingOnlyConfiguredTables(self):
+        self._tt.startFreeformModulation(np.arange(10.), np.arange(10.))
+        cfg= DataRecorderConfiguration([
+            (2, "B", RecordOption.REAL_POSITION_OF_AXIS),
+            (5, "A", RecordOption.TARGET_POSITION_OF_AXIS)])
+        recData= self._tt.getRecordedData(20, cfg)
+        self.assertEqual((3, 20), recData.shape)
+        wantB= self._tt._gcsUnitsToMilliRadOneAxis(
+            self._ctrl.getWaveform(2), self._tt.AXIS_B)
+        wantA= self._tt._gcsUnitsToMilliRadOneAxis(
+            self._ctrl.getWaveform(1), self._tt.AXIS_A)
+        self.assertTrue(np.allclose(np.tile(wantB, 2), recData[1]))
+        self.assertTrue(np.allclose(np.tile(wantA, 2), recData[2]))
+
+
+    def testContinuousAcquisitionInMilliRad(self):
+        self._tt.startFreeformModulation(np.arange(10.), np.arange(10.))
+        blocks= []
+        acq= self._tt.continuousAcquisition(
+            lambda i, block: blocks.append(block.copy()), 100)
+        self._ctrl.recordedPoints= 10
+        acq.step()
+        acq.step()
+        self.assertEqual((6, 10), blocks[0].shape)
+        self.assertTrue(np.allclose(np.arange(10.), blocks[0][0]))
+
+
+    def testConvertRecordedDataInPlace(self):
+        cfg= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "1", RecordOption.VOLTAGE_OF_PIEZO_CHANNEL),
+            (3, "B", RecordOption.POSITION_ERROR_OF_AXIS),
+            (4, "A", RecordOption.TARGET_POSITION_OF_AXIS)])
+        recData= np.arange(12.).reshape(4, 3)
+        aLin, aOff= self._posToMilliRadALinear, self._posToMilliRadAOffset
+        bLin, bOff= self._posToMilliRadBLinear, self._posToMilliRadBOffset
+        want= np.array([aLin * recData[0] + aOff,
+                        recData[1],
+                        bLin * recData[2] + bOff,
+                        aLin * recData[3] + aOff])
+        out= self._tt.convertRecordedDataToMilliRad(recData.copy(), cfg)
+        self.assertTrue(np.allclose(want, out))
+        got= self._tt.convertRecordedDataToMilliRad(recData, cfg, out=recData)
+        self.assertTrue(got is recData)
+        self.assertTrue(np.allclose(want, recData))
+
+
+    def testConvertRecordedDataNeedsAConfiguration(self):
+        self.assertRaises(ValueError, self._tt.convertRecordedDataToMilliRad,
+                          np.zeros((6, 3)))
+
+
+    def testCalibrationFollowsTheConfiguration(self):
+        self._tt.setTargetPosition([1., 2.])
+        self._cfg.positionToMilliRadAxisALinearCoeff= 4.
+        self._cfg.positionToMilliRadAxisBOffsetCoeff= 1.
+        self._tt.setTargetPosition([1., 2.])
+        self.assertTrue(np.allclose(
+            [(1. - self._posToMilliRadAOffset) / 4.,
+             (2. - 1.) / self._posToMilliRadBLinear],
+            self._ctrl.getTargetPosition('A B')))
+        self._cfg.positionToMilliRadMatrix= [[2., 0.], [0., 1.]]
+        self.assertTrue(np.allclose([2., 0.],
+                                    self._tt.calibration().matrix()[0]))
+        custom= TipTiltCalibration(np.eye(2))
+        self._tt.setCalibration(custom)
+        self._cfg.positionToMilliRadAxisALinearCoeff= 3.
+        self.assertTrue(self._tt.calibration() is custom)
+
+
+    def testCoupledCalibration(self):
+        self._cfg.positionToMilliRadMatrix= [[2., 0.5], [-0.2, 1.]]
+        tt= TipTilt2Axis(self._ctrl, self._cfg)
+        tt.setTargetPosition([1.5, -2.])
+        self.assertTrue(np.allclose([1.5, -2.], tt.getTargetPosition()))
+        cfg= DataRecorderConfiguration([
+            (1, "A", RecordOption.REAL_POSITION_OF_AXIS),
+            (2, "1", RecordOption.VOLTAGE_OF_PIEZO_CHANNEL),
+            (3, "B", RecordOption.REAL_POSITION_OF_AXIS)])
+        recData= np.arange(12.).reshape(3, 4)
+        converted= tt.convertRecordedDataToMilliRad(recData, cfg)
+        want= tt.calibration().gcsUnitsToMilliRad(recData[[0, 2]])
+        self.assertTrue(np.allclose(want, converted[[0, 2]]))
+        self.assertTrue(np.array_equal(recData[1], converted[1]))
+        self.assertRaises(
+            ValueError, tt.convertRecordedDataToMilliRad, recData[:2],
+            DataRecorderConfiguration(cfg.tables()[:2]))
+
+
+    def testRecordedDataIntoOut(self):
+        self._tt.startFreeformModulation(np.arange(10.), np.arange(10.))
+        out= np.zeros((7, 20))
+        recData= self._tt.getRecordedData(20, out=out)
+        self.assertTrue(recData is out)
+        self.assertTrue(np.allclose(
+            self._tt._gcsUnitsToMilliRadOneAxis(
+                np.tile(self._ctrl.getWaveform(1), 2), self._tt.AXIS_A),
+            out[1]))
 
 
     def testConvertFromGCSUnitToMilliRad(self):
@@ -197,6 +308,238 @@ class TipTilt2AxisTest(unittest.TestCase):
         self.assertEqual(40e-6, ts)
 
 
+    def testRestartingKnownModulationDoesNotUploadAgain(self):
+        uploads= []
+        upload= self._ctrl.setUserDefinedWaveform
+        self._ctrl.setUserDefinedWaveform= \
+            lambda *args: uploads.append(args[0]) or upload(*args)
+        circle= np.cos(np.arange(10.)), np.sin(np.arange(10.))
+        self._tt.startFreeformModulation(*circle)
+        self._tt.startFreeformModulation(*circle)
+        self.assertEqual([1, 2], uploads)
+        self._tt.startFreeformModulation(np.arange(10.), np.arange(10.))
+        self.assertEqual([1, 2, 3, 1], uploads)
+        self._tt.startFreeformModulation(*circle)
+        self.assertEqual([1, 2, 3, 1, 3], uploads)
+        self.assertTrue(np.array_equal(
+            [3, 2], self._ctrl.getConnectionOfWaveTableToWaveGenerator(
+                [1, 2])))
+        self.assertTrue(np.array_equal(
+            [1, 1, 0], self._ctrl.getWaveGeneratorStartStopMode()))
+        self.assertTrue(self._tt.isModulationEnabled())
+
+
+    def testFreeformModulationUploadsOnePeriod(self):
+        t= np.arange(600)
+        self._tt.startFreeformModulation(np.sin(2 * np.pi * t / 20.),
+                                         np.cos(2 * np.pi * t / 30.),
+                                         uploadOnePeriod=True)
+        self.assertEqual(60, len(self._ctrl.getWaveform(1)))
+        self.assertEqual(60, len(self._ctrl.getWaveform(2)))
+        recData= self._tt.getRecordedData(600)
+        self.assertTrue(np.allclose(np.sin(2 * np.pi * t / 20.),
+                                    recData[1]))
+        self._tt.startFreeformModulation(np.tile(np.arange(4.), 3),
+                                         np.arange(5.), uploadOnePeriod=True)
+        tableA, tableB= self._ctrl.getConnectionOfWaveTableToWaveGenerator(
+            [1, 2])
+        self.assertEqual(4, len(self._ctrl.getWaveform(tableA)))
+        self.assertEqual(5, len(self._ctrl.getWaveform(tableB)))
+        self._tt.startFreeformModulation(np.tile(np.arange(4.), 3),
+                                         np.arange(12.))
+        tableA= self._ctrl.getConnectionOfWaveTableToWaveGenerator([1])[0]
+        self.assertEqual(12, len(self._ctrl.getWaveform(tableA)))
+
+
+    def testWaveformsAreUploadedWhole(self):
+        diffs= []
+        upload= self._ctrl.uploadUserDefinedWaveform
+        self._ctrl.uploadUserDefinedWaveform= \
+            lambda *args, **kwds: diffs.append(kwds['diff']) or \
+            upload(*args, **kwds)
+        self._tt.startFreeformModulation(np.arange(10.) ** 2, -np.arange(10.))
+        self.assertEqual([False, False], diffs)
+
+
+    def testFreeformModulationWithInterpolatedTableRate(self):
+        t= np.arange(1000)
+        circle= (np.cos(2 * np.pi * t / 1000.), np.sin(2 * np.pi * t / 1000.))
+        self._ctrl.setWaveGeneratorTableRate(2)
+        self._tt.startFreeformModulation(*circle,
+                                         maxResamplingErrorInMilliRad=1e-2)
+        factor, interpolation= self._tt.tableRate()
+        self.assertEqual(40, factor)
+        self.assertEqual(WaveformGenerator.LINEAR_INTERPOLATION,
+                         interpolation)
+        self.assertEqual(1000 // factor, len(self._ctrl.getWaveform(1)))
+        self.assertTrue(np.array_equal(
+            [2 * factor] * 3, self._ctrl.getWaveGeneratorTableRate()))
+        self.assertTrue(np.array_equal(
+            [1, 1, 1], self._ctrl.getWaveGeneratorInterpolation()))
+        self._tt.startFreeformModulation(*circle)
+        tableA= self._ctrl.getConnectionOfWaveTableToWaveGenerator([1])[0]
+        self.assertEqual(1000, len(self._ctrl.getWaveform(tableA)))
+        self.assertTrue(np.array_equal(
+            [2, 2, 2], self._ctrl.getWaveGeneratorTableRate()))
+        self.assertTrue(np.array_equal(
+            [0, 0, 0], self._ctrl.getWaveGeneratorInterpolation()))
+
+
+    def testBaseTableRateIsReadAgainAfterReconnecting(self):
+        t= np.arange(1000)
+        circle= (np.cos(2 * np.pi * t / 1000.), np.sin(2 * np.pi * t / 1000.))
+        self._tt.startFreeformModulation(*circle,
+                                         maxResamplingErrorInMilliRad=1e-2)
+        self._ctrl.setWaveGeneratorTableRate(3)
+        self._tt.setUp()
+        self._tt.startFreeformModulation(*circle,
+                                         maxResamplingErrorInMilliRad=1e-2)
+        self.assertTrue(np.array_equal(
+            [3 * 40] * 3, self._ctrl.getWaveGeneratorTableRate()))
+
+
+    def testSwitchToAnotherTableRateRestartsModulation(self):
+        t= np.arange(1000)
+        circle= (np.cos(2 * np.pi * t / 1000.), np.sin(2 * np.pi * t / 1000.))
+        self._tt.startFreeformModulation(*circle)
+        commands= self._recordWaveGeneratorCommands()
+        self._tt.switchFreeformModulation(*circle,
+                                          maxResamplingErrorInMilliRad=1e-2)
+        self.assertEqual(('WGO', [0, 0, 0]), commands[0])
+        self.assertNotEqual(1, self._tt.tableRate()[0])
+        self.assertTrue(self._tt.isModulationEnabled())
+
+
+    def testFreeformModulationUploadsOnePeriodWithinTolerance(self):
+        t= np.arange(600)
+        noise= 1e-6 * np.random.RandomState(1).normal(size=(2, 600))
+        circle= (np.sin(2 * np.pi * t / 20.) + noise[0],
+                 np.cos(2 * np.pi * t / 20.) + noise[1])
+        self._tt.startFreeformModulation(*circle, uploadOnePeriod=True)
+        tableA= self._ctrl.getConnectionOfWaveTableToWaveGenerator([1])[0]
+        self.assertEqual(600, len(self._ctrl.getWaveform(tableA)))
+        self._tt.startFreeformModulation(*circle, uploadOnePeriod=True,
+                                         periodToleranceInMilliRad=1e-4)
+        tableA= self._ctrl.getConnectionOfWaveTableToWaveGenerator([1])[0]
+        self.assertEqual(20, len(self._ctrl.getWaveform(tableA)))
+
+
+    def _recordWaveGeneratorCommands(self):
+        commands= []
+        wgo= self._ctrl.setWaveGeneratorStartStopMode
+        wsl= self._ctrl.setConnectionOfWaveTableToWaveGenerator
+        self._ctrl.setWaveGeneratorStartStopMode= \
+            lambda mode: commands.append(('WGO', list(mode))) or wgo(mode)
+        self._ctrl.setConnectionOfWaveTableToWaveGenerator= \
+            lambda gens, tables: commands.append(
+                ('WSL', list(gens), list(tables))) or wsl(gens, tables)
+        return commands
+
+
+    def testSwitchModulationWithDoubleBuffer(self):
+        self._tt.WAVE_TABLE_IDS= [1, 2, 3, 4]
+        self._tt._waveTables= WaveTableManager(self._tt.WAVE_TABLE_IDS)
+        self._tt.startFreeformModulation(np.arange(10.) ** 2, -np.arange(10.))
+        commands= self._recordWaveGeneratorCommands()
+        self._tt.switchFreeformModulation(np.arange(10.), np.arange(10.))
+        self.assertEqual([('WSL', [1, 2], [3, 4])], commands)
+        self.assertTrue(self._tt.isModulationEnabled())
+        self.assertEqual(set([3, 4]),
+                         self._tt.waveTableManager().pinnedTables())
+        self.assertTrue(np.allclose(
+            np.arange(10.),
+            self._tt._gcsUnitsToMilliRadOneAxis(
+                self._ctrl.getWaveform(3), self._tt.AXIS_A)))
+
+
+    def testWaveTableMemoryOfTheController(self):
+        self._ctrl.maximumNumberOfWavePoints= 300
+        self._tt.setUp()
+        manager= self._tt.waveTableManager()
+        self.assertEqual(300, manager.totalPoints())
+        self._tt.startFreeformModulation(np.arange(150.), -np.arange(150.))
+        self._tt.startFreeformModulation(np.arange(150.) ** 2,
+                                         np.arange(150.))
+        self.assertEqual(2, manager.numberOfEvictions())
+        self.assertEqual(300, manager.usedPoints())
+        self.assertTrue(np.array_equal(
+            [1, 2], self._ctrl.getConnectionOfWaveTableToWaveGenerator(
+                [1, 2])))
+
+
+    def testSwitchModulationOneAxisAtATime(self):
+        self._tt.startFreeformModulation(np.arange(10.) ** 2, -np.arange(10.))
+        commands= self._recordWaveGeneratorCommands()
+        self._tt.switchFreeformModulation(np.arange(10.), np.arange(10.))
+        self.assertEqual([('WSL', [1], [3]), ('WSL', [2], [1])], commands)
+        self.assertTrue(np.array_equal(
+            [3, 1], self._ctrl.getConnectionOfWaveTableToWaveGenerator(
+                [1, 2])))
+
+
+    def testSwitchModulationRestartsGeneratorsIfLengthChanges(self):
+        self._tt.WAVE_TABLE_IDS= [1, 2, 3, 4]
+        self._tt._waveTables= WaveTableManager(self._tt.WAVE_TABLE_IDS)
+        self._tt.startFreeformModulation(np.arange(10.) ** 2, -np.arange(10.))
+        commands= self._recordWaveGeneratorCommands()
+        self._tt.switchFreeformModulation(np.arange(20.), np.arange(20.))
+        self.assertEqual([('WSL', [1, 2], [3, 4]),
+                          ('WGO', [0, 0, 0]),
+                          ('WGO', [1, 1, 0])], commands)
+
+
+    def testSwitchModulationWithoutSpareTablesRestarts(self):
+        self._tt.WAVE_TABLE_IDS= [1, 2]
+        self._tt._waveTables= WaveTableManager(self._tt.WAVE_TABLE_IDS)
+        self._tt.startFreeformModulation(np.arange(10.) ** 2, -np.arange(10.))
+        self._tt.switchFreeformModulation(np.arange(10.), np.arange(10.))
+        self.assertTrue(self._tt.isModulationEnabled())
+        self.assertTrue(np.array_equal(
+            [1, 1, 0], self._ctrl.getWaveGeneratorStartStopMode()))
+
+
+    def testSwitchModulationDoesNotHideControllerErrors(self):
+        self._tt.startFreeformModulation(np.arange(10.) ** 2, -np.arange(10.))
+
+        def failingBatch(batch):
+            raise ValueError("cannot parse answer")
+
+        self._ctrl.executeCommandBatch= failingBatch
+        self.assertRaises(ValueError, self._tt.switchFreeformModulation,
+                          np.arange(10.), np.arange(10.))
+
+
+    def testStatusSnapshotInOneRoundTrip(self):
+        self._ctrl.setTargetPosition(self._tt.ALL_AXES, np.array([1., 2.]))
+        batches= []
+        execute= self._ctrl.executeCommandBatch
+        self._ctrl.executeCommandBatch= \
+            lambda batch: batches.append(batch) or execute(batch)
+        before= time.time()
+        status= self._tt.statusSnapshot()
+        self.assertEqual(1, len(batches))
+        self.assertTrue(before <= status.timestamp <= time.time())
+        self.assertTrue(np.allclose(self._tt.getPosition(), status.position))
+        self.assertTrue(np.allclose(self._tt.getTargetPosition(),
+                                    status.target))
+        self.assertEqual(3, len(status.outputVoltage))
+        self.assertTrue(status.controlLoopClosed)
+        self.assertTrue(np.array_equal([False, False], status.overflow))
+        self.assertEqual(set(TipTiltStatus.ALL_FIELDS),
+                         set(self._tt.status().keys()))
+
+
+    def testStatusSnapshotOfSomeFields(self):
+        status= self._tt.statusSnapshot([TipTiltStatus.OVERFLOW,
+                                         TipTiltStatus.CONTROL_LOOP_CLOSED])
+        self.assertEqual(None, status.position)
+        self.assertEqual(None, status.outputVoltage)
+        self.assertTrue(status.controlLoopClosed)
+        self.assertEqual(set([TipTiltStatus.OVERFLOW,
+                              TipTiltStatus.CONTROL_LOOP_CLOSED]),
+                         set(status.asDict().keys()))
+
+
     def testSetOpenLoopValue(self):
         self._tt.stopModulation()
         self._tt.disableControlLoop()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.tip_tilt_calibration import TipTiltCalibration
+from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
+
+__version__ = "$Id:$"
+
+
+class TipTiltCalibrationTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._matrix= [[2.0, 0.3], [-0.1, 0.5]]
+        self._offset= [1.0, -4.0]
+        self._cal= TipTiltCalibration(self._matrix, self._offset)
+
+
+    def testAffineTransformOfBlock(self):
+        gcs= np.random.uniform(-10, 10, (2, 1000))
+        want= np.dot(self._matrix, gcs) + np.array(self._offset)[:, None]
+        self.assertTrue(np.allclose(want, self._cal.gcsUnitsToMilliRad(gcs)))
+
+
+    def testRoundTrip(self):
+        gcs= np.random.uniform(-10, 10, (2, 1000))
+        mrad= self._cal.gcsUnitsToMilliRad(gcs)
+        self.assertTrue(np.allclose(gcs, self._cal.milliRadToGcsUnits(mrad)))
+
+
+    def testSinglePosition(self):
+        mrad= self._cal.gcsUnitsToMilliRad([1., 2.])
+        self.assertEqual((2,), mrad.shape)
+        self.assertTrue(np.allclose([3.6, -3.1], mrad))
+
+
+    def testTrajectoryOfPointsIntoOut(self):
+        trajectory= np.random.uniform(-10, 10, (100, 2))
+        out= np.zeros((100, 2))
+        self._cal.gcsUnitsToMilliRad(trajectory.T, out=out.T)
+        self.assertTrue(np.allclose(
+            self._cal.gcsUnitsToMilliRad(trajectory.T).T, out))
+
+
+    def testPolynomialRoundTrip(self):
+        cal= TipTiltCalibration(self._matrix, self._offset,
+                                [[0.01, 0., 1., 0.], [-0.002, 1.1, 0.3]])
+        gcs= np.random.uniform(-10, 10, (2, 1000))
+        mrad= cal.gcsUnitsToMilliRad(gcs)
+        self.assertTrue(np.allclose(
+            np.polyval([0.01, 0., 1., 0.], gcs[0]) * 2.0 +
+            np.polyval([-0.002, 1.1, 0.3], gcs[1]) * 0.3 + 1.0, mrad[0]))
+        self.assertTrue(np.allclose(gcs, cal.milliRadToGcsUnits(mrad)))
+
+
+    def testOneAxisConversionNeedsUncoupledAxes(self):
+        self.assertRaises(ValueError,
+                          self._cal.axisGcsUnitsToMilliRad, 1., 0)
+        cal= TipTiltCalibration(np.diag([2., 3.]), self._offset)
+        self.assertEqual(-1., cal.axisGcsUnitsToMilliRad(1., 1))
+        self.assertEqual(1., cal.axisMilliRadToGcsUnits(-1., 1))
+
+
+    def testFromConfiguration(self):
+        cfg= TipTiltConfiguration()
+        cfg.positionToMilliRadAxisALinearCoeff= 2.
+        cfg.positionToMilliRadAxisBOffsetCoeff= 5.
+        cal= TipTiltCalibration.fromConfiguration(cfg)
+        self.assertTrue(cal.isUncoupled())
+        self.assertTrue(cal.isLinear())
+        self.assertTrue(np.allclose([2., 6.],
+                                    cal.gcsUnitsToMilliRad([1., 1.])))
+        cfg.positionToMilliRadMatrix= self._matrix
+        cal= TipTiltCalibration.fromConfiguration(cfg)
+        self.assertFalse(cal.isUncoupled())
+
+
+if __name__ == "__main__":
+    unittest.main()
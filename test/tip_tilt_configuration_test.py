@@ -1,5 +1,7 @@
 #!/usr/bin/env python
+import json
 import unittest
+import numpy as np
 from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
 
 __version__ = "$Id:$"
@@ -35,6 +37,17 @@ class TipTiltConfigurationTest(unittest.TestCase):
                          self._cfg.positionToMilliRadAxisBOffsetCoeff)
 
 
+    def testCalibrationIsJsonSerializable(self):
+        self._cfg.positionToMilliRadAxisALinearCoeff= np.float32(2.)
+        self._cfg.positionToMilliRadMatrix= np.array([[2., 0.5], [0., 1.]])
+        self._cfg.positionToMilliRadPolynomials= [np.array([1e-3, 1., 0.]),
+                                                  np.array([1., 0.])]
+        self.assertEqual([[2., 0.5], [0., 1.]],
+                         self._cfg.positionToMilliRadMatrix)
+        calibration= json.loads(json.dumps(self._cfg.calibration()))
+        self.assertEqual([[1e-3, 1., 0.], [1., 0.]], calibration[
+            TipTiltConfiguration.POSITION_TO_MILLIRAD_POLYNOMIALS])
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+import time
+import unittest
+import numpy as np
+from pi_gcs.trajectory_streamer import TrajectoryStreamer
+from pi_gcs.tip_tilt_2_axes import TipTilt2Axis
+from pi_gcs.tip_tilt_configuration import TipTiltConfiguration
+from pi_gcs.fake_gcs2 import FakeGeneralCommandSet
+
+__version__ = "$Id:$"
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now= 0.
+
+
+    def monotonic(self):
+        return self.now
+
+
+    def time(self):
+        return self.now
+
+
+    def sleep(self, seconds):
+        self.now+= seconds
+
+
+class SlowTipTilt(object):
+    '''
+    Records the setpoints, MOV i taking moveTimes[i] seconds
+    '''
+
+    def __init__(self, tipTilt, fakeTime, moveTimes):
+        self._tipTilt= tipTilt
+        self._time= fakeTime
+        self._moveTimes= list(moveTimes)
+        self.setpoints= []
+
+
+    def calibration(self):
+        return self._tipTilt.calibration()
+
+
+    def setTargetPositionInGcsUnits(self, positionInGcsUnits):
+        self.setpoints.append(np.array(positionInGcsUnits))
+        self._tipTilt.setTargetPositionInGcsUnits(positionInGcsUnits)
+        self._time.now+= self._moveTimes.pop(0)
+
+
+class TrajectoryStreamerTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._ctrl= FakeGeneralCommandSet()
+        cfg= TipTiltConfiguration()
+        cfg.positionToMilliRadAxisALinearCoeff= 2.
+        cfg.positionToMilliRadAxisBLinearCoeff= 4.
+        self._tt= TipTilt2Axis(self._ctrl, cfg)
+        self._tt.setUp()
+        self._time= FakeTime()
+        self._trajectory= np.vstack((np.arange(10.), -np.arange(10.))).T
+
+
+    def _streamer(self, moveTimes):
+        self._slow= SlowTipTilt(self._tt, self._time, moveTimes)
+        return TrajectoryStreamer(self._slow, self._trajectory, 100.,
+                                  timeModule=self._time)
+
+
+    def testSendsConvertedPointsOnTime(self):
+        streamer= self._streamer([0.003] * 10)
+        streamer.run()
+        self.assertTrue(np.allclose(self._trajectory / [2., 4.],
+                                    self._slow.setpoints))
+        self.assertTrue(np.allclose(np.arange(10) * 0.01,
+                                    streamer.sendTimes()))
+        stats= streamer.statistics()
+        self.assertEqual(10, stats.sentPoints)
+        self.assertEqual(0, stats.skippedPoints)
+        self.assertAlmostEqual(0, stats.maxJitterInSec)
+        self.assertTrue(np.allclose([9 / 2., -9 / 4.],
+                                    self._ctrl.getTargetPosition('A B')))
+
+
+    def testSkipsLateTicks(self):
+        streamer= self._streamer([0.003, 0.025] + [0.003] * 8)
+        streamer.run()
+        sendTimes= streamer.sendTimes()
+        self.assertTrue(np.all(np.isnan(sendTimes[2:3])))
+        self.assertAlmostEqual(0.035, sendTimes[3])
+        stats= streamer.statistics()
+        self.assertEqual(1, stats.overruns)
+        self.assertEqual(1, stats.skippedPoints)
+        self.assertEqual(9, stats.sentPoints)
+        self.assertAlmostEqual(0.005, stats.maxJitterInSec)
+
+
+    def testDoesNotDrift(self):
+        streamer= self._streamer([0.0099] * 10)
+        streamer.run()
+        self.assertTrue(np.allclose(np.arange(10) * 0.01,
+                                    streamer.sendTimes()))
+
+
+    def testAppend(self):
+        streamer= self._streamer([0.001] * 20)
+        streamer.append(self._trajectory)
+        streamer.run()
+        self.assertEqual(20, streamer.statistics().sentPoints)
+
+
+    def testAppendInSmallBlocksWhilePlaying(self):
+        streamer= self._streamer([0.001] * 1000)
+        for i in range(10, 1000):
+            streamer.append([[i, -i]])
+            if i % 7 == 0:
+                self.assertTrue(streamer.step())
+        self.assertEqual(1000, streamer.numberOfPoints())
+        self.assertEqual(1000, len(streamer.sendTimes()))
+        streamer.run()
+        want= np.vstack((np.arange(1000.), -np.arange(1000.))).T
+        self.assertTrue(np.allclose(want / [2., 4.], self._slow.setpoints))
+        self.assertEqual(1000, streamer.statistics().sentPoints)
+
+
+    def testAppendAfterTheQueueRanEmptyIsNotLate(self):
+        streamer= self._streamer([0.001] * 20)
+        streamer.run()
+        self._time.now+= 1.
+        streamer.append(self._trajectory)
+        streamer.run()
+        stats= streamer.statistics()
+        self.assertEqual(20, stats.sentPoints)
+        self.assertEqual(0, stats.skippedPoints)
+        self.assertAlmostEqual(0, stats.maxJitterInSec)
+        self.assertTrue(np.allclose(1.091 + np.arange(10) * 0.01,
+                                    streamer.sendTimes()[10:]))
+
+
+    def testThreadWaitsForAppendedPoints(self):
+        streamer= TrajectoryStreamer(self._tt, self._trajectory[:2], 100.)
+        streamer.start()
+        streamer.append(self._trajectory[2:])
+        streamer.finish()
+        streamer.join(2)
+        self.assertEqual(None, streamer.exception())
+        self.assertTrue(streamer.isDone())
+        self.assertTrue(np.allclose(self._trajectory[-1] / [2., 4.],
+                                    self._ctrl.getTargetPosition('A B')))
+        self.assertRaises(AssertionError, streamer.append, self._trajectory)
+
+
+    def testThreadIsStoppedWhileWaiting(self):
+        streamer= TrajectoryStreamer(self._tt, self._trajectory, 100.)
+        streamer.start()
+        thread= streamer._thread
+        t0= time.time()
+        while not streamer.isDone() and time.time() - t0 < 2:
+            time.sleep(0.001)
+        streamer.stop(2)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(streamer.isDone())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import unittest
+import numpy as np
+from pi_gcs.wave_table_manager import WaveTableManager, \
+    NoSpareWaveTableError
+
+__version__ = "$Id:$"
+
+
+class WaveTableManagerTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self._manager= WaveTableManager([1, 2, 3])
+        self._uploads= []
+
+
+    def _load(self, key, length=10, excluded=()):
+        return self._manager.load(key, length, self._uploads.append,
+                                  excluded)
+
+
+    def testContentKey(self):
+        key= WaveTableManager.contentKey('PNT', np.arange(3.))
+        self.assertEqual(key,
+                         WaveTableManager.contentKey('PNT', np.arange(3.)))
+        self.assertNotEqual(key,
+                            WaveTableManager.contentKey('PNT', np.arange(4.)))
+        self.assertNotEqual(key,
+                            WaveTableManager.contentKey('SIN', np.arange(3.)))
+
+
+    def testResidentWaveformIsNotUploadedAgain(self):
+        self.assertEqual(1, self._load('a'))
+        self.assertEqual(2, self._load('b'))
+        self.assertEqual(1, self._load('a'))
+        self.assertEqual([1, 2], self._uploads)
+        self.assertEqual(1, self._manager.numberOfHits())
+        self.assertEqual(2, self._manager.numberOfUploads())
+
+
+    def testEvictsLeastRecentlyUsed(self):
+        self._load('a')
+        self._load('b')
+        self._load('c')
+        self._load('a')
+        self.assertEqual(2, self._load('d'))
+        self.assertEqual(None, self._manager.tableOf('b'))
+        self.assertEqual(1, self._manager.numberOfEvictions())
+
+
+    def testPinnedAndExcludedTablesAreNotEvicted(self):
+        self._load('a')
+        self._load('b')
+        self._load('c')
+        self._manager.pin([1])
+        self.assertEqual(3, self._load('d', excluded=(2,)))
+        self._manager.pin([2, 3])
+        self.assertRaises(NoSpareWaveTableError, self._load, 'e')
+        self._manager.unpin()
+        self.assertEqual(1, self._load('e'))
+
+
+    def testTotalPoints(self):
+        manager= WaveTableManager([1, 2, 3], totalPoints=100)
+        manager.load('a', 60, self._uploads.append)
+        manager.load('b', 30, self._uploads.append)
+        self.assertEqual(1, manager.load('c', 50, self._uploads.append))
+        self.assertEqual(80, manager.usedPoints())
+        self.assertEqual(None, manager.tableOf('a'))
+
+
+    def testEvictedTablesNotReusedAreCleared(self):
+        cleared= []
+        manager= WaveTableManager([1, 2, 3], totalPoints=100,
+                                  clear=cleared.extend)
+        manager.load('a', 50, self._uploads.append)
+        manager.load('b', 50, self._uploads.append)
+        self.assertEqual(1, manager.load('c', 100, self._uploads.append))
+        self.assertEqual([2], cleared)
+        self.assertEqual(100, manager.usedPoints())
+
+
+    def testInvalidate(self):
+        self._load('a')
+        self._manager.invalidate()
+        self._load('a')
+        self.assertEqual([1, 1], self._uploads)
+
+
+if __name__ == "__main__":
+    unittest.main()